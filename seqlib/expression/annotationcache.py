@@ -0,0 +1,352 @@
+"""
+prebuilt, versioned annotation cache for get_cvg_objs_by_contig
+
+building CoverageData objects from a gtf_to_genes index costs a minute or
+more per job, so the per-transcript exon / CDS / UTR intervals, strand, IDs
+and RNA-coordinate maps are stored columnar in an h5 file once and
+reloaded by every tool. Each interval feature is stored flat with an idx
+array (one entry per interval) pointing back at its transcript, the same
+layout as h5FullGeneCvg.
+
+build once:
+    python annotationcache.py --fn_gtf_index ... --gtf_ID ... \\
+            --meta_type transcript --fn_out annot.transcript.h5
+"""
+
+import tables
+import numpy as np
+import argparse
+import logging
+import sys
+import os
+from coveragedata import *
+from gtf_to_genes import *
+
+ANNOTATION_CACHE_VERSION = 1
+
+INTERVAL_FEATURES = ["exons", "coding_exons", "UTR_5p_exons", "UTR_3p_exons"]
+RNACOORD_FEATURES = ["coding_exons", "UTR_5p_exons", "UTR_3p_exons"]
+
+
+class CachedGene(object):
+    """
+    minimal stand in for a gtf_to_genes gene, only the fields read by
+    CoverageData and the tools using it
+    """
+
+    def __init__(self, gene_id, names, contig, strand, beg, end):
+        self.gene_id = gene_id
+        self.names = names
+        self.contig = contig
+        self.strand = strand
+        self.beg = beg
+        self.end = end
+        self.transcripts = []
+
+
+class h5AnnotationCache_writer(object):
+
+    def __init__(self, fn, gtf_ID, meta_type):
+        self.h5 = tables.openFile(fn, mode='w')
+        self.fn = fn
+
+        filt = tables.Filters(complevel=5, complib='blosc')
+        self.filt = filt
+
+        attrs = self.h5.root._v_attrs
+        attrs.version = ANNOTATION_CACHE_VERSION
+        attrs.gtf_ID = gtf_ID
+        attrs.meta_type = meta_type
+
+        """
+        one entry per transcript (or meta transcript), the string columns
+        are created at close, sized to their longest value
+        """
+        self.a_strand = self.h5.createEArray(self.h5.root,
+                                             'strand',
+                                             tables.Int8Atom(),
+                                             shape=(0,),
+                                             filters=filt,
+                                             expectedrows=200000)
+
+        self.a_gene_start = self.h5.createEArray(self.h5.root,
+                                                 'gene_start',
+                                                 tables.UInt32Atom(),
+                                                 shape=(0,),
+                                                 filters=filt,
+                                                 expectedrows=200000)
+
+        self.a_gene_end = self.h5.createEArray(self.h5.root,
+                                               'gene_end',
+                                               tables.UInt32Atom(),
+                                               shape=(0,),
+                                               filters=filt,
+                                               expectedrows=200000)
+        """
+        one entry per interval, idx is the transcript the interval belongs to
+        """
+        self.a_intervals = {}
+        for feature in INTERVAL_FEATURES:
+            for col in ["idx", "start", "end"]:
+                name = "%s_%s"%(feature, col)
+                self.a_intervals[name] = self.h5.createEArray(self.h5.root,
+                                                              name,
+                                                              tables.UInt32Atom(),
+                                                              shape=(0,),
+                                                              filters=filt,
+                                                              expectedrows=2000000)
+        for feature in RNACOORD_FEATURES:
+            for col in ["start", "end"]:
+                name = "RNAcoord_%s_%s"%(feature, col)
+                self.a_intervals[name] = self.h5.createEArray(self.h5.root,
+                                                              name,
+                                                              tables.UInt32Atom(),
+                                                              shape=(0,),
+                                                              filters=filt,
+                                                              expectedrows=2000000)
+
+        self.curr_idx = 0
+        self.strs = {name:[] for name in ["geneID", "transcriptID", "geneNames", "contig"]}
+        self.strands = []
+        self.gene_starts = []
+        self.gene_ends = []
+        self.intervals = {name:[] for name in self.a_intervals.keys()}
+
+    def add_intervals(self, name, intervals):
+        self.intervals["%s_start"%name].extend([e[0] for e in intervals])
+        self.intervals["%s_end"%name].extend([e[1] for e in intervals])
+
+    def extend(self, cvg_obj):
+
+        self.strs["geneID"].append(cvg_obj.gene_id)
+        self.strs["transcriptID"].append(cvg_obj.TID)
+        self.strs["geneNames"].append(";".join(cvg_obj.g.names))
+        self.strs["contig"].append(cvg_obj.contig)
+        self.strands.append(cvg_obj.strand and 1 or 0)
+        self.gene_starts.append(cvg_obj.g.beg)
+        self.gene_ends.append(cvg_obj.g.end)
+
+        for feature in INTERVAL_FEATURES:
+            intervals = getattr(cvg_obj, feature)
+            self.intervals["%s_idx"%feature].extend([self.curr_idx]*len(intervals))
+            self.add_intervals(feature, intervals)
+
+        for feature in RNACOORD_FEATURES:
+            self.add_intervals("RNAcoord_%s"%feature,
+                               getattr(cvg_obj, "RNAcoord_%s"%feature))
+
+        self.curr_idx+=1
+
+    def close(self):
+
+        for name, strs in self.strs.items():
+            max_len = max([len(s) for s in strs] + [1])
+            a = self.h5.createEArray(self.h5.root,
+                                     name,
+                                     tables.StringAtom(max_len),
+                                     shape=(0,),
+                                     filters=self.filt,
+                                     expectedrows=max(len(strs), 1))
+            if len(strs):
+                a.append(np.array(strs, dtype="S%d"%max_len))
+
+        self.a_strand.append(np.array(self.strands, dtype='int8'))
+        self.a_gene_start.append(np.array(self.gene_starts, dtype='uint32'))
+        self.a_gene_end.append(np.array(self.gene_ends, dtype='uint32'))
+
+        for name, a in self.a_intervals.items():
+            a.append(np.array(self.intervals[name], dtype='uint32'))
+
+        self.h5.close()
+
+
+class h5AnnotationCache(object):
+
+    def __init__(self, fn, **kwargs):
+        """
+        everything is read into memory up front and the file closed, the
+        per transcript intervals are slices of the flat arrays
+        """
+        gtf_ID = kwargs.get("gtf_ID", None)
+        meta_type = kwargs.get("meta_type", None)
+
+        sys.stderr.write("loading {fn}...".format(fn=fn))
+        h5 = tables.openFile(fn, mode='r')
+
+        attrs = h5.root._v_attrs
+        self.version = attrs.version
+        self.gtf_ID = attrs.gtf_ID
+        self.meta_type = attrs.meta_type
+
+        assert self.version == ANNOTATION_CACHE_VERSION, \
+            "annotation cache %s is version %s, expected %s"%(fn, self.version, ANNOTATION_CACHE_VERSION)
+        assert gtf_ID is None or gtf_ID == self.gtf_ID, \
+            "annotation cache %s was built for %s not %s"%(fn, self.gtf_ID, gtf_ID)
+        assert meta_type is None or meta_type == self.meta_type, \
+            "annotation cache %s was built for %s not %s"%(fn, self.meta_type, meta_type)
+
+        self.geneID = h5.root.geneID[:]
+        self.transcriptID = h5.root.transcriptID[:]
+        self.geneNames = h5.root.geneNames[:]
+        self.contig = h5.root.contig[:]
+        self.strand = h5.root.strand[:]
+        self.gene_start = h5.root.gene_start[:].astype('int64')
+        self.gene_end = h5.root.gene_end[:].astype('int64')
+        self.n = self.transcriptID.shape[0]
+
+        self.starts, self.ends, self.offsets = {}, {}, {}
+        for feature in INTERVAL_FEATURES:
+            idx = h5.getNode("/%s_idx"%feature)[:]
+            self.starts[feature] = h5.getNode("/%s_start"%feature)[:].astype('int64')
+            self.ends[feature] = h5.getNode("/%s_end"%feature)[:].astype('int64')
+            self.offsets[feature] = np.r_[0, np.cumsum(np.bincount(idx, minlength=self.n))]
+
+        for feature in RNACOORD_FEATURES:
+            name = "RNAcoord_%s"%feature
+            self.starts[name] = h5.getNode("/%s_start"%name)[:].astype('int64')
+            self.ends[name] = h5.getNode("/%s_end"%name)[:].astype('int64')
+            self.offsets[name] = self.offsets[feature]
+
+        h5.close()
+
+        self.genes = {}
+        sys.stderr.write("done\n")
+
+    def get_intervals(self, name, i):
+        s, e = self.offsets[name][i], self.offsets[name][i+1]
+        return list(zip(self.starts[name][s:e].tolist(),
+                        self.ends[name][s:e].tolist()))
+
+    def get_gene(self, i):
+        gene_id = self.geneID[i]
+        if not gene_id in self.genes:
+            self.genes[gene_id] = CachedGene(gene_id,
+                                             self.geneNames[i].split(";"),
+                                             self.contig[i],
+                                             self.strand[i] == 1,
+                                             int(self.gene_start[i]),
+                                             int(self.gene_end[i]))
+        return self.genes[gene_id]
+
+    def get_cvg_obj(self, i):
+        g = self.get_gene(i)
+        kwargs = {name:self.get_intervals(name, i) for name in self.starts.keys()}
+        TID = self.transcriptID[i]
+        return CoverageData(g,
+                            meta_type="cached",
+                            transcript_id = TID != "meta" and TID or None,
+                            **kwargs)
+
+    def get_cvg_objs_by_contig(self, **kwargs):
+        """
+        same filters and output as coveragedata.get_cvg_objs_by_contig
+        """
+        contig_subset = kwargs.get("contig_subset", None)
+        indiv_gene = kwargs.get("indiv_gene", None)
+        min_CDS = kwargs.get("min_CDS",0)
+        min_3p_UTR = kwargs.get("min_3p_UTR",0)
+        min_5p_UTR = kwargs.get("min_5p_UTR",0)
+
+        cvg_objs_by_contig = {}
+        for i in range(self.n):
+            contig = self.contig[i]
+            if (contig_subset is not None) and (contig not in contig_subset):
+                continue
+
+            if indiv_gene and not indiv_gene in self.geneNames[i].split(";"):
+                continue
+
+            if not contig in cvg_objs_by_contig:
+                cvg_objs_by_contig[contig] = []
+
+            cvg_obj = self.get_cvg_obj(i)
+            if cvg_obj.pass_size_cutoff(min_CDS, min_3p_UTR, min_5p_UTR):
+                cvg_objs_by_contig[contig].append(cvg_obj)
+
+        for contig in cvg_objs_by_contig.keys():
+            cvg_objs_by_contig[contig] = sorted(cvg_objs_by_contig[contig], key = lambda x: x.g.beg)
+
+        return cvg_objs_by_contig
+
+
+def write_annotation_cache(fn, cvg_objs_by_contig, gtf_ID, meta_type):
+    """
+    written to a temporary file and moved into place so concurrent jobs
+    never read a partial cache. An existing cache for another gtf_ID or
+    meta_type is not overwritten
+    """
+    is_current_annotation_cache(fn, gtf_ID, meta_type)
+    fn_tmp = "%s.%d.tmp"%(fn, os.getpid())
+    writer = h5AnnotationCache_writer(fn_tmp, gtf_ID, meta_type)
+    for contig in sorted(cvg_objs_by_contig.keys()):
+        for cvg_obj in cvg_objs_by_contig[contig]:
+            writer.extend(cvg_obj)
+    writer.close()
+    os.rename(fn_tmp, fn)
+
+def is_current_annotation_cache(fn, gtf_ID, meta_type):
+    """
+    whether fn holds a cache of the current version. A cache built for
+    another gtf_ID or meta_type is never treated as stale and rebuilt over,
+    it is an error
+    """
+    if fn is None or not os.path.exists(fn):
+        return False
+    h5 = tables.openFile(fn, mode='r')
+    attrs = h5.root._v_attrs
+    names = attrs._v_attrnames
+    built_for = ("gtf_ID" in names and "meta_type" in names) and tuple([attrs.gtf_ID, attrs.meta_type]) or None
+    current = "version" in names and attrs.version == ANNOTATION_CACHE_VERSION
+    h5.close()
+
+    assert built_for is None or built_for == tuple([gtf_ID, meta_type]), \
+        "annotation cache %s was built for %s %s not %s %s"%(fn, built_for[0], built_for[1], gtf_ID, meta_type)
+    return current
+
+def get_cached_cvg_objs_by_contig(fn_cache, fn_gtf_index, gtf_ID, meta_type, logger, **kwargs):
+    """
+    drop in for get_indexed_genes_for_identifier + get_cvg_objs_by_contig
+    if fn_cache holds a current cache it is loaded, otherwise the models
+    are built from the gtf index and, when fn_cache is given, written out
+    for the next job. kwargs are the get_cvg_objs_by_contig filters
+    """
+
+    if is_current_annotation_cache(fn_cache, gtf_ID, meta_type):
+        cache = h5AnnotationCache(fn_cache, gtf_ID=gtf_ID, meta_type=meta_type)
+        return cache.get_cvg_objs_by_contig(**kwargs)
+
+    species_id, gtf_path, genes = get_indexed_genes_for_identifier(fn_gtf_index,
+                                                                   logger,
+                                                                   gtf_ID)
+    if fn_cache is None:
+        return get_cvg_objs_by_contig(genes, meta_type, **kwargs)
+
+    sys.stderr.write("writing annotation cache {fn}...".format(fn=fn_cache))
+    write_annotation_cache(fn_cache,
+                           get_cvg_objs_by_contig(genes, meta_type),
+                           gtf_ID,
+                           meta_type)
+    sys.stderr.write("done\n")
+
+    cache = h5AnnotationCache(fn_cache, gtf_ID=gtf_ID, meta_type=meta_type)
+    return cache.get_cvg_objs_by_contig(**kwargs)
+
+
+if __name__=="__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fn_gtf_index", required=True)
+    parser.add_argument("--gtf_ID", required=True)
+    parser.add_argument("--meta_type", required=True,
+                                       choices=["transcript",
+                                                "constitutive_single_stop"])
+    parser.add_argument("--fn_out", required=True)
+    parser.add_argument("--fn_logfile", default="/dev/null")
+    args = parser.parse_args()
+
+    logger = logging.getLogger(args.fn_logfile)
+    species_id, gtf_path, genes = get_indexed_genes_for_identifier(args.fn_gtf_index,
+                                                                   logger,
+                                                                   args.gtf_ID)
+    cvg_objs_by_contig = get_cvg_objs_by_contig(genes, args.meta_type)
+    write_annotation_cache(args.fn_out, cvg_objs_by_contig, args.gtf_ID, args.meta_type)
@@ -67,6 +67,7 @@ def get_cvg_objs_by_contig(gtf_genes, meta_type, **kwargs):
     min_5p_UTR = kwargs.get("min_5p_UTR",0)
     
     cvg_objs_by_contig = {}
+    constitutive_genes_by_contig = {}
     for g in gtf_genes['protein_coding']:
         contig = tr_contig(g.contig)
 
@@ -87,7 +88,8 @@ def get_cvg_objs_by_contig(gtf_genes, meta_type, **kwargs):
                 if t.transcript_type_names[t.transcript_type] != "protein_coding":
                     continue
                 cvg_obj = CoverageData(g, meta_type = "transcript", 
-                                       transcript_id = t.cdna_id)
+                                       transcript_id = t.cdna_id,
+                                       transcript = t)
                 if cvg_obj.pass_size_cutoff(min_CDS, min_3p_UTR, min_5p_UTR):
                     cvg_objs_by_contig[contig].append(cvg_obj)
 
@@ -95,12 +97,23 @@ def get_cvg_objs_by_contig(gtf_genes, meta_type, **kwargs):
             stops = get_stops(g)
             #ensure gene has 1 stop codon 
             if len(stops)>0 and np.all(np.array(stops)==stops[0]):
-                cvg_obj = CoverageData(g, meta_type="constitutive_single_stop")
-                
-                if cvg_obj.pass_size_cutoff(min_CDS, min_3p_UTR, min_5p_UTR):
-                    cvg_objs_by_contig[contig].append(cvg_obj)
+                if not contig in constitutive_genes_by_contig:
+                    constitutive_genes_by_contig[contig] = []
+                constitutive_genes_by_contig[contig].append(g)
         else:
             assert True, "type not defined"
+    
+    """
+    constitutive models for all the genes on a contig in one sweep
+    """
+    for contig, genes in constitutive_genes_by_contig.items():
+        c_exons_by_gene = get_constitutive_exons_by_gene(genes)
+        for i, g in enumerate(genes):
+            cvg_obj = CoverageData(g, meta_type="constitutive_single_stop", 
+                                   constitutive_exons = c_exons_by_gene[i])
+            
+            if cvg_obj.pass_size_cutoff(min_CDS, min_3p_UTR, min_5p_UTR):
+                cvg_objs_by_contig[contig].append(cvg_obj)
 
     for contig in cvg_objs_by_contig.keys():
         cvg_objs_by_contig[contig] = sorted(cvg_objs_by_contig[contig], key = lambda x: x.g.beg) 
@@ -108,6 +121,45 @@ def get_cvg_objs_by_contig(gtf_genes, meta_type, **kwargs):
     return cvg_objs_by_contig
 
 
+def get_constitutive_segments(idx, starts, ends, n_by_idx):
+    """
+    vectorized sweep-line over the intervals of many groups (e.g. the 
+    transcripts of each gene) at once. Interval i belongs to group idx[i] 
+    and n_by_idx[g] is the number of members of group g. Starts count +1, 
+    ends -1 (ends first at ties, intervals are half open), the running sum
+    is taken over events sorted by group then coordinate and segments are
+    where it reaches n for the group. Returns the (idx, start, end) arrays 
+    of those segments sorted by group then start
+    """
+    idx = np.asarray(idx, dtype='int64')
+    starts = np.asarray(starts, dtype='int64')
+    ends = np.asarray(ends, dtype='int64')
+    n_by_idx = np.asarray(n_by_idx, dtype='int64')
+    
+    coords = np.r_[starts, ends]
+    deltas = np.r_[np.ones(starts.shape[0], dtype='int64'), 
+                   -np.ones(ends.shape[0], dtype='int64')]
+    idxs = np.r_[idx, idx]
+    
+    order = np.lexsort((deltas, coords, idxs))
+    coords, deltas, idxs = coords[order], deltas[order], idxs[order]
+    
+    counts = np.cumsum(deltas)
+    w = np.where((deltas==1) & (counts==n_by_idx[idxs]))[0]
+    seg_idx, seg_starts, seg_ends = idxs[w], coords[w], coords[w+1]
+    
+    keep = seg_ends>seg_starts
+    return seg_idx[keep], seg_starts[keep], seg_ends[keep]
+
+def split_segments(seg_idx, seg_starts, seg_ends, n_groups):
+    """
+    list (one per group) of sorted (start, end) tuples
+    """
+    bounds = np.searchsorted(seg_idx, np.arange(n_groups+1))
+    seg_starts, seg_ends = seg_starts.tolist(), seg_ends.tolist()
+    return [list(zip(seg_starts[bounds[i]:bounds[i+1]], seg_ends[bounds[i]:bounds[i+1]])) 
+                for i in range(n_groups)]
+
 def get_constitutive_part(exon_lists):
     
     n = len(exon_lists)
@@ -116,51 +168,49 @@ def get_constitutive_part(exon_lists):
         return exon_lists[0]
     ###### 
     
-    events_by_coord = [] 
+    idx, starts, ends = [], [], []
     for enum, e_list in enumerate(exon_lists):
         for e in e_list:
-            event = {"start":e[0], 
-                     "end":e[1], 
-                     "enum":enum}
-            
-            events_by_coord.append({"coord":e[0],
-                                    "event":event,
-                                    "type":"start"})
-            events_by_coord.append({"coord":e[1],
-                                    "event":event,
-                                    "type":"end"})
-
-    events_by_coord = sorted(events_by_coord, key=lambda x: x["coord"])
-    
-    curr_count = 0
-    c_exons = []
-
-    for event in events_by_coord:
-        if event['type'] == "start":
-            if curr_count == n-1:
-                c_exons.append([event['coord'],-1])
-            curr_count += 1 
-        if event['type'] == "end":
-            if curr_count == n:
-                c_exons[-1][1] = event['coord']
-            curr_count -=1 
-    
-    return c_exons
+            idx.append(0)
+            starts.append(e[0])
+            ends.append(e[1])
+    
+    seg_idx, seg_starts, seg_ends = get_constitutive_segments(idx, starts, ends, [n])
+    return split_segments(seg_idx, seg_starts, seg_ends, 1)[0]
 
 def get_constitutive_exons(g):
+    
+    return get_constitutive_exons_by_gene([g])[0]
 
-    coding_ts = [t for t in g.transcripts if 
-                    t.transcript_type_names[t.transcript_type] == "protein_coding"]
+def get_constitutive_exons_by_gene(genes):
+    """
+    constitutive exons and coding exons across the protein coding 
+    transcripts of each gene, for all genes in one vectorized sweep
+    returns a list of (c_exons, c_coding_exons) in the order of genes
+    """
+    n_by_gene = []
+    exons = {"exons":([],[],[]), "coding_exons":([],[],[])}
     
-    exons, coding_exons = [], [] 
-    for t in coding_ts:
-        exons.append(t.get_exons())
-        coding_exons.append(t.get_coding_exons())
+    for i, g in enumerate(genes):
+        coding_ts = [t for t in g.transcripts if 
+                        t.transcript_type_names[t.transcript_type] == "protein_coding"]
+        n_by_gene.append(len(coding_ts))
+        
+        for t in coding_ts:
+            for typ, t_exons in [("exons", t.get_exons()), 
+                                 ("coding_exons", t.get_coding_exons())]:
+                idx, starts, ends = exons[typ]
+                for e in t_exons:
+                    idx.append(i)
+                    starts.append(e[0])
+                    ends.append(e[1])
     
-    c_exons = get_constitutive_part(exons)
-    c_coding_exons = get_constitutive_part(coding_exons)
-
-    return sorted(c_exons), sorted(c_coding_exons)
+    c_exons_by_typ = {}
+    for typ, (idx, starts, ends) in exons.items():
+        seg_idx, seg_starts, seg_ends = get_constitutive_segments(idx, starts, ends, n_by_gene)
+        c_exons_by_typ[typ] = split_segments(seg_idx, seg_starts, seg_ends, len(genes))
+    
+    return list(zip(c_exons_by_typ["exons"], c_exons_by_typ["coding_exons"]))
 
 def get_stops(g):
     
@@ -171,6 +221,14 @@ def get_stops(g):
     
     return stops
 
+def get_exon_positions(exons):
+    """
+    all genomic positions covered by the exons, in exon order
+    """
+    if len(exons) == 0:
+        return np.zeros(0, dtype='int64')
+    return np.concatenate([np.arange(e[0],e[1]) for e in exons])
+
 def get_introns(exons):
     #assume the exons are ordered by genomic position
     introns = []
@@ -179,6 +237,52 @@ def get_introns(exons):
         introns.append(tuple([exons[i][1],exons[i+1][0]]))
     return introns
 
+class TranscriptCoordMapper(object):
+    """
+    vectorized transcript <-> genome coordinate mapping backed by the 
+    cumulative exon lengths. All positions are 0-based, transcript positions 
+    run 5'->3' so on the - strand transcript position 0 is the last base of 
+    the last exon. Positions that fall outside the exons (or the transcript) 
+    map to -1
+    """
+
+    def __init__(self, exons, strand):
+        exons = np.array(sorted(exons), dtype='int64').reshape(-1,2)
+        self.strand = strand
+        self.starts = exons[:,0]
+        self.ends = exons[:,1]
+        self.cum_lens = np.r_[0, np.cumsum(self.ends-self.starts)]
+        self.length = self.cum_lens[-1]
+    
+    def genome_to_transcript(self, g_pos):
+        g_pos = np.asarray(g_pos, dtype='int64')
+        if self.starts.shape[0] == 0:
+            return np.zeros(g_pos.shape, dtype='int64')-1
+
+        i = np.maximum(np.searchsorted(self.starts, g_pos, side='right')-1, 0)
+        in_exon = (g_pos>=self.starts[i]) & (g_pos<self.ends[i])
+        t_pos = self.cum_lens[i] + g_pos - self.starts[i]
+        if not self.strand:
+            t_pos = self.length - 1 - t_pos
+        
+        return np.where(in_exon, t_pos, -1)
+    
+    def transcript_to_genome(self, t_pos):
+        t_pos = np.asarray(t_pos, dtype='int64')
+        if self.starts.shape[0] == 0:
+            return np.zeros(t_pos.shape, dtype='int64')-1
+
+        in_transcript = (t_pos>=0) & (t_pos<self.length)
+        if not self.strand:
+            t_pos = self.length - 1 - t_pos
+        
+        i = np.clip(np.searchsorted(self.cum_lens, t_pos, side='right')-1, 
+                    0, 
+                    self.starts.shape[0]-1)
+        g_pos = self.starts[i] + t_pos - self.cum_lens[i]
+        return np.where(in_transcript, g_pos, -1)
+
+
 class CoverageData():
 
     def __init__(self, g, **kwargs):
@@ -191,7 +295,8 @@ class CoverageData():
             self.gene_id = g.gene_id
             self.TID = transcript_id
             typ = "TID"
-            meta_type="transcript"
+            if meta_type != "cached":
+                meta_type="transcript"
         else:
             self.gene_id = g.gene_id
             self.TID = "meta"
@@ -204,7 +309,10 @@ class CoverageData():
             assert np.all(np.array(stops) == stops[0]), "differing STOPS!"
             
             self.contig = "chr" in g.contig and g.contig or "chr%s"%g.contig
-            self.exons, self.coding_exons = get_constitutive_exons(g)
+            c_exons = kwargs.get("constitutive_exons", None)
+            if c_exons is None:
+                c_exons = get_constitutive_exons(g)
+            self.exons, self.coding_exons = c_exons
 
         elif meta_type == "virtual_gene":
             """
@@ -217,27 +325,53 @@ class CoverageData():
             self.exons, self.coding_exons, self.contig = longest_coding_t(g)
         elif meta_type == "transcript":
             self.TID = transcript_id 
-            transcript = filter(lambda x: x.cdna_id == transcript_id, g.transcripts)[0]
+            transcript = kwargs.get("transcript", None)
+            if transcript is None:
+                transcript = filter(lambda x: x.cdna_id == transcript_id, g.transcripts)[0]
             self.contig = "chr" in g.contig and g.contig or "chr%s"%g.contig
             self.exons = sorted(transcript.get_exons())
             self.coding_exons = sorted(transcript.get_coding_exons())
+        elif meta_type == "cached":
+            """
+            prebuilt model loaded from an annotation cache, exons and 
+            coding exons are already sorted (see annotationcache.py)
+            """
+            self.contig = g.contig
+            self.exons = kwargs.get("exons")
+            self.coding_exons = kwargs.get("coding_exons")
         else:
             assert True, "method %s not supported"%(typ)
         
-        l_UTR_exons, r_UTR_exons = get_l_r_UTR_exons(self.exons, self.coding_exons)
-
-        if g.strand:
-            self.UTR_5p_exons = sorted(l_UTR_exons)
-            self.UTR_3p_exons = sorted(r_UTR_exons)
+        if meta_type == "cached":
+            self.UTR_5p_exons = kwargs.get("UTR_5p_exons")
+            self.UTR_3p_exons = kwargs.get("UTR_3p_exons")
         else:
-            self.UTR_5p_exons = sorted(r_UTR_exons)
-            self.UTR_3p_exons = sorted(l_UTR_exons)
+            l_UTR_exons, r_UTR_exons = get_l_r_UTR_exons(self.exons, self.coding_exons)
+
+            if g.strand:
+                self.UTR_5p_exons = sorted(l_UTR_exons)
+                self.UTR_3p_exons = sorted(r_UTR_exons)
+            else:
+                self.UTR_5p_exons = sorted(r_UTR_exons)
+                self.UTR_3p_exons = sorted(l_UTR_exons)
         
         self.CDS_l = np.sum(np.array([ex[1]-ex[0] for ex in self.coding_exons]))
         self.UTR_5p_l = np.sum(np.array([ex[1]-ex[0] for ex in self.UTR_5p_exons]))
         self.UTR_3p_l = np.sum(np.array([ex[1]-ex[0] for ex in self.UTR_3p_exons]))
         
         #RNA - space
+        if meta_type == "cached":
+            self.RNAcoord_UTR_5p_exons = kwargs.get("RNAcoord_UTR_5p_exons")
+            self.RNAcoord_UTR_3p_exons = kwargs.get("RNAcoord_UTR_3p_exons")
+            self.RNAcoord_coding_exons = kwargs.get("RNAcoord_coding_exons")
+        else:
+            self.init_RNAcoords()
+        
+        self.UTR_5p_cvg = None
+        self.UTR_3p_cvg = None
+        self.CDS_cvg = None
+    
+    def init_RNAcoords(self):
         self.RNAcoord_UTR_5p_exons = []
         self.RNAcoord_UTR_3p_exons = []
         self.RNAcoord_coding_exons = []
@@ -255,25 +389,24 @@ class CoverageData():
             elen = e[1]-e[0]
             last_e = i>0 and self.RNAcoord_coding_exons[-1][1] or 0
             self.RNAcoord_coding_exons.append((last_e, last_e+elen))
-        
-        self.UTR_5p_cvg = None
-        self.UTR_3p_cvg = None
-        self.CDS_cvg = None
     
+    def get_coord_mapper(self):
+        """
+        TranscriptCoordMapper over the UTR and coding exons, built once
+        """
+        if getattr(self, "coord_mapper", None) is None:
+            self.coord_mapper = TranscriptCoordMapper(self.UTR_5p_exons + 
+                                                      self.coding_exons + 
+                                                      self.UTR_3p_exons, 
+                                                      self.strand)
+        return self.coord_mapper
+
     def get_transcript_to_genome_coords(self):
         """
-        a list of positions genomic positions corresponding to the transcript
+        an array of the genomic positions corresponding to the transcript
         """
-        UTR_5p_poses = list(itertools.chain(*[range(e[0],e[1]) for e in self.UTR_5p_exons]))
-        UTR_3p_poses = list(itertools.chain(*[range(e[0],e[1]) for e in self.UTR_3p_exons]))
-        cds_exon_poses = list(itertools.chain(*[range(e[0],e[1]) for e in self.coding_exons]))
-        
-        genome_positions = sorted(UTR_5p_poses+cds_exon_poses+UTR_3p_poses)
-        if not self.strand:
-            genome_positions = genome_positions[::-1]
-        #genome_to_transcript = {pos:i for i,pos in enumerate(genome_positions)}
-        
-        return genome_positions
+        mapper = self.get_coord_mapper()
+        return mapper.transcript_to_genome(np.arange(mapper.length))
 
     def pass_size_cutoff(self, min_CDS, min_3p, min_5p): 
         if self.CDS_l >= min_CDS and \
@@ -371,9 +504,32 @@ class CoverageData():
         
 
     def get_cvg(self, cvg_recarray, bamfile):
-        self.UTR_5p_cvg = self.get_cvg_over_loci(cvg_recarray, bamfile, self.UTR_5p_exons)
-        self.UTR_3p_cvg = self.get_cvg_over_loci(cvg_recarray, bamfile, self.UTR_3p_exons)
-        self.CDS_cvg = self.get_cvg_over_loci(cvg_recarray, bamfile, self.coding_exons)
+        self.set_feature_cvgs(self.get_cvg_over_loci(cvg_recarray, bamfile, self.UTR_5p_exons),
+                              self.get_cvg_over_loci(cvg_recarray, bamfile, self.coding_exons),
+                              self.get_cvg_over_loci(cvg_recarray, bamfile, self.UTR_3p_exons))
+    
+    def get_cvg_loci(self):
+        """
+        (contig, start, end) of the 5' UTR, CDS and 3' UTR exons, in the 
+        order set_cvg expects coverage over them
+        """
+        return [(self.contig, e[0], e[1]) for e in 
+                    sorted(self.UTR_5p_exons)+sorted(self.coding_exons)+sorted(self.UTR_3p_exons)]
+    
+    def set_cvg(self, cvg):
+        """
+        set coverage from a single vector over get_cvg_loci, e.g. one 
+        sample's row of coveragematrix.get_cvg_matrix
+        """
+        l_5p, l_CDS = int(self.UTR_5p_l), int(self.CDS_l)
+        self.set_feature_cvgs(cvg[:l_5p], 
+                              cvg[l_5p:l_5p+l_CDS], 
+                              cvg[l_5p+l_CDS:])
+
+    def set_feature_cvgs(self, UTR_5p_cvg, CDS_cvg, UTR_3p_cvg):
+        self.UTR_5p_cvg = UTR_5p_cvg
+        self.UTR_3p_cvg = UTR_3p_cvg
+        self.CDS_cvg = CDS_cvg
         
         self.UTR_5p_mu, self.UTR_5p_median  = self.get_mean_median(self.UTR_5p_cvg)
         self.UTR_3p_mu, self.UTR_3p_median  =  self.get_mean_median(self.UTR_3p_cvg)
@@ -400,7 +556,6 @@ class CoverageData():
         """
         Returning the mean
         """
-        exit(1)
         return scp_stats.binned_statistic(np.arange(vect.shape[0]),
                                           vect, 
                                           bins = n_bins)[0]
@@ -465,126 +620,75 @@ class CoverageData():
     
 
 
-    def get_bp_cvg_dicts(self, keep_zeros=False):
-            
-        dicts = []
-        
-        UTR_5p_poses = list(itertools.chain(*[range(e[0],e[1]) for e in self.UTR_5p_exons]))
-        UTR_3p_poses = list(itertools.chain(*[range(e[0],e[1]) for e in self.UTR_3p_exons]))
-        cds_exon_poses = list(itertools.chain(*[range(e[0],e[1]) for e in self.coding_exons]))
-        
-        genome_positions = sorted(UTR_5p_poses+cds_exon_poses+UTR_3p_poses)
-        if not self.strand:
-            genome_positions = genome_positions[::-1]
-
-        genome_to_transcript = {pos:i for i,pos in enumerate(genome_positions)}
-
-        for i in xrange(self.UTR_5p_cvg.shape[0]):
-            if self.UTR_5p_cvg[i]!=0 or keep_zeros:
-                d = self.get_info_dict()
-                d.update({"type" : "5p_UTR",
-                           "pos" : UTR_5p_poses[i],
-                           "t_pos" : genome_to_transcript[UTR_5p_poses[i]],
-                           "cvg" : self.UTR_5p_cvg[i]})
-                dicts.append(d)
-
-        for i in xrange(self.UTR_3p_cvg.shape[0]):
-            if self.UTR_3p_cvg[i]!=0 or keep_zeros:
-                d = self.get_info_dict()
-                d.update({"type" : "3p_UTR",
-                           "pos" : UTR_3p_poses[i],
-                           "t_pos" : genome_to_transcript[UTR_3p_poses[i]],
-                           "cvg" : self.UTR_3p_cvg[i]})
-                dicts.append(d)
-
-        for i in xrange(self.CDS_cvg.shape[0]):
-            if self.CDS_cvg[i]!=0 or keep_zeros:
-                d = self.get_info_dict()
-                d.update({"type" : "CDS",
-                           "pos" : cds_exon_poses[i],
-                           "t_pos" : genome_to_transcript[cds_exon_poses[i]],
-                           "cvg" : self.CDS_cvg[i]})
-                dicts.append(d)
+    def add_info_columns(self, T, include_cvg=True):
+        """
+        broadcast the get_info_dict values across T as columns, 
+        columns already in T are kept
+        """
+        for k, v in self.get_info_dict(include_csv = include_cvg).items():
+            if not k in T.columns:
+                T[k] = v
+        return T
+
+    def get_bp_cvg_table(self, keep_zeros=False, include_edges=True):
+        """
+        one row per base with the get_info_dict values as broadcast columns
+        bases with no coverage are dropped (np.nonzero) unless keep_zeros
+        """
+        mapper = self.get_coord_mapper()
+        tables = []
+        for label, exons, cvg in [("5p_UTR", self.UTR_5p_exons, self.UTR_5p_cvg),
+                                  ("3p_UTR", self.UTR_3p_exons, self.UTR_3p_cvg),
+                                  ("CDS", self.coding_exons, self.CDS_cvg)]:
+            poses = get_exon_positions(exons)
+            if not keep_zeros:
+                w = np.nonzero(cvg)[0]
+                poses, cvg = poses[w], cvg[w]
+            tables.append(pd.DataFrame({"type" : label,
+                                        "pos" : poses,
+                                        "t_pos" : mapper.genome_to_transcript(poses),
+                                        "cvg" : cvg}))
         
         """
         PUT 0s on the edges of exons - NOTE: not showing the intron loci
         even though they could have cvg
         """
-        for e in self.UTR_5p_exons+self.UTR_3p_exons+self.coding_exons:
-            d1 = self.get_info_dict()
-            d2 = self.get_info_dict()
-            
-            d1.update({"type" : "edge",
-                       "pos" : e[0]-1,
-                       "cvg" : 0})
-
-            d2.update({"type" : "edge",
-                       "pos" : e[1]+1,
-                       "cvg" : 0})
-            dicts.append(d1)
-            dicts.append(d2)
-        return dicts
+        if include_edges:
+            exons = np.array(self.UTR_5p_exons+self.UTR_3p_exons+self.coding_exons, 
+                             dtype='int64').reshape(-1,2)
+            tables.append(pd.DataFrame({"type" : "edge",
+                                        "pos" : np.c_[exons[:,0]-1, exons[:,1]+1].ravel(),
+                                        "cvg" : 0}))
+        
+        T = pd.concat(tables, ignore_index=True)
+        return self.add_info_columns(T)
+
+    def get_bp_cvg_dicts(self, keep_zeros=False):
+        return self.get_bp_cvg_table(keep_zeros=keep_zeros).to_dict("records")
 
     def get_by_exon_info_dicts(self):
         return self.get_by_exon_dicts(include_cvg = False)
 
-    def get_by_exon_dicts(self, include_cvg=True):
-        return_dicts = []
-        for i, UTR_5p_e in enumerate(self.UTR_5p_exons):
-            d = self.get_info_dict(include_csv = include_cvg)
-            s,e  = UTR_5p_e
-            s_i, e_i = self.RNAcoord_UTR_5p_exons[i]
-            
-            d.update({"type": "5p_UTR",
-                      "exon":i,
-                      "exon_start":s,
-                      "exon_end":e})
-            
+    def get_by_exon_table(self, include_cvg=True):
+        tables = []
+        for label, exons, RNAcoords, cvg in [("5p_UTR", self.UTR_5p_exons, self.RNAcoord_UTR_5p_exons, self.UTR_5p_cvg),
+                                             ("CDS", self.coding_exons, self.RNAcoord_coding_exons, self.CDS_cvg),
+                                             ("3p_UTR", self.UTR_3p_exons, self.RNAcoord_UTR_3p_exons, self.UTR_3p_cvg)]:
+            exons = np.array(exons, dtype='int64').reshape(-1,2)
+            T = pd.DataFrame({"type" : label,
+                              "exon" : np.arange(exons.shape[0]),
+                              "exon_start" : exons[:,0],
+                              "exon_end" : exons[:,1]})
             if include_cvg:
-                mu =  np.mean(self.UTR_5p_cvg[s_i:e_i])
-                med = np.median(self.UTR_5p_cvg[s_i:e_i])
-                d.update({"mu_cvg": mu, 
-                          "median_cvg": med})
-
-            return_dicts.append(d)
-        
-        for i, CDS_e in enumerate(self.coding_exons):
-            d = self.get_info_dict(include_csv = include_cvg)
-            s,e  = CDS_e
-            s_i, e_i = self.RNAcoord_coding_exons[i]
-
-            d.update({"type": "CDS",
-                      "exon":i,
-                      "exon_start":s,
-                      "exon_end":e})
-            
-            if include_cvg:
-                mu =  np.mean(self.CDS_cvg[s_i:e_i])
-                med = np.median(self.CDS_cvg[s_i:e_i])
-                d.update({"mu_cvg": mu,
-                          "median_cvg": med})
+                T["mu_cvg"] = [np.mean(cvg[s_i:e_i]) for s_i, e_i in RNAcoords]
+                T["median_cvg"] = [np.median(cvg[s_i:e_i]) for s_i, e_i in RNAcoords]
+            tables.append(T)
 
-            return_dicts.append(d)
-        
-        for i, UTR_3p_e in enumerate(self.UTR_3p_exons):
-            d = self.get_info_dict(include_csv = include_cvg)
-            s,e  = UTR_3p_e
-            s_i, e_i = self.RNAcoord_UTR_3p_exons[i]
-            
-            d.update({"type": "3p_UTR",
-                      "exon":i,
-                      "exon_start":s,
-                      "exon_end":e})
+        T = pd.concat(tables, ignore_index=True)
+        return self.add_info_columns(T, include_cvg = include_cvg)
 
-            if include_cvg:
-                mu =  np.mean(self.UTR_3p_cvg[s_i:e_i])
-                med = np.median(self.UTR_3p_cvg[s_i:e_i])
-                d.update({"mu_cvg": mu,
-                          "median_cvg": med})
-
-            return_dicts.append(d)
-
-        return return_dicts
+    def get_by_exon_dicts(self, include_cvg=True):
+        return self.get_by_exon_table(include_cvg = include_cvg).to_dict("records")
 
     def get_summary_dicts(self):
         UTR_5p = self.get_info_dict()
@@ -605,37 +709,20 @@ class CoverageData():
         
         return [UTR_5p, CDS, UTR_3p]                                                    
     
-    def get_binned_cvg_dicts(self, n_bins):
+    def get_binned_cvg_table(self, n_bins):
         
         b_UTR_5p_cvg = self.get_binned_cvg(self.UTR_5p_cvg, n_bins)
         b_UTR_3p_cvg = self.get_binned_cvg(self.UTR_3p_cvg, n_bins)
         b_CDS_cvg = self.get_binned_cvg(self.CDS_cvg, n_bins)
         
-        dicts = []
-        
-        for bin in range(n_bins): 
-            UTR_5p = self.get_info_dict()
-            UTR_3p = self.get_info_dict()
-            CDS = self.get_info_dict()
-
-            UTR_5p.update({"type" : "5p_UTR",
-                           "bin" : bin, 
-                           "pos" : 0, 
-                           "cvg" : b_UTR_5p_cvg[bin]})
-
-            CDS.update({"type" : "CDS",
-                        "bin" : bin, 
-                        "pos" : 1, 
-                        "cvg" : b_CDS_cvg[bin]})
-
-            UTR_3p.update({"type" : "3p_UTR",
-                           "bin" : bin, 
-                           "pos" : 2, 
-                           "cvg" : b_UTR_3p_cvg[bin]})
+        T = pd.DataFrame({"type" : np.tile(["5p_UTR", "CDS", "3p_UTR"], n_bins),
+                          "bin" : np.repeat(np.arange(n_bins), 3),
+                          "pos" : np.tile([0, 1, 2], n_bins),
+                          "cvg" : np.c_[b_UTR_5p_cvg, b_CDS_cvg, b_UTR_3p_cvg].ravel()})
+        return self.add_info_columns(T)
 
-            dicts.extend([UTR_5p, CDS, UTR_3p])
-            
-        return dicts
+    def get_binned_cvg_dicts(self, n_bins):
+        return self.get_binned_cvg_table(n_bins).to_dict("records")
 
 
     def get_CDS_start_dicts(self, start_5p=50, start_3p=100):
@@ -662,24 +749,21 @@ class CoverageData():
                                 self.RNA_cvg_view.shape[0],
                                 "3p")
 
-    def get_bp_dict(self, start, end, center_coord, label):
-        
-        dicts =  []  
-        sum_cvg = np.sum(self.RNA_cvg_view[start:end])
+    def get_bp_table(self, start, end, center_coord, label):
         
         if start < 0 or end > self.RNA_cvg_view.shape[0]:
-            return []
-
-        for i in range(start,end):
-            bp_dict = self.get_info_dict()
-            bp_dict.update({"type" : label,
-                            "pos" : i-center_coord,
-                            "cvg" : self.RNA_cvg_view[i],
-                            "sum_cvg" : sum_cvg, 
-                            "strand" : self.strand })
-            dicts.append(bp_dict)
+            return pd.DataFrame()
         
-        return dicts
+        cvg = self.RNA_cvg_view[start:end]
+        T = pd.DataFrame({"type" : label,
+                          "pos" : np.arange(start, end)-center_coord,
+                          "cvg" : cvg,
+                          "sum_cvg" : np.sum(cvg),
+                          "strand" : self.strand})
+        return self.add_info_columns(T)
+
+    def get_bp_dict(self, start, end, center_coord, label):
+        return self.get_bp_table(start, end, center_coord, label).to_dict("records")
 
 
     def __get_CDS_stop_dicts(self, stop_3p=100, stop_5p=100):
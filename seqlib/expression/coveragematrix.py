@@ -0,0 +1,99 @@
+"""
+multi-sample coverage engine
+
+per base non-deletion coverage (what pysamstats.load_nondel_coverage
+reports as reads_all) over a set of loci for many BAMs, returned as a
+samples x positions matrix. Coverage is computed from the aligned blocks
+of each read so there is no max_depth cap, and each BAM is handled by its
+own worker process with its own AlignmentFile.
+"""
+
+import numpy as np
+import pysam
+
+from splicelib.contig_shards import run_shards
+
+#unmapped, secondary, qcfail, duplicate - the pysam pileup defaults
+EXCLUDE_FLAGS = 0x4 | 0x100 | 0x200 | 0x400
+
+
+def get_locus_cvg(bamfile, contig, start, end):
+    """
+    per base coverage over [start, end) from the read blocks (deletions
+    and introns are not blocks, so they are not counted)
+    """
+    starts, ends = [], []
+    for r in bamfile.fetch(contig, start, end):
+        if r.flag & EXCLUDE_FLAGS:
+            continue
+        for b_s, b_e in r.get_blocks():
+            starts.append(b_s)
+            ends.append(b_e)
+
+    l = end-start
+    starts = np.clip(np.array(starts, dtype='int64')-start, 0, l)
+    ends = np.clip(np.array(ends, dtype='int64')-start, 0, l)
+    delta = np.bincount(starts, minlength=l+1) - np.bincount(ends, minlength=l+1)
+    return np.cumsum(delta)[:l]
+
+def get_loci_cvg(bamfile, loci, max_gap=100000, max_span=1000000):
+    """
+    coverage over each (contig, start, end) locus, concatenated in the
+    order given. Loci on a contig that are within max_gap of each other
+    are fetched as one span so reads crossing them are only read once,
+    a span is closed once it would grow past max_span so dense loci (eg.
+    a whole BED) don't chain into contig long arrays
+    """
+    cvgs = [None for i in range(len(loci))]
+
+    idxs_by_contig = {}
+    for i, locus in enumerate(loci):
+        if not locus[0] in idxs_by_contig:
+            idxs_by_contig[locus[0]] = []
+        idxs_by_contig[locus[0]].append(i)
+
+    for contig, idxs in idxs_by_contig.items():
+        idxs = sorted(idxs, key=lambda i: loci[i][1])
+
+        spans = [[idxs[0]]]
+        span_start, span_end = loci[idxs[0]][1], loci[idxs[0]][2]
+        for i in idxs[1:]:
+            if loci[i][1]-span_end > max_gap or max(span_end, loci[i][2])-span_start > max_span:
+                spans.append([])
+                span_start, span_end = loci[i][1], loci[i][2]
+            spans[-1].append(i)
+            span_end = max(span_end, loci[i][2])
+
+        for span in spans:
+            s = min([loci[i][1] for i in span])
+            e = max([loci[i][2] for i in span])
+            span_cvg = get_locus_cvg(bamfile, contig, s, e)
+            for i in span:
+                cvgs[i] = span_cvg[loci[i][1]-s:loci[i][2]-s]
+
+    if len(cvgs) == 0:
+        return np.zeros(0, dtype='int64')
+    return np.concatenate(cvgs)
+
+def get_bam_cvg(args):
+    fn_bam, loci, max_gap, max_span = args
+    bamfile = pysam.AlignmentFile(fn_bam, 'rb')
+    cvg = get_loci_cvg(bamfile, loci, max_gap=max_gap, max_span=max_span)
+    bamfile.close()
+    return cvg
+
+def get_cvg_matrix(fn_bams, loci, n_procs=1, max_gap=100000, max_span=1000000):
+    """
+    samples x positions coverage matrix, rows in the order of fn_bams and
+    columns the loci concatenated in the order given
+    """
+    jobs = [(fn_bam, loci, max_gap, max_span) for fn_bam in fn_bams]
+
+    cvgs = run_shards(get_bam_cvg, jobs, n_procs)
+
+    l = sum([locus[2]-locus[1] for locus in loci])
+    cvg_matrix = np.zeros((len(fn_bams), l))
+    for i, cvg in enumerate(cvgs):
+        cvg_matrix[i] = cvg
+
+    return cvg_matrix
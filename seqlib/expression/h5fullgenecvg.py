@@ -8,6 +8,7 @@ import scipy.stats as stats
 import logging
 import pysam
 from coveragedata import *
+from annotationcache import *
 from gtf_to_genes import *
 
 
@@ -607,13 +608,16 @@ def build_h5(args):
     
     contig_lengths = {x[0]:x[1] for x in zip(bamfile.references, bamfile.lengths)}
     
-    species_id, gtf_path, genes = get_indexed_genes_for_identifier(args.fn_gtf_index,
-                                                                   logger, 
-                                                                   args.gtf_ID)
     if args.meta_type=="constitutive_single_stop":
-        cvg_objs_by_contig = get_cvg_objs_by_contig(genes,"constitutive_single_stop")
+        meta_type = "constitutive_single_stop"
     elif args.meta_type=="all_transcripts": 
-        cvg_objs_by_contig = get_cvg_objs_by_contig(genes,"transcript")
+        meta_type = "transcript"
+    
+    cvg_objs_by_contig = get_cached_cvg_objs_by_contig(args.fn_annotation_cache,
+                                                       args.fn_gtf_index,
+                                                       args.gtf_ID,
+                                                       meta_type,
+                                                       logger)
 
     full_h5 = h5FullGeneCvg_writer(args.fn_out)
 
@@ -767,6 +771,7 @@ if __name__=="__main__":
     parser_create.add_argument("--fn_out", required=True)
     parser_create.add_argument("--fn_gtf_index", required=True)
     parser_create.add_argument("--gtf_ID", required=True)
+    parser_create.add_argument("--fn_annotation_cache", default=None)
     parser_create.add_argument("--meta_type", required=True, 
                                               choices=["constitutive_single_stop",
                                                        "all_transcripts"])
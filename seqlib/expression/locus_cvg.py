@@ -7,7 +7,7 @@ import pdb
 
 import logging
 import pysam
-import pysamstats
+from coveragematrix import get_loci_cvg
 import pdb
 import math
 import time
@@ -15,81 +15,84 @@ import sys
 
 import scipy.stats as scp_stats
 
-def get_idxstats(fn_bam):
+def get_idxstats(bamfile):
     n_mapped_by_contig = {}
     n_mapped_total = 0
-    for inf in pysam.idxstats(fn_bam):
-        contig,len,mapped,unmapped = inf.split()
-        mapped=int(mapped)
-        n_mapped_by_contig[contig] = mapped
-        n_mapped_total +=mapped
-    
+    for inf in bamfile.get_index_statistics():
+        n_mapped_by_contig[inf.contig] = inf.mapped
+        n_mapped_total +=inf.mapped
+
     return n_mapped_total, n_mapped_by_contig
 
-def running_mean(x, N):
+def tiled_mean(x, N):
+    """
+    mean of x over consecutive tiles of width N from the start of x,
+    the last tile is whatever is left over
+    """
     cumsum = np.cumsum(np.insert(x, 0, 0))
-    return (cumsum[N:] - cumsum[:-N]) / N 
+    edges = np.r_[np.arange(0, x.shape[0], N), x.shape[0]]
+    return (cumsum[edges[1:]] - cumsum[edges[:-1]]) / np.diff(edges).astype(float)
+
+def get_loci(o):
+    """
+    (contig, start, end, name) from --locus contig:start-end or a bed file
+    """
+    if o.fn_bed is None:
+        contig, s_e = o.locus.split(":")
+        start, end = s_e.split("-")
+        return [(contig, int(start), int(end), o.locus)]
+
+    loci = []
+    for l in open(o.fn_bed):
+        if l[0]=="#" or l.startswith("track") or l.strip()=="":
+            continue
+        fields = l.rstrip().split("\t")
+        contig, start, end = fields[0], int(fields[1]), int(fields[2])
+        name = len(fields)>3 and fields[3] or "%s:%d-%d"%(contig, start, end)
+        loci.append((contig, start, end, name))
+    return loci
 
 if __name__=="__main__":
 
     parser = argparse.ArgumentParser()
     parser.add_argument("--fn_bam", required=True)
     parser.add_argument("--locus", default=None)
+    parser.add_argument("--fn_bed", default=None)
     parser.add_argument("--fn_out", default=None)
     parser.add_argument("--tile", default=None, type=int)
 
     o = parser.parse_args()
-    
+    assert (o.locus is None) != (o.fn_bed is None), "give one of --locus or --fn_bed"
+
     bamfile = pysam.AlignmentFile(o.fn_bam, 'rb')
-    
-    n_mapped_total, n_mapped_by_contig = get_idxstats(o.fn_bam)
-
-    contig, s_e = o.locus.split(":")
-    start, end = s_e.split("-")
-    start, end = int(start), int(end)
-    
-    ## #NOTE - still has maxdepth issue
-    max_depth=32000
-    #max_depth=64000
-    #max_depth=256000
-    while(1):
-        print("step", max_depth)
-        cvg_recarray = pysamstats.load_nondel_coverage(bamfile, 
-                                                      chrom=contig, 
-                                                      start=start, 
-                                                      end=end, 
-                                                      pad=True,
-                                                      max_depth=max_depth)
-        print(np.amax(cvg_recarray.reads_all))
-        
-        if np.amax(cvg_recarray.reads_all)>=max_depth-max_depth/3.0:
-            max_depth = max_depth*2
+    n_mapped_total, n_mapped_by_contig = get_idxstats(bamfile)
+
+    loci = get_loci(o)
+    cvg = get_loci_cvg(bamfile, [locus[:3] for locus in loci])
+    offsets = np.cumsum([0]+[end-start for contig, start, end, name in loci])
+
+    tables = []
+    for i, (contig, start, end, name) in enumerate(loci):
+        locus_cvg = cvg[offsets[i]:offsets[i+1]]
+        mu_cvg = locus_cvg.shape[0] and np.mean(locus_cvg) or 0
+
+        if o.tile:
+            tile_starts = np.arange(start, end, o.tile)
+            t = pd.DataFrame({"contig":contig,
+                              "start":tile_starts,
+                              "end":np.minimum(tile_starts+o.tile, end),
+                              "cvg":tiled_mean(locus_cvg, o.tile),
+                              "mu_cvg":mu_cvg})
         else:
-            break
-    
-    mu_cvg = np.mean(cvg_recarray.reads_all)
-    
-    outrows = []
-    if o.tile:
-        #smoothed = pd.rolling_mean(cvg_recarray.reads_all,o.tile)
-        smoothed = cvg_recarray.reads_all
-        for i in range(start, end, o.tile):
-            offset=i*o.tile
-            outrows.append({"n_mapped_total":n_mapped_total,
-                            "n_mapped_to_contig":n_mapped_by_contig[contig],
-                            "contig":contig,
-                            "start":start+offset,
-                            "end":start+offset+o.tile,
-                            "cvg":smoothed[i],
-                            "mu_cvg": mu_cvg})
-    else:
-        outrows.append({"n_mapped_total":n_mapped_total,
-                        "n_mapped_to_contig":n_mapped_by_contig[contig],
-                        "contig":contig,
-                        "start":start,
-                        "end":end,
-                        "cvg": mu_cvg})
-    
-    t = pd.DataFrame(outrows) 
-    t.to_csv(o.fn_out, sep="\t", index=False)
+            t = pd.DataFrame({"contig":[contig],
+                              "start":[start],
+                              "end":[end],
+                              "cvg":[mu_cvg]})
 
+        t['name'] = name
+        t['n_mapped_total'] = n_mapped_total
+        t['n_mapped_to_contig'] = n_mapped_by_contig[contig]
+        tables.append(t)
+
+    t = pd.concat(tables)
+    t.to_csv(o.fn_out, sep="\t", index=False)
@@ -5,6 +5,8 @@ import scipy.stats as scp_stats
 import pandas as pd
 
 from coveragedata import CoverageData
+from annotationcache import get_cached_cvg_objs_by_contig
+from coveragematrix import get_cvg_matrix
 
 import logging
 import pysam
@@ -74,41 +76,57 @@ if __name__=="__main__":
     parser.add_argument("--gene", required=True, default=None)
     parser.add_argument("--transcript_id", required=False, default=None)
     parser.add_argument("--gtf_ID", required=True)
+    parser.add_argument("--fn_annotation_cache", default=None)
 
+    parser.add_argument("--n_procs", default=1, type=int)
     parser.add_argument("--fn_logfile", default="/dev/null")
 
     o = parser.parse_args()
 
     logger = logging.getLogger(o.fn_logfile)
     
-    bamfiles = {}
     times = {}
     groups = {}
     celltypes = {}
     for i, sample in enumerate(o.samples):
-        print(sample)
-        bamfiles[sample] = pysam.AlignmentFile(o.fn_bams[i], 'rb')
         times[sample] = o.times[i]
         groups[sample] = o.groups[i]
         celltypes[sample] = o.celltypes[i]
         
-    species_id, gtf_path, genes = get_indexed_genes_for_identifier(o.fn_gtf_index,
-                                                                   logger, 
-                                                                   o.gtf_ID)
+    if o.fn_annotation_cache is not None:
+        meta_type = o.transcript_id and "transcript" or "constitutive_single_stop"
+        cvg_objs_by_contig = get_cached_cvg_objs_by_contig(o.fn_annotation_cache,
+                                                           o.fn_gtf_index,
+                                                           o.gtf_ID,
+                                                           meta_type,
+                                                           logger,
+                                                           indiv_gene=o.gene)
+        cvg_obj = None
+        for cvg_objs in cvg_objs_by_contig.values():
+            for c in cvg_objs:
+                if o.transcript_id is None or c.TID == o.transcript_id:
+                    cvg_obj = c
+                    break
+        assert cvg_obj!=None, "gene name {name} not found".format(name=o.gene)
+    else:
+        species_id, gtf_path, genes = get_indexed_genes_for_identifier(o.fn_gtf_index,
+                                                                       logger, 
+                                                                       o.gtf_ID)
+        
+        g_obj = None
+        for g in genes['protein_coding']:
+            if o.gene in g.names:
+                g_obj = g
+                break
+        assert g_obj!=None, "gene name {name} not found".format(name=o.gene)
+        cvg_obj = CoverageData(g_obj, transcript_id = o.transcript_id)
     
-    g_obj = None
-    for g in genes['protein_coding']:
-        if o.gene in g.names:
-            g_obj = g
-            break
-    assert g_obj!=None, "gene name {name} not found".format(name=o.gene)
+    cvg_matrix = get_cvg_matrix(o.fn_bams, cvg_obj.get_cvg_loci(), n_procs=o.n_procs)
     
     bp_cov_tables = []
-    for sample in o.samples:
-        cvg_obj = CoverageData(g_obj, transcript_id = o.transcript_id)
-        bp_cvg_rows = cvg_obj.get_cvg(None, bamfiles[sample])
-        bp_cvg_rows = cvg_obj.get_bp_cvg_dicts(keep_zeros=True)
-        T = pd.DataFrame(bp_cvg_rows)
+    for i, sample in enumerate(o.samples):
+        cvg_obj.set_cvg(cvg_matrix[i])
+        T = cvg_obj.get_bp_cvg_table(keep_zeros=True)
         T['sample'] = sample
         T['time'] = times[sample]
         T['group'] = groups[sample]
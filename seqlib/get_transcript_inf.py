@@ -10,9 +10,11 @@ e.g.
 
 import argparse
 import logging
+import numpy as np
 import pandas as pd
 from gtf_to_genes import *
 from expression.coveragedata import *
+from expression.annotationcache import *
 import pdb
 import string
 import re
@@ -64,13 +66,12 @@ def get_sequence(args):
     
     sys.stderr.write("loading gene annotations...")
     logger = logging.getLogger(args.fn_logfile)
-    s_id, path, genes = get_indexed_genes_for_identifier(args.fn_gtf_index,
-                                                         logger, 
-                                                         args.gtf_ID)
-
+    cvg_objs_by_contig = get_cached_cvg_objs_by_contig(args.fn_annotation_cache,
+                                                       args.fn_gtf_index,
+                                                       args.gtf_ID,
+                                                       "transcript",
+                                                       logger)
     sys.stderr.write("done\n")
-    cvg_objs_by_contig = get_cvg_objs_by_contig(genes,
-                                                "transcript")
     outrows = []
     for contig, cvg_objs in cvg_objs_by_contig.items():
         if not contig in fa.references:
@@ -103,12 +104,12 @@ def get_positional_kmer(args):
     fa = pysam.Fastafile(args.fn_fasta)
     sys.stderr.write("loading gene annotations...")
     logger = logging.getLogger(args.fn_logfile)
-    s_id, path, genes = get_indexed_genes_for_identifier(args.fn_gtf_index,
-                                                         logger, 
-                                                         args.gtf_ID)
+    cvg_objs_by_contig = get_cached_cvg_objs_by_contig(args.fn_annotation_cache,
+                                                       args.fn_gtf_index,
+                                                       args.gtf_ID,
+                                                       "transcript",
+                                                       logger)
     sys.stderr.write("done\n")
-    cvg_objs_by_contig = get_cvg_objs_by_contig(genes,
-                                                "transcript")
     outrows = []
     for contig, cvg_objs in cvg_objs_by_contig.items():
         if not contig in fa.references:
@@ -124,8 +125,6 @@ def get_positional_kmer(args):
             CDS_seq = seq_inf['CDS_seq'].upper()
             UTR_3p_seq = seq_inf['UTR_3p_seq'].upper()
 
-            genome_positions = cvg_obj.get_transcript_to_genome_coords()
-            
             if args.feature_type == "STOP_KMER":
                 l_offset, r_offset = int(args.feature_args[0]), int(args.feature_args[1])
                 
@@ -179,12 +178,12 @@ def get_codon_features(args):
     fa = pysam.Fastafile(args.fn_fasta)
     sys.stderr.write("loading gene annotations...")
     logger = logging.getLogger(args.fn_logfile)
-    s_id, path, genes = get_indexed_genes_for_identifier(args.fn_gtf_index,
-                                                         logger, 
-                                                         args.gtf_ID)
+    cvg_objs_by_contig = get_cached_cvg_objs_by_contig(args.fn_annotation_cache,
+                                                       args.fn_gtf_index,
+                                                       args.gtf_ID,
+                                                       "transcript",
+                                                       logger)
     sys.stderr.write("done\n")
-    cvg_objs_by_contig = get_cvg_objs_by_contig(genes,
-                                                "transcript")
     outrows = []
     for contig, cvg_objs in cvg_objs_by_contig.items():
         if not contig in fa.references:
@@ -200,8 +199,6 @@ def get_codon_features(args):
             CDS_seq = seq_inf['CDS_seq'].upper()
             UTR_3p_seq = seq_inf['UTR_3p_seq'].upper()
 
-            genome_positions = cvg_obj.get_transcript_to_genome_coords()
-            
             if args.feature_type == "UTR_STOP":
                 codon_ps = [m.start()+CDS_end for m in re.finditer(stop_codons,UTR_3p_seq)]
                 if args.feature_n!=None:
@@ -223,13 +220,17 @@ def get_codon_features(args):
                     codon_ps = [p+CDS_start for p in range(len(CDS_seq)/3)]
 
 
+            ###NOTE: get the +2 position, then sort, then add 1. Why? because if
+            ### on negative strand, then +3 will get the position BEFORE the first base
+            ### need to get the 0 based coords, sort them, then add 1 to the last one
+            mapper = cvg_obj.get_coord_mapper()
+            t_starts = np.array(codon_ps, dtype='int64')
+            g_firsts = mapper.transcript_to_genome(t_starts)
+            g_lasts = mapper.transcript_to_genome(t_starts+2)
+            g_starts = np.minimum(g_firsts, g_lasts)
+            g_ends = np.maximum(g_firsts, g_lasts)+1
+
             for i, t_start in enumerate(codon_ps):
-                ###NOTE: get the +2 position, then sort, then add 1. Why? because if
-                ### on negative strand, then +3 will get the position BEFORE the first base
-                ### need to get the 0 based coords, sort them, then add 1 to the last one
-                g_start_end = sorted([genome_positions[t_start],genome_positions[t_start+2]])
-                g_start = g_start_end[0]
-                g_end = g_start_end[1]+1 
                 feature_seq = seq[t_start:t_start+3]
                 
                 outrows.append({"gene_id": seq_inf['gene_id'],
@@ -238,8 +239,8 @@ def get_codon_features(args):
                                 "contig": contig,
                                 "t_start": t_start,
                                 "t_end": t_start+3,
-                                "g_start": g_start,
-                                "g_end": g_end,
+                                "g_start": g_starts[i],
+                                "g_end": g_ends[i],
                                 "feature_idx":i,
                                 "feature_seq": feature_seq,
                                 "feature_AA":all_codons[feature_seq],
@@ -263,6 +264,7 @@ if __name__=="__main__":
     parser_getseq.add_argument("--fn_out", required=True)
     parser_getseq.add_argument("--fn_gtf_index", required=True)
     parser_getseq.add_argument("--gtf_ID", required=True)
+    parser_getseq.add_argument("--fn_annotation_cache", default=None)
     parser_getseq.add_argument("--fn_fasta", required=True)
     parser_getseq.add_argument("--fn_logfile", default="/dev/null")
     parser_getseq.set_defaults(func=get_sequence)
@@ -271,6 +273,7 @@ if __name__=="__main__":
     parser_getfeatures.add_argument("--fn_out", required=True)
     parser_getfeatures.add_argument("--fn_gtf_index", required=True)
     parser_getfeatures.add_argument("--gtf_ID", required=True)
+    parser_getfeatures.add_argument("--fn_annotation_cache", default=None)
     parser_getfeatures.add_argument("--fn_fasta", required=True)
     parser_getfeatures.add_argument("--feature_type", required=True, choices=["UTR_STOP", 
                                                                               "CDS_CODON",
@@ -11,6 +11,7 @@ import scipy.stats as stats
 import itertools
 
 from expression.coveragedata import *
+from expression.annotationcache import *
 from gtf_to_genes import *
 import timeit
 
@@ -29,6 +30,7 @@ if __name__=="__main__":
     parser.add_argument("--fn_out", required=True)
     parser.add_argument("--fn_gtf_index", required=True)
     parser.add_argument("--gtf_ID", required=True)
+    parser.add_argument("--fn_annotation_cache", default=None)
     parser.add_argument("--fn_logfile", default='/dev/stderr')
     parser.add_argument("--contig", default=None)
     
@@ -36,13 +38,13 @@ if __name__=="__main__":
     
     sys.stderr.write("loading gene annotations...")
     logger = logging.getLogger(args.fn_logfile)
-    s_id, path, genes = get_indexed_genes_for_identifier(args.fn_gtf_index,
-                                                         logger, 
-                                                         args.gtf_ID)
+    cvg_objs_by_contig = get_cached_cvg_objs_by_contig(args.fn_annotation_cache,
+                                                       args.fn_gtf_index,
+                                                       args.gtf_ID,
+                                                       "transcript",
+                                                       logger,
+                                                       contig_subset=args.contig)
     sys.stderr.write("done\n")
-    cvg_objs_by_contig = get_cvg_objs_by_contig(genes,
-                                                "transcript", 
-                                                contig_subset=args.contig)
     
     starts = []
     ends = []
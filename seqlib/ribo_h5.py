@@ -9,6 +9,7 @@ import pysam
 import scipy.stats as stats
 
 from expression.coveragedata import *
+from expression.annotationcache import *
 from gtf_to_genes import *
 import timeit
 
@@ -336,12 +337,12 @@ def calibrate(args, width=50):
     
     sys.stderr.write("loading gene annotations...")
     logger = logging.getLogger(args.fn_logfile)
-    s_id, path, genes = get_indexed_genes_for_identifier(args.fn_gtf_index,
-                                                                   logger, 
-                                                                   args.gtf_ID)
+    cvg_objs_by_contig = get_cached_cvg_objs_by_contig(args.fn_annotation_cache,
+                                                       args.fn_gtf_index,
+                                                       args.gtf_ID,
+                                                       "transcript",
+                                                       logger)
     sys.stderr.write("done\n")
-    cvg_objs_by_contig = get_cvg_objs_by_contig(genes,
-                                                "transcript")
     outrows = []
     
     stop_c_by_size = {}
@@ -519,12 +520,12 @@ def RFPCountTable(args):
 
     sys.stderr.write("loading gene annotations...")
     logger = logging.getLogger(args.fn_logfile)
-    s_id, path, genes = get_indexed_genes_for_identifier(args.fn_gtf_index,
-                                                                   logger, 
-                                                                   args.gtf_ID)
+    cvg_objs_by_contig = get_cached_cvg_objs_by_contig(args.fn_annotation_cache,
+                                                       args.fn_gtf_index,
+                                                       args.gtf_ID,
+                                                       "transcript",
+                                                       logger)
     sys.stderr.write("done\n")
-    cvg_objs_by_contig = get_cvg_objs_by_contig(genes,
-                                                "transcript")
     outrows = []
     for contig, cvg_objs in cvg_objs_by_contig.items():
         if not contig in h5.contig_to_idx: continue
@@ -667,12 +668,12 @@ def makeGeneFeatureSummary(args):
 
     sys.stderr.write("loading gene annotations...")
     logger = logging.getLogger(args.fn_logfile)
-    s_id, path, genes = get_indexed_genes_for_identifier(args.fn_gtf_index,
-                                                                   logger, 
-                                                                   args.gtf_ID)
+    cvg_objs_by_contig = get_cached_cvg_objs_by_contig(args.fn_annotation_cache,
+                                                       args.fn_gtf_index,
+                                                       args.gtf_ID,
+                                                       "transcript",
+                                                       logger)
     sys.stderr.write("done\n")
-    cvg_objs_by_contig = get_cvg_objs_by_contig(genes,
-                                                "transcript")
 
     outrows = []
     for contig, cvg_objs in cvg_objs_by_contig.items():
@@ -718,12 +719,12 @@ def makeSummary(args):
     
     sys.stderr.write("loading gene annotations...")
     logger = logging.getLogger(args.fn_logfile)
-    s_id, path, genes = get_indexed_genes_for_identifier(args.fn_gtf_index,
-                                                                   logger, 
-                                                                   args.gtf_ID)
+    cvg_objs_by_contig = get_cached_cvg_objs_by_contig(args.fn_annotation_cache,
+                                                       args.fn_gtf_index,
+                                                       args.gtf_ID,
+                                                       "transcript",
+                                                       logger)
     sys.stderr.write("done\n")
-    cvg_objs_by_contig = get_cvg_objs_by_contig(genes,
-                                                "transcript")
 
     outrows = []
     for contig, cvg_objs in cvg_objs_by_contig.items():
@@ -765,13 +766,13 @@ def makeReadLengthSummary(args):
     h5.load_offsets(args.fn_aSiteOffsets, args.no_aSiteOffsets)
     
     logger = logging.getLogger(args.fn_logfile)
-    s_id, path, genes = get_indexed_genes_for_identifier(args.fn_gtf_index,
-                                                         logger, 
-                                                         args.gtf_ID)
+    cvg_objs_by_contig = get_cached_cvg_objs_by_contig(args.fn_annotation_cache,
+                                                       args.fn_gtf_index,
+                                                       args.gtf_ID,
+                                                       "transcript",
+                                                       logger)
     sys.stderr.write("done\n")
     sys.stderr.write("loading gtf\n")
-    cvg_objs_by_contig = get_cvg_objs_by_contig(genes,
-                                                "transcript")
     sys.stderr.write("done\n")
     
     flat_regions_by_contig = get_flat_gene_regions(cvg_objs_by_contig)
@@ -884,6 +885,7 @@ if __name__=="__main__":
     parser_makeSum.add_argument("--fn_out", required=True)
     parser_makeSum.add_argument("--fn_gtf_index", required=True)
     parser_makeSum.add_argument("--gtf_ID", required=True)
+    parser_makeSum.add_argument("--fn_annotation_cache", default=None)
     parser_makeSum.add_argument("--fn_logfile", default='/dev/stderr')
     parser_makeSum.set_defaults(func=calibrate)
 
@@ -902,6 +904,7 @@ if __name__=="__main__":
                                                      nargs=2)
     parser_makeSum.add_argument("--fn_gtf_index", required=True)
     parser_makeSum.add_argument("--gtf_ID", required=True)
+    parser_makeSum.add_argument("--fn_annotation_cache", default=None)
     parser_makeSum.add_argument("--fn_logfile", default='/dev/stderr')
     parser_makeSum.set_defaults(func=makeSummary)
     
@@ -915,6 +918,7 @@ if __name__=="__main__":
                                                      action='store_true')
     parser_makeSum.add_argument("--fn_gtf_index", required=True)
     parser_makeSum.add_argument("--gtf_ID", required=True)
+    parser_makeSum.add_argument("--fn_annotation_cache", default=None)
     parser_makeSum.add_argument("--fn_logfile", default='/dev/stderr')
     parser_makeSum.set_defaults(func=makeReadLengthSummary)
     
@@ -936,6 +940,7 @@ if __name__=="__main__":
                                        default="end")
     parser_makeFeatureSum.add_argument("--fn_gtf_index", required=False)
     parser_makeFeatureSum.add_argument("--gtf_ID", required=False)
+    parser_makeFeatureSum.add_argument("--fn_annotation_cache", default=None)
     parser_makeFeatureSum.add_argument("--fn_logfile", default='/dev/stderr')
     parser_makeFeatureSum.set_defaults(func=makeFeatureSummary)
     
@@ -954,6 +959,7 @@ if __name__=="__main__":
                                                      nargs=2)
     parser_makeRFPCountTable.add_argument("--fn_gtf_index", required=True)
     parser_makeRFPCountTable.add_argument("--gtf_ID", required=True)
+    parser_makeRFPCountTable.add_argument("--fn_annotation_cache", default=None)
     parser_makeRFPCountTable.add_argument("--fn_logfile", default='/dev/stderr')
     parser_makeRFPCountTable.add_argument("--feature", required=True, choices = ["START","STOP","POLYA","OTHER"])
     parser_makeRFPCountTable.add_argument("--fn_features", required=False, default=None)
@@ -9,50 +9,147 @@ from junction_writer import JunctionWriter
 import pysam
 import pandas as pd
 from sys import stderr
-from scipy.stats import pearsonr
+from psi_matrix import h5PSIMatrix
 
-def assess_bio_replicates(T, fn_out):
+KEY_COLS = ["contig", "ss_5p", "ss_3p_prox", "ss_3p_dist", "size"]
 
-    tissues = list(np.unique(T["tissue"].values))
-    
-    grouped = T.groupby(["contig","ss_5p","ss_3p_prox","ss_3p_dist","size", "tissue"])
-    nn_count_summary = grouped['n_reads'].agg({"n_reads_mean":np.mean,"n_reads_min":np.min})
-    T = T.join(nn_count_summary, on=["contig","ss_5p","ss_3p_prox","ss_3p_dist","size","tissue"])
-    T = T[T['n_reads_min']>=10]
-    
+def get_event_ids(T):
+    """
+    an id for each row of T, the same for the same contig, ss_5p,
+    ss_3p_prox, ss_3p_dist, size, numbered in sorted key order (the
+    order groupby would give), and the key columns of the events
+    """
+    contig_codes, contigs = pd.factorize(T['contig'], sort=True)
+    keys = [contig_codes]+[T[col].values for col in KEY_COLS[1:]]
+    order = np.lexsort(keys[::-1])
+    sorted_keys = np.column_stack(keys)[order]
+    new = np.r_[True, np.any(sorted_keys[1:]!=sorted_keys[:-1], axis=1)][:order.shape[0]]
+    ids = np.empty(T.shape[0], dtype='int64')
+    ids[order] = np.cumsum(new)-1
+    events = T[KEY_COLS].iloc[order[new]].reset_index(drop=True)
+    return ids, events
+
+def get_replicate_matrices(T):
+    """
+    the long table pivoted to events x replicates psi and n_reads, NaN
+    where a replicate has no row for an event, and the sample and tissue
+    of each replicate. Replicates are sorted by tissue then sample so the
+    replicates of a tissue are a block of columns
+    """
+    ids, events = get_event_ids(T)
+    tissue_codes, tissues = pd.factorize(T['tissue'], sort=True)
+    sample_codes, samples = pd.factorize(T['sample'], sort=True)
+    reps, rep_ids = np.unique(tissue_codes*len(samples)+sample_codes, return_inverse=True)
+    rep_samples = np.asarray(samples, dtype=object)[reps%len(samples)]
+    rep_tissues = np.asarray(tissues, dtype=object)[reps//len(samples)]
+
+    psi = np.empty((events.shape[0], reps.shape[0]))
+    psi.fill(np.nan)
+    n_reads = psi.copy()
+    psi[ids, rep_ids] = T['psi'].values
+    n_reads[ids, rep_ids] = T['n_reads'].values
+    return events, rep_samples, rep_tissues, psi, n_reads
+
+def get_tissue_stats(psi, n_reads, rep_tissues):
+    """
+    events x tissues psi mean and std (ddof 1, as pandas) over the
+    replicates with a psi, and n_reads mean and min and the number of
+    replicates over those with a row. NaN where there are none
+    """
+    tissues = np.unique(rep_tissues)
+    shape = (psi.shape[0], tissues.shape[0])
+    stats = {"psi_mean":np.empty(shape),
+             "psi_std":np.empty(shape),
+             "n_reads_mean":np.empty(shape),
+             "n_reads_min":np.empty(shape),
+             "n_replicates":np.zeros(shape, dtype='int64')}
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for k, tissue in enumerate(tissues):
+            t_psi = psi[:,rep_tissues==tissue]
+            t_n_reads = n_reads[:,rep_tissues==tissue]
+            has_psi = ~np.isnan(t_psi)
+            has_row = ~np.isnan(t_n_reads)
+
+            n_psi = np.sum(has_psi, axis=1)
+            mean = np.sum(np.where(has_psi, t_psi, 0), axis=1)/n_psi
+            sq_devs = np.where(has_psi, t_psi-mean[:,None], 0)**2
+            stats["psi_mean"][:,k] = mean
+            stats["psi_std"][:,k] = np.where(n_psi>1, np.sum(sq_devs, axis=1)/(n_psi-1), np.nan)**0.5
+
+            n_rows = np.sum(has_row, axis=1)
+            stats["n_replicates"][:,k] = n_rows
+            stats["n_reads_mean"][:,k] = np.sum(np.where(has_row, t_n_reads, 0), axis=1)/n_rows
+            stats["n_reads_min"][:,k] = np.where(n_rows>0, np.min(np.where(has_row, t_n_reads, np.inf), axis=1), np.nan)
+    return tissues, stats
+
+def masked_corrcoef(X, mask):
+    """
+    pearson r of every pair of columns of X over the rows where both
+    are in mask, NaN for pairs sharing fewer than 2 rows or with a
+    constant column
+    """
+    M = mask.astype(float)
+    n = np.dot(M.T, M)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        """
+        center first, r doesn't change and the sums below stay small
+        """
+        mu = np.sum(np.where(mask, X, 0), axis=0)/np.sum(M, axis=0)
+        X = np.where(mask, X-mu, 0)
+        S_x = np.dot(X.T, M)
+        S_xx = np.dot((X*X).T, M)
+        S_xy = np.dot(X.T, X)
+
+        cov = S_xy-S_x*S_x.T/n
+        var = S_xx-S_x*S_x/n
+        r = cov/np.sqrt(var*var.T)
+    return np.where(n>1, r, np.nan)
+
+def assess_bio_replicates(psi, rep_samples, rep_tissues, tissues, stats, fn_out, min_reads=10):
+    """
+    r^2 of the psis of every pair of replicates of a tissue over the
+    events every replicate of the tissue has at least min_reads for
+    """
     bio_rep_sum = []
-    for tissue in tissues:
-        t_T = T[T['tissue']==tissue]
-        replicates = list(np.unique(t_T["sample"].values))
-        
-        for i in range(len(replicates)):
-            for j in range(i, len(replicates)):
-                if i==j: continue
-                rep1, rep2 = replicates[i], replicates[j]
-                #c = np.corrcoef(t_T[t_T["sample"]==rep1]["psi"],t_T[t_T["sample"]==rep2]["psi"])
-                r,p = pearsonr(t_T[t_T["sample"]==rep1]["psi"],t_T[t_T["sample"]==rep2]["psi"])
-                bio_rep_sum.append({"r.squared":r*r,"tissue":tissue, "sample1":rep1, "sample2":rep2})
+    for k, tissue in enumerate(tissues):
+        cols = np.where(rep_tissues==tissue)[0]
+        keep = stats["n_reads_min"][:,k]>=min_reads
+        t_psi = psi[keep][:,cols]
+        has_psi = ~np.isnan(t_psi)
+        t_reps = np.where(np.any(has_psi, axis=0))[0]
 
-    
-    df = pd.DataFrame(bio_rep_sum)
+        r = masked_corrcoef(t_psi[:,t_reps], has_psi[:,t_reps])
+        for i in xrange(t_reps.shape[0]):
+            for j in xrange(i+1, t_reps.shape[0]):
+                bio_rep_sum.append([r[i,j]*r[i,j], rep_samples[cols[t_reps[i]]], rep_samples[cols[t_reps[j]]], tissue])
+
+    df = pd.DataFrame(bio_rep_sum, columns=["r.squared", "sample1", "sample2", "tissue"])
     df.to_csv(fn_out, sep="\t", index=False)
 
-def get_sum_table(T, sample_tissue_tups, fn_out):
-    
-    #nn_summary = T.groupby(["contig","ss_5p","ss_3p_prox","ss_3p_dist","size", "tissue"]).agg([np.mean,np.std])
-    #nn_summary = grouped.agg({"psi":[np.mean,np.std],'prox_count':np.mean,"dist_count":np.mean}, as_index=False)
-    #nn_nreads_summary = grouped['psi'].agg({"psi_mean":np.mean,"psi_std":np.std})
-    grouped = T.groupby(["contig","ss_5p","ss_3p_prox","ss_3p_dist","size", "tissue"])
-    nn_psi_summary = grouped['psi'].agg({"psi_mean":np.mean,"psi_std":np.std})
-    nn_count_summary = grouped['n_reads'].agg({"n_reads_mean":np.mean,"n_reads_min":np.min})
-    nn_psi_summary = nn_psi_summary.join(nn_count_summary).reset_index()
-    
-    switch_scores = nn_psi_summary.groupby(["contig","ss_5p","ss_3p_prox","ss_3p_dist","size"])['psi_mean'].agg({"switch_score":lambda x:np.amax(x)-np.amin(x)}) 
-    nn_psi_summary = nn_psi_summary.join(switch_scores, on=["contig","ss_5p","ss_3p_prox","ss_3p_dist","size"])
+def get_sum_table(events, tissues, stats, n_reads_dtype, fn_out):
+    """
+    one row per event and tissue with a replicate, with the tissue's psi
+    and n_reads stats and the event's switch score, the range of its
+    tissue psi means
+    """
+    psi_means = stats["psi_mean"]
+    has_mean = ~np.isnan(psi_means)
+    switch_scores = np.where(np.any(has_mean, axis=1),
+                             np.max(np.where(has_mean, psi_means, -np.inf), axis=1)-
+                             np.min(np.where(has_mean, psi_means, np.inf), axis=1),
+                             np.nan)
 
+    e_idxs, t_idxs = np.where(stats["n_replicates"]>0)
+    nn_psi_summary = events.iloc[e_idxs].reset_index(drop=True)
+    nn_psi_summary['tissue'] = tissues[t_idxs]
+    nn_psi_summary['psi_std'] = stats["psi_std"][e_idxs, t_idxs]
+    nn_psi_summary['psi_mean'] = psi_means[e_idxs, t_idxs]
+    nn_psi_summary['n_reads_mean'] = stats["n_reads_mean"][e_idxs, t_idxs]
+    nn_psi_summary['n_reads_min'] = stats["n_reads_min"][e_idxs, t_idxs].astype(n_reads_dtype)
+    nn_psi_summary['switch_score'] = switch_scores[e_idxs]
     nn_psi_summary.to_csv(fn_out,sep="\t", index=False)
-    #for tissue in tissues:
-        
+
 def read_tables(fns, l_get_sample_tissue):
                 
     
@@ -93,14 +190,24 @@ if __name__=="__main__":
     parser.add_argument("--fn_out_bio_replicate_summary")
     parser.add_argument("--sample_tissue_lambda", default="""lambda x: x.split("/")[-1].split(".")[0].split("_")""")
     parser.add_argument("--fn_inputs", nargs="*")
+    parser.add_argument("--fn_psi_matrix", default=None, 
+                        help="psi_matrix output, used in place of --fn_inputs")
     o = parser.parse_args()
     
-    sample_tissue_L = eval(o.sample_tissue_lambda) 
-    T, sample_tissue_tups = read_tables(o.fn_inputs, sample_tissue_L)
+    if o.fn_psi_matrix:
+        psi_matrix = h5PSIMatrix(o.fn_psi_matrix)
+        T = psi_matrix.get_long_table()
+        sample_tissue_tups = zip(psi_matrix.samples, psi_matrix.tissues)
+    else:
+        sample_tissue_L = eval(o.sample_tissue_lambda) 
+        T, sample_tissue_tups = read_tables(o.fn_inputs, sample_tissue_L)
     T["n_reads"] = T["prox_count"]+T["dist_count"]
     T.to_csv(o.fn_out_all,index=False, sep="\t")
-    assess_bio_replicates(T, o.fn_out_bio_replicate_summary)
-    sum_table = get_sum_table(T, sample_tissue_tups, o.fn_out_summary)
+
+    events, rep_samples, rep_tissues, psi, n_reads = get_replicate_matrices(T)
+    tissues, stats = get_tissue_stats(psi, n_reads, rep_tissues)
+    assess_bio_replicates(psi, rep_samples, rep_tissues, tissues, stats, o.fn_out_bio_replicate_summary)
+    get_sum_table(events, tissues, stats, T['n_reads'].dtype, o.fn_out_summary)
 
 
 
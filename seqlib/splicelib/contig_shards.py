@@ -0,0 +1,126 @@
+"""
+contig sharded runs of the per contig splice graph scans (id_micro_exons,
+id_nagnag, make_miso_indices)
+
+each contig is scanned by its own worker into its own shard files, the
+shards are then concatenated in contig order so the output does not
+depend on which worker finished first
+"""
+
+import os
+import shutil
+import tempfile
+import heapq
+import multiprocessing as mp
+from sys import stderr
+
+import splicelib.splicegraph as sg
+
+from junction_writer import JunctionWriter, STRANDS
+from transcript_writer import index_sorted
+
+def run_shards(f, jobs, n_procs):
+    """
+    f(job) for every job in a pool of n_procs, results in job order
+    """
+    if n_procs>1 and len(jobs)>1:
+        pool = mp.Pool(min(n_procs, len(jobs)))
+        ret = pool.map(f, jobs, chunksize=1)
+        pool.close()
+        pool.join()
+    else:
+        ret = [f(job) for job in jobs]
+    return ret
+
+def get_out_fns(gff_dir, bed_dir, juncs_dir, mx_type):
+    return {"gff":"{gff_dir}/{mx_type}.gff".format(gff_dir=gff_dir, mx_type=mx_type),
+            "novel_gff":"{gff_dir}/{mx_type}.novel.gff".format(gff_dir=gff_dir, mx_type=mx_type),
+            "bed":"{bed_dir}/{mx_type}.bed".format(bed_dir=bed_dir, mx_type=mx_type),
+            "juncs":"{junction_dir}/{mx_type}".format(junction_dir=juncs_dir, mx_type=mx_type)}
+
+def make_shard_dir(fn_out_dir):
+    return tempfile.mkdtemp(prefix=".shards.", dir=fn_out_dir)
+
+def get_shard_prefix(shard_dir, contig):
+    shard_prefix = "{shard_dir}/{contig}".format(shard_dir=shard_dir, contig=contig)
+    if not os.path.exists(shard_prefix):
+        os.mkdir(shard_prefix)
+    return shard_prefix
+
+def cat_shards(fn_shards, fn_out, header=None, skip_header=False):
+    """
+    concatenate the shards in order into fn_out, line for line what a
+    serial run would write. With skip_header, the first line of each
+    shard is dropped and the first shard's first line is written once,
+    at the top
+    """
+    F = open(fn_out, 'w')
+    if header:
+        F.write(header)
+
+    wrote_header = False
+    for fn in fn_shards:
+        if not os.path.exists(fn):
+            continue
+        for i, l in enumerate(open(fn)):
+            if i == 0 and skip_header:
+                if not wrote_header:
+                    F.write(l)
+                    wrote_header = True
+                continue
+            F.write(l)
+    F.close()
+
+def get_shard_juncs(fn):
+    for l in open(fn):
+        contig, left, right, strand = l.rstrip().split("\t")
+        yield contig, int(left), int(right), STRANDS.index(strand)
+
+def merge_junction_shards(shard_prefixes, fn_prefix, bgzip=False):
+    """
+    the shard JunctionWriter outputs, each already sorted and unique,
+    heap merged line by line into one sorted, unique and, with bgzip,
+    indexed output
+    """
+    fns = ["%s.tophat.juncs"%shard_prefix for shard_prefix in shard_prefixes]
+    j_writer = JunctionWriter(fn_prefix, bgzip=bgzip)
+    j_writer.write_sorted(heapq.merge(*[get_shard_juncs(fn) for fn in fns if os.path.exists(fn)]))
+
+def remove_shard_dir(shard_dir):
+    stderr.write("removing shards in %s\n"%shard_dir)
+    shutil.rmtree(shard_dir)
+
+def scan_contig_shard(args):
+    """
+    scan_f over one contig into shard files named as the outputs are
+    """
+    scan_f, o, contig, out_fns, shard_dir, cache_key = args
+    shard_prefix = get_shard_prefix(shard_dir, contig)
+    shard_fns = dict([tuple([k, "%s/%s"%(shard_prefix, os.path.basename(fn))]) 
+                      for k, fn in out_fns.iteritems()])
+    scan_f(o, [contig], shard_fns, cache_key=cache_key)
+    return shard_fns
+
+def run_scan_shards(o, contigs, out_fns, scan_f, track_desc=None):
+    """
+    scan_f(o, [contig], shard_fns, cache_key=...) per contig in a pool of
+    o.n_procs, from a transcript table cache filled once up front, then
+    gather the gff, novel gff, bed and junction shards into out_fns as
+    scan_f(o, contigs, out_fns, track_desc=track_desc) would write them
+    """
+    cache_key = sg.cache_transcript_tables(o.fn_input_gff, contigs)
+    shard_dir = make_shard_dir(o.fn_output_juncs_dir)
+    shard_fns = run_shards(scan_contig_shard, 
+                           [tuple([scan_f, o, contig, out_fns, shard_dir, cache_key]) for contig in contigs], 
+                           o.n_procs)
+    cat_shards([fns["gff"] for fns in shard_fns], out_fns["gff"])
+    cat_shards([fns["novel_gff"] for fns in shard_fns], out_fns["novel_gff"])
+    cat_shards([fns["bed"] for fns in shard_fns], out_fns["bed"], header=track_desc)
+    if o.bgzip:
+        index_sorted(out_fns["gff"], "gff")
+        index_sorted(out_fns["novel_gff"], "gff")
+        index_sorted(out_fns["bed"], "bed")
+    merge_junction_shards([fns["juncs"] for fns in shard_fns], 
+                          out_fns["juncs"], 
+                          bgzip=o.bgzip_juncs)
+    remove_shard_dir(shard_dir)
@@ -6,45 +6,64 @@ import pandas as pd
 from collections import defaultdict
 
 
-def m_score(deltas):
-
-    s = np.sum(deltas>0)-np.sum(deltas<0)
-
-    t = np.tile(deltas,(1000,1))
-    rsign = ((np.random.rand(1000,deltas.shape[0])>0.5)*2)-1
-    rnd_deltas = t*rsign
-    dist = np.sum(rnd_deltas>0,1)-np.sum(rnd_deltas<0,1)
-    mu = np.mean(dist)
-    sd = np.std(dist)
-    
-    MZ=(s-mu)/sd
-    return s, MZ
-
-def get_M_scores(sample_order, t_by_comparison, events, BF_min):
+def get_delta_matrix(t_by_comparison, comparisons, events, BF_min):
+    """
+    events x comparisons sample2 - sample1 posterior mean deltas and
+    whether each comparison's bayes factor is at least BF_min
+    """
+    deltas = np.zeros((len(events), len(comparisons)))
+    significant = np.zeros((len(events), len(comparisons)), dtype=bool)
+    for j, c in enumerate(comparisons):
+        t = t_by_comparison[c].reindex(events)
+        deltas[:,j] = (t['sample2_posterior_mean']-t['sample1_posterior_mean']).values
+        significant[:,j] = t['bayes_factor'].values>=BF_min
+    return deltas, significant
+
+def m_scores(deltas, significant, n_permutations=0, seed=0, chunk_size=10000):
+    """
+    M, the number of significant deltas up minus down, and MZ, M as a z
+    score against flipping the sign of each delta at random. The flips
+    have mean 0 and variance the number of non 0 deltas, so by default MZ
+    is exact. With n_permutations, the null comes from a bank of that many
+    random sign vectors drawn once from seed and shared by every event
+    """
+    signs = np.where(significant, np.nan_to_num(np.sign(deltas)), 0)
+    M = np.sum(signs, axis=1)
+
+    if n_permutations == 0:
+        mu = np.zeros(M.shape[0])
+        sd = np.sqrt(np.sum(signs!=0, axis=1))
+    else:
+        bank = np.random.RandomState(seed).randint(0, 2, (n_permutations, signs.shape[1]))*2-1
+        mu = np.zeros(M.shape[0])
+        sd = np.zeros(M.shape[0])
+        for i in xrange(0, M.shape[0], chunk_size):
+            dist = np.dot(bank, signs[i:i+chunk_size].T)
+            mu[i:i+chunk_size] = np.mean(dist, axis=0)
+            sd[i:i+chunk_size] = np.std(dist, axis=0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        MZ = (M-mu)/sd
+    return M.astype('int64'), MZ
+
+def get_M_scores(sample_order, t_by_comparison, events, BF_min, n_permutations=0, seed=0):
 
     comparisons = t_by_comparison.keys()
     dvect = [sample_order.index(c[0])<sample_order.index(c[1]) for c in comparisons]
     assert np.all(np.array(dvect))
     
-    m_table = []
-    
-    for i,e in enumerate(events):
-        BFs = []
-        deltas = []
-        for c in comparisons:
-            if t_by_comparison[c].loc[e]['bayes_factor']>=BF_min:
-                deltas.append(t_by_comparison[c].loc[e]['sample2_posterior_mean']-t_by_comparison[c].loc[e]['sample1_posterior_mean'])
-        BFs = np.array(BFs)
-        deltas = np.array(deltas)
-
-        if deltas.shape[0]>1:
-            m, MZ = m_score(deltas)
-        else:
-            m, MZ = 0, 0
-        
-        m_table.append({"compressed_ID":e, "M":m, "MZ":MZ})
+    events = sorted(events)
+    deltas, significant = get_delta_matrix(t_by_comparison, comparisons, events, BF_min)
+    M, MZ = m_scores(deltas, significant, n_permutations, seed)
     
-    t = pd.DataFrame(m_table)
+    """
+    events with fewer than 2 significant comparisons score 0
+    """
+    scored = np.sum(significant, axis=1)>1
+    t = pd.DataFrame({"compressed_ID":events, 
+                      "M":np.where(scored, M, 0), 
+                      "MZ":np.where(scored, MZ, 0)},
+                     columns=["compressed_ID", "M", "MZ"])
     return t
 
 
@@ -57,6 +76,9 @@ if __name__=="__main__":
     parser.add_argument("--MISO_ids")
     parser.add_argument("--type")
     parser.add_argument("--fn_out")
+    parser.add_argument("--n_permutations", type=int, default=0, 
+                        help="MZ from this many random sign flips, default the exact null")
+    parser.add_argument("--seed", type=int, default=0)
     o = parser.parse_args()
     
     T_ids = pd.read_csv(o.MISO_ids, header=0,sep="\t")
@@ -101,7 +123,12 @@ if __name__=="__main__":
             psi_T=t[['sample1_posterior_mean','sample2_posterior_mean']]
             psi_T.columns = [s1,s2]
         
-    T_MZ = get_M_scores(o.sample_order, t_by_comparison, events, o.BF_cutoff)
+    T_MZ = get_M_scores(o.sample_order, 
+                        t_by_comparison, 
+                        events, 
+                        o.BF_cutoff, 
+                        o.n_permutations, 
+                        o.seed)
     
     """now, join T_MZ"""
 
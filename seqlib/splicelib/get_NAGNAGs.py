@@ -9,8 +9,16 @@ import pdb
 from sys import stderr
 import numpy as np
 
-def get_nagnags(all_juncs, strand, FOUT_juncs, FOUT_inf):
-    
+def get_nagnag_table(all_juncs, strand, pair_with_first=False, max_size=None):
+    """
+    pairs of junctions on strand sharing a 5' splice site. Junctions are
+    sorted by contig, 5'ss, 3'ss and each junction is paired with the one
+    before it in its 5'ss run, or with the first of the run if
+    pair_with_first. Pairs whose acceptors are more than max_size apart
+    are dropped. Returns the events (contig, ss_5p, ss_3p_1, ss_3p_2,
+    ss_3p_prox, ss_3p_dist, strand, size; ss_3p_1 is the later junction of
+    the pair) and the junctions of each event, in event order
+    """
     if strand == "-": 
         ss_5p_key = "j_right" 
         ss_3p_key = "j_left"
@@ -19,42 +27,65 @@ def get_nagnags(all_juncs, strand, FOUT_juncs, FOUT_inf):
         ss_3p_key = "j_right"
 
     juncs = all_juncs[all_juncs["strand"]==strand]
-    juncs = juncs.sort(['contig',ss_5p_key, ss_3p_key])
-    prev_ss_5p = None
-    prev_ss_3p = None
-    for i, row in juncs.iterrows():
-        ss_5p = row[ss_5p_key]
-        ss_3p = row[ss_3p_key]
-        contig = row['contig']
-        if prev_ss_5p and ss_5p == prev_ss_5p:
-            #print contig, ss_5p, ss_3p, prev_ss_3p, 
-            if strand == "+":
-                j_left1, j_right1 = ss_5p, prev_ss_3p
-                j_left2, j_right2 = ss_5p, ss_3p
-            else:
-                j_left1, j_right1 = prev_ss_3p, ss_5p
-                j_left2, j_right2 = ss_3p, ss_5p 
-            size = abs(ss_3p-prev_ss_3p)
-            
-            FOUT_inf.write("{contig}\t{ss_5p}\t{ss_3p_1}\t{ss_3p_2}\t{strand}\t{size}\n".format(contig=contig,
-                                                                                                ss_5p=ss_5p,
-                                                                                                ss_3p_1=ss_3p,
-                                                                                                ss_3p_2=prev_ss_3p,
-                                                                                                strand=strand,
-                                                                                                size=size))
-            FOUT_juncs.write("{contig}\t{j_left}\t{j_right}\t{strand}\n".format(contig=contig,
-                                                                      j_left=j_left1,
-                                                                      j_right=j_right1,
-                                                                      strand=strand))
-            FOUT_juncs.write("{contig}\t{j_left}\t{j_right}\t{strand}\n".format(contig=contig,
-                                                                      j_left=j_left2,
-                                                                      j_right=j_right2,
-                                                                      strand=strand))
-            prev_ss_5p = ss_5p
-            prev_ss_3p = ss_3p
-        else: 
-            prev_ss_5p = ss_5p
-            prev_ss_3p = ss_3p
+    juncs = juncs.sort_values(['contig',ss_5p_key, ss_3p_key], kind='mergesort')
+    contigs = juncs['contig'].values
+    ss_5ps = juncs[ss_5p_key].values
+    ss_3ps = juncs[ss_3p_key].values
+
+    same_5p = (contigs[1:]==contigs[:-1]) & (ss_5ps[1:]==ss_5ps[:-1])
+    idxs = np.where(same_5p)[0]+1
+    if pair_with_first:
+        run_starts = np.where(np.r_[True, ~same_5p], np.arange(ss_5ps.shape[0]), 0)
+        prev_idxs = np.maximum.accumulate(run_starts)[idxs]
+    else:
+        prev_idxs = idxs-1
+
+    if max_size is not None:
+        w = np.abs(ss_3ps[idxs]-ss_3ps[prev_idxs]) <= max_size
+        idxs, prev_idxs = idxs[w], prev_idxs[w]
+
+    ss_3p, prev_ss_3p = ss_3ps[idxs], ss_3ps[prev_idxs]
+    if strand == "+":
+        ss_3p_prox, ss_3p_dist = prev_ss_3p, ss_3p
+    else:
+        ss_3p_prox, ss_3p_dist = ss_3p, prev_ss_3p
+    events = pd.DataFrame({"contig":contigs[idxs],
+                           "ss_5p":ss_5ps[idxs],
+                           "ss_3p_1":ss_3p,
+                           "ss_3p_2":prev_ss_3p,
+                           "ss_3p_prox":ss_3p_prox,
+                           "ss_3p_dist":ss_3p_dist,
+                           "strand":strand,
+                           "size":np.abs(ss_3p-prev_ss_3p)},
+                          columns=["contig", 
+                                   "ss_5p", 
+                                   "ss_3p_1", 
+                                   "ss_3p_2", 
+                                   "ss_3p_prox", 
+                                   "ss_3p_dist", 
+                                   "strand", 
+                                   "size"])
+    
+    """
+    the prev junction then the junction of each event
+    """
+    j_idxs = np.c_[prev_idxs, idxs].ravel()
+    event_juncs = pd.DataFrame({"contig":contigs[j_idxs],
+                                "j_left":juncs['j_left'].values[j_idxs],
+                                "j_right":juncs['j_right'].values[j_idxs],
+                                "strand":strand},
+                               columns=["contig", "j_left", "j_right", "strand"])
+    return events, event_juncs
+
+def get_nagnags(all_juncs, strand, FOUT_juncs, FOUT_inf, max_size=None):
+    
+    events, event_juncs = get_nagnag_table(all_juncs, strand, max_size=max_size)
+    events.to_csv(FOUT_inf, 
+                  sep="\t", 
+                  index=False, 
+                  header=False, 
+                  columns=["contig", "ss_5p", "ss_3p_1", "ss_3p_2", "strand", "size"])
+    event_juncs.to_csv(FOUT_juncs, sep="\t", index=False, header=False)
 
 if __name__=="__main__":
 
@@ -63,6 +94,8 @@ if __name__=="__main__":
     parser.add_argument("--fn_out_info")
     parser.add_argument("--fn_input_juncs")
     parser.add_argument("--contig", default=None)
+    parser.add_argument("--max_size", type=int, default=None, 
+                        help="largest distance between the two acceptors of a NAGNAG")
 
     o = parser.parse_args()
 
@@ -80,8 +113,8 @@ if __name__=="__main__":
     if o.contig:
         juncs = juncs[juncs["contig"]==o.contig]
         
-    get_nagnags(juncs, "-", FOUT_juncs, FOUT_inf)
-    get_nagnags(juncs, "+", FOUT_juncs, FOUT_inf)
+    get_nagnags(juncs, "-", FOUT_juncs, FOUT_inf, o.max_size)
+    get_nagnags(juncs, "+", FOUT_juncs, FOUT_inf, o.max_size)
 
     
 
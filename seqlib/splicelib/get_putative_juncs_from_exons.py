@@ -12,16 +12,23 @@ from junction_writer import JunctionWriter
 #import re
 #import operator
 
-def get_juncs(contig, s, e, strand, LR_intron_interval_tree):
-    
-    juncs = []
-    for interval in LR_intron_interval_tree.find(s,e):
-        if interval.start < s and interval.end > e:
-            juncs.append({"contig":contig, "start": interval.start-1, "end":s, "strand":strand})
-            juncs.append({"contig":contig, "start": e-1, "end":interval.end, "strand":strand})
-            juncs.append({"contig":contig, "start": interval.start-1, "end":interval.end, "strand":strand})
-    
-    return juncs
+JUNC_COLS = ["contig", "start", "end", "strand"]
+
+def get_juncs(contig, exons, introns, LR_intron_interval_tree):
+    """
+    for every intron strictly containing an exon, the junctions splicing
+    the exon into the intron and the intron itself, in exon order
+    """
+    e_idxs, i_idxs = LR_intron_interval_tree.find_containing(exons['start'].values, 
+                                                             exons['end'].values)
+    s, e = exons['start'].values[e_idxs], exons['end'].values[e_idxs]
+    i_s, i_e = introns[i_idxs,0], introns[i_idxs,1]
+    juncs = pd.DataFrame({"contig":contig,
+                          "start":np.c_[i_s-1, e-1, i_s-1].ravel(),
+                          "end":np.c_[s, i_e, i_e].ravel(),
+                          "strand":np.repeat(exons['strand'].values[e_idxs], 3)},
+                         columns=JUNC_COLS)
+    return juncs, np.repeat(exons.index.values[e_idxs], 3)
 
 if __name__=="__main__":
     """
@@ -50,20 +57,26 @@ if __name__=="__main__":
 
     splice_graphs_by_contig = sg.init_splice_graphs_from_gff3(o.fn_input_gff, contigs=contigs)
     
-    juncs = []
+    juncs = [pd.DataFrame(columns=JUNC_COLS)]
     for contig, splice_graph in splice_graphs_by_contig.iteritems():
-        seq = fa.get_sequence(contig)
-        #splice_graph.enumerate_splice_junctions(seq)
         curr_exons = exons[exons['contig']==contig]
+        is_fwd = curr_exons['strand']=="+"
         
-        for i, e_row in curr_exons.iterrows():
-            contig, s, e, strand = e_row['contig'], e_row['start'], e_row['end'], e_row['strand']
-            if strand == "+":
-                juncs += get_juncs(contig, s, e, strand, splice_graph.F_LR_intron_interval_tree)
-            else:
-                juncs += get_juncs(contig, s, e, strand, splice_graph.R_LR_intron_interval_tree)
+        F_juncs, F_rows = get_juncs(contig, 
+                                    curr_exons[is_fwd], 
+                                    splice_graph.F_introns, 
+                                    splice_graph.F_LR_intron_interval_tree)
+        R_juncs, R_rows = get_juncs(contig, 
+                                    curr_exons[~is_fwd], 
+                                    splice_graph.R_introns, 
+                                    splice_graph.R_LR_intron_interval_tree)
+        """
+        back in the order of the exons in the input
+        """
+        order = np.argsort(np.r_[F_rows, R_rows], kind='mergesort')
+        juncs.append(pd.concat([F_juncs, R_juncs]).iloc[order])
     
-    T = pd.DataFrame(juncs)
+    T = pd.concat(juncs)
     T.to_csv(o.fn_output_juncs,
              sep="\t", 
              columns = ["contig", "start", "end", "strand"],
@@ -0,0 +1,327 @@
+"""
+streaming GFF3/GTF reader
+
+annotations are read one contig block at a time, every feature that is
+the parent of at least one exon becomes a transcript and the transcripts
+of a block are returned as a TranscriptTable, flat NumPy arrays with the
+exons of transcript i in exons[exon_offsets[i]:exon_offsets[i+1]]
+
+coordinates are 0 based half open like the rest of splicelib (the GFF
+start -1) and exons are sorted left to right regardless of strand
+
+a TranscriptTable is what a SpliceGraph is built from, so it is also what
+is written to the SpliceGraph cache (see splicegraph.get_transcript_tables).
+PARSER_VERSION is part of the cache key, bump it whenever a change here
+changes the tables an annotation is read into
+"""
+
+import gzip
+import hashlib
+import re
+import urllib
+import numpy as np
+import tables
+
+from transcript import Transcript
+
+GFF3_ID = re.compile("(?:^|;)\s*ID=([^;]+)")
+GFF3_PARENT = re.compile("(?:^|;)\s*Parent=([^;]+)")
+GTF_TRANSCRIPT_ID = re.compile('transcript_id\s+"([^"]+)"')
+
+STRANDS = {"+":1, "-":-1}
+
+PARSER_VERSION = 1
+
+INT_COLS = ["strands", "g_starts", "g_ends", "exon_offsets", "exons"]
+STR_COLS = ["types", "feature_IDs", "gene_IDs", "gene_names"]
+
+def open_annotation(fn):
+    if fn.endswith(".gz"):
+        return gzip.open(fn)
+    return open(fn)
+
+def get_checksum(fn, block_size=1<<20):
+    """
+    md5 of the annotation file
+    """
+    md5 = hashlib.md5()
+    F = open(fn, 'rb')
+    block = F.read(block_size)
+    while block:
+        md5.update(block)
+        block = F.read(block_size)
+    F.close()
+    return md5.hexdigest()
+
+def is_gtf(attrs):
+    """
+    GTF attributes are key "value"; pairs, GFF3 key=value
+    """
+    first = attrs.split(";")[0]
+    return not "=" in first and '"' in first
+
+def parse_attributes(attrs, gtf=False):
+    """
+    attribute column to a dict, repeated keys (eg. GTF tag) keep the first
+    value and GFF3 multi-values keep the first of the comma separated list
+    """
+    parsed = {}
+    for field in attrs.strip().split(";"):
+        field = field.strip()
+        if field == "":
+            continue
+        if gtf:
+            k, v = field.split(None, 1)
+            v = v.strip('"')
+        else:
+            k, v = field.split("=", 1)
+            v = urllib.unquote(v.split(",")[0])
+        if not k in parsed:
+            parsed[k] = v
+    return parsed
+
+def iter_contig_blocks(fn, contigs=None):
+    """
+    (contig, rows) for each run of consecutive lines on the same contig,
+    rows are the split feature lines
+    """
+    contigs = contigs and set(contigs) or None
+    curr_contig, rows = None, []
+    for l in open_annotation(fn):
+        if l[0] == "#" or l.strip() == "":
+            if l.startswith("##FASTA"):
+                break
+            continue
+        fields = l.rstrip("\n").split("\t", 8)
+        contig = fields[0]
+        if contigs is not None and not contig in contigs:
+            continue
+        if contig != curr_contig:
+            if rows:
+                yield curr_contig, rows
+            curr_contig, rows = contig, []
+        rows.append(fields)
+    if rows:
+        yield curr_contig, rows
+
+def get_transcript_table(contig, rows):
+    """
+    TranscriptTable of the exon parents in the rows of one contig block,
+    in the order the transcripts first appear
+    """
+    gtf = len(rows) > 0 and is_gtf(rows[0][8])
+
+    feature_rows = {}
+    order = []
+    exons = {}
+    first_exon_rows = {}
+    for fields in rows:
+        _type, attrs = fields[2], fields[8]
+        if _type == "exon":
+            if gtf:
+                m = GTF_TRANSCRIPT_ID.search(attrs)
+                parents = m and [m.group(1)] or []
+            else:
+                m = GFF3_PARENT.search(attrs)
+                parents = m and [urllib.unquote(p) for p in m.group(1).split(",")] or []
+            for parent in parents:
+                if not parent in exons:
+                    exons[parent] = []
+                    first_exon_rows[parent] = fields
+                    if gtf and not parent in feature_rows:
+                        """
+                        GTFs need not have transcript lines
+                        """
+                        feature_rows[parent] = None
+                        order.append(parent)
+                exons[parent].append([int(fields[3])-1, int(fields[4])])
+        elif gtf:
+            if _type != "transcript":
+                continue
+            m = GTF_TRANSCRIPT_ID.search(attrs)
+            if m and feature_rows.get(m.group(1)) is None:
+                if not m.group(1) in feature_rows:
+                    order.append(m.group(1))
+                feature_rows[m.group(1)] = fields
+        else:
+            m = GFF3_ID.search(attrs)
+            if m:
+                ID = urllib.unquote(m.group(1))
+                if not ID in feature_rows:
+                    feature_rows[ID] = fields
+                    order.append(ID)
+
+    t_rows = []
+    for ID in order:
+        if not ID in exons:
+            continue
+        t_exons = sorted(exons[ID])
+        fields = feature_rows[ID]
+        if fields is None:
+            """
+            no transcript line, the attributes and strand come from its
+            first exon
+            """
+            _type, strand = "transcript", first_exon_rows[ID][6]
+            g_start, g_end = t_exons[0][0], max([e[1] for e in t_exons])
+            attrs = parse_attributes(first_exon_rows[ID][8], gtf=True)
+        else:
+            _type, strand = fields[2], fields[6]
+            g_start, g_end = int(fields[3])-1, int(fields[4])
+            attrs = parse_attributes(fields[8], gtf=gtf)
+
+        gene_ID = attrs.get("geneID", attrs.get("gene_id", attrs.get("Parent", ".")))
+        gene_name = attrs.get("gene_name", ".")
+        t_rows.append([_type, ID, gene_ID, gene_name, STRANDS.get(strand, 0), g_start, g_end, t_exons])
+
+    return TranscriptTable.init_from_rows(contig, t_rows)
+
+def iter_transcript_tables(fn, contigs=None):
+    """
+    a TranscriptTable for each contig block of the annotation, a contig
+    split over several blocks is yielded once per block
+    """
+    for contig, rows in iter_contig_blocks(fn, contigs):
+        yield get_transcript_table(contig, rows)
+
+def iter_transcripts(fn, contigs=None):
+    """
+    (contig, transcript dict with an exons array) for every transcript
+    """
+    for t_table in iter_transcript_tables(fn, contigs):
+        for i in xrange(len(t_table)):
+            yield t_table.contig, t_table.get_record(i)
+
+class TranscriptTable(object):
+    """
+    the transcripts of a contig as flat arrays, the exons of transcript i
+    are exons[exon_offsets[i]:exon_offsets[i+1]], s<e, left to right
+    """
+    def __init__(self, contig, **kwargs):
+        self.contig = contig
+        self.types = np.asarray(kwargs["types"], dtype=object)
+        self.feature_IDs = np.asarray(kwargs["feature_IDs"], dtype=object)
+        self.gene_IDs = np.asarray(kwargs["gene_IDs"], dtype=object)
+        self.gene_names = np.asarray(kwargs["gene_names"], dtype=object)
+        self.strands = np.asarray(kwargs["strands"], dtype='int64')
+        self.g_starts = np.asarray(kwargs["g_starts"], dtype='int64')
+        self.g_ends = np.asarray(kwargs["g_ends"], dtype='int64')
+        self.exon_offsets = np.asarray(kwargs["exon_offsets"], dtype='int64')
+        self.exons = np.asarray(kwargs["exons"], dtype='int64').reshape(-1, 2)
+
+    def __len__(self):
+        return self.types.shape[0]
+
+    @classmethod
+    def init_from_rows(cls, contig, t_rows):
+        """
+        t_rows are [type, ID, gene_ID, gene_name, strand, g_start, g_end, exons]
+        """
+        n_exons = [len(row[7]) for row in t_rows]
+        kwargs = {"types":[row[0] for row in t_rows],
+                  "feature_IDs":[row[1] for row in t_rows],
+                  "gene_IDs":[row[2] for row in t_rows],
+                  "gene_names":[row[3] for row in t_rows],
+                  "strands":[row[4] for row in t_rows],
+                  "g_starts":[row[5] for row in t_rows],
+                  "g_ends":[row[6] for row in t_rows],
+                  "exon_offsets":np.r_[0, np.cumsum(n_exons)],
+                  "exons":[e for row in t_rows for e in row[7]]}
+        return cls(contig, **kwargs)
+
+    @classmethod
+    def concat(cls, t_tables):
+        t_tables = list(t_tables)
+        kwargs = {}
+        for col in STR_COLS+["strands", "g_starts", "g_ends", "exons"]:
+            kwargs[col] = np.concatenate([getattr(t, col) for t in t_tables])
+        n_exons = np.concatenate([np.diff(t.exon_offsets) for t in t_tables])
+        kwargs["exon_offsets"] = np.r_[0, np.cumsum(n_exons)]
+        return cls(t_tables[0].contig, **kwargs)
+
+    def take(self, idxs):
+        idxs = np.asarray(idxs, dtype='int64')
+        starts, ends = self.exon_offsets[idxs], self.exon_offsets[idxs+1]
+        n_exons = ends-starts
+        exon_idxs = np.repeat(starts-(np.cumsum(n_exons)-n_exons), n_exons) + np.arange(np.sum(n_exons))
+        kwargs = {"exon_offsets":np.r_[0, np.cumsum(n_exons)],
+                  "exons":self.exons[exon_idxs]}
+        for col in STR_COLS+["strands", "g_starts", "g_ends"]:
+            kwargs[col] = getattr(self, col)[idxs]
+        return TranscriptTable(self.contig, **kwargs)
+
+    def filter(self, features, min_exons=1):
+        """
+        the transcripts of the given feature types with at least min_exons
+        """
+        n_exons = np.diff(self.exon_offsets)
+        keep = np.in1d(self.types, features) & (n_exons >= min_exons)
+        return self.take(np.where(keep)[0])
+
+    def get_exons(self, i):
+        return self.exons[self.exon_offsets[i]:self.exon_offsets[i+1]]
+
+    def get_record(self, i):
+        return {"type":self.types[i],
+                "feature_ID":self.feature_IDs[i],
+                "gene_ID":self.gene_IDs[i],
+                "gene_name":self.gene_names[i],
+                "strand":int(self.strands[i]),
+                "g_start":int(self.g_starts[i]),
+                "g_end":int(self.g_ends[i]),
+                "exons":self.get_exons(i)}
+
+    def get_transcript(self, i):
+        kwargs = self.get_record(i)
+        kwargs.pop("type")
+        kwargs["contig"] = self.contig
+        kwargs["exons"] = kwargs["exons"].tolist()
+        return Transcript(**kwargs)
+
+    def iter_transcripts(self):
+        for i in xrange(len(self)):
+            yield self.get_transcript(i)
+
+    def write(self, fn):
+        h5 = tables.openFile(fn, mode='w')
+        filt = tables.Filters(complevel=5, complib='blosc')
+        h5.root._v_attrs.contig = self.contig
+
+        cols = []
+        for col in STR_COLS:
+            a = getattr(self, col)
+            max_len = max([len(s) for s in a] + [1])
+            cols.append([col, a.astype("S%d"%max_len), tables.StringAtom(max_len)])
+        for col in INT_COLS:
+            cols.append([col, getattr(self, col), tables.Int64Atom()])
+
+        for name, a, atom in cols:
+            c_a = h5.createCArray(h5.root,
+                                  name,
+                                  atom,
+                                  shape=(max(a.shape[0], 1),)+a.shape[1:],
+                                  filters=filt)
+            if a.shape[0]:
+                c_a[:] = a
+        h5.close()
+
+    @classmethod
+    def init_from_h5(cls, fn):
+        h5 = tables.openFile(fn, mode='r')
+        contig = h5.root._v_attrs.contig
+        kwargs = {}
+        for col in STR_COLS+INT_COLS:
+            kwargs[col] = h5.getNode(h5.root, col)[:]
+        h5.close()
+
+        """
+        an empty table is written as one blank row (exon_offsets is never
+        empty)
+        """
+        n = kwargs["exon_offsets"].shape[0]-1
+        for col in STR_COLS+["strands", "g_starts", "g_ends"]:
+            kwargs[col] = kwargs[col][:n]
+        kwargs["exons"] = kwargs["exons"][:kwargs["exon_offsets"][-1]]
+        for col in STR_COLS:
+            kwargs[col] = kwargs[col].astype(object)
+        return cls(contig, **kwargs)
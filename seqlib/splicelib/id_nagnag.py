@@ -8,10 +8,43 @@ from collections import defaultdict
 import splicelib.splicegraph as sg
 
 from junction_writer import JunctionWriter
+from transcript_writer import TranscriptWriter
+import contig_shards as cs
 
 #import re
 #import operator
 
+MX_TYPE = "NAGNAG"
+
+def scan_contigs(o, contigs, out_fns, track_desc=None, bgzip=False, bgzip_juncs=False, cache_key=None):
+    
+    fa = FastaHack(o.fn_fasta)
+    splice_graphs_by_contig = sg.init_splice_graphs_from_gff3(o.fn_input_gff, contigs=contigs, cache_key=cache_key)
+
+    gff_writer = TranscriptWriter(out_fns["gff"], "gff", bgzip=bgzip)
+    novel_gff_writer = TranscriptWriter(out_fns["novel_gff"], "gff", bgzip=bgzip)
+    bed_writer = TranscriptWriter(out_fns["bed"], "bed", header=track_desc, bgzip=bgzip)
+
+    j_writer = JunctionWriter(out_fns["juncs"], bgzip=bgzip_juncs)
+
+    for contig, splice_graph in splice_graphs_by_contig.iteritems():
+        seq = fa.get_sequence(contig)
+        #splice_graph.enumerate_splice_junctions(seq)
+        get_3p=True
+        get_5p=False
+        splice_graph.get_5p_3p_alt_exon(seq, 
+                                        gff_writer, 
+                                        novel_gff_writer, 
+                                        bed_writer, 
+                                        j_writer, 
+                                        get_5p=get_5p,
+                                        get_3p=get_3p,
+                                        n=o.max_alt_exon_len)
+    gff_writer.close()
+    novel_gff_writer.close()
+    bed_writer.close()
+    j_writer.close()
+
 if __name__=="__main__":
 
     parser = argparse.ArgumentParser()
@@ -21,40 +54,24 @@ if __name__=="__main__":
     parser.add_argument("--fn_output_bed_dir", default="bed")
     parser.add_argument("--fn_output_juncs_dir", default="junctions")
     parser.add_argument("--track_desc")
+    parser.add_argument("--bgzip_juncs", action="store_true", default=False)
+    parser.add_argument("--bgzip", action="store_true", default=False, 
+                        help="sort, bgzip and tabix index the gff and bed")
     parser.add_argument("--max_alt_exon_len", default=3, type=int)
+    parser.add_argument("--n_procs", default=1, type=int, 
+                        help="scan contigs in parallel, each into its own shard")
     o = parser.parse_args()
     
     fa = FastaHack(o.fn_fasta)
     
     contigs = [contig for contig in fa.names]
-    
-    splice_graphs_by_contig = sg.init_splice_graphs_from_gff3(o.fn_input_gff, contigs=contigs)
-    mx_type = "NAGNAG"
-
-    F_gff = open("{gff_dir}/{mx_type}.gff".format(gff_dir=o.fn_output_gff_dir,
-                                                  mx_type=mx_type),'w')
-    F_novel_gff = open("{gff_dir}/{mx_type}.novel.gff".format(gff_dir=o.fn_output_gff_dir,
-                                                              mx_type=mx_type),'w')
-    F_bed = open("{bed_dir}/{mx_type}.bed".format(bed_dir=o.fn_output_bed_dir,
-                                                        mx_type=mx_type),'w')
+    mx_type = MX_TYPE
+
+    out_fns = cs.get_out_fns(o.fn_output_gff_dir, o.fn_output_bed_dir, o.fn_output_juncs_dir, mx_type)
     track_desc="""track name="{mx_type}" description="{track_desc} {mx_type}" visibility=2 itemRgb=On\n""".format(track_desc=o.track_desc,
                                                                                                   mx_type=mx_type)
-    F_bed.write(track_desc)
-
-    j_writer = JunctionWriter("{junction_dir}/{mx_type}".format(junction_dir=o.fn_output_juncs_dir,
-                                                                 mx_type=mx_type))
-
-    for contig, splice_graph in splice_graphs_by_contig.iteritems():
-        seq = fa.get_sequence(contig)
-        #splice_graph.enumerate_splice_junctions(seq)
-        get_3p=True
-        get_5p=False
-        splice_graph.get_5p_3p_alt_exon(seq, 
-                                        F_gff, 
-                                        F_novel_gff, 
-                                        F_bed, 
-                                        j_writer, 
-                                        get_5p=get_5p,
-                                        get_3p=get_3p,
-                                        n=o.max_alt_exon_len)
-
+    
+    if o.n_procs>1:
+        cs.run_scan_shards(o, contigs, out_fns, scan_contigs, track_desc=track_desc)
+    else:
+        scan_contigs(o, contigs, out_fns, track_desc=track_desc, bgzip=o.bgzip, bgzip_juncs=o.bgzip_juncs)
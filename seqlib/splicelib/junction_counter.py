@@ -1,4 +1,57 @@
+from array import array
 import numpy as np
+import pandas as pd
+import tables
+
+#cigar ops consuming the reference (M, D, N, =, X), making up blocks (M, =, X)
+#and making up the sequenced read (M, I, S, H, =, X)
+REF_OPS = set([0, 2, 3, 7, 8])
+BLOCK_OPS = set([0, 7, 8])
+READ_OPS = set([0, 1, 4, 5, 7, 8])
+
+def get_read_len(cigar):
+    """
+    length of the read as sequenced, clipped bases included, so trimming
+    (not clipping) is what makes reads differ in length
+    """
+    return sum([l for op, l in cigar if op in READ_OPS])
+
+def get_max_readlen(bam, n_reads=100000):
+    """
+    longest of the first n_reads reads
+    """
+    max_readlen = 0
+    for i, read in enumerate(bam.fetch()):
+        if i == n_reads: 
+            break
+        max_readlen = max(max_readlen, get_read_len(read.cigar or []))
+    return max_readlen
+
+def merge_len_counts(chunks, readlen):
+    """
+    chunks of (junction idxs, read lens, offsets, counts) summed to one
+    entry per distinct junction, read len and offset
+    """
+    idxs, read_lens, offsets, counts = [np.concatenate([c[i] for c in chunks]) for i in xrange(4)]
+    keys = (idxs.astype('int64')*(readlen+1)+read_lens)*(readlen-1)+offsets
+    u_keys, inv = np.unique(keys, return_inverse=True)
+    u_counts = np.bincount(inv, weights=counts, minlength=u_keys.shape[0])
+    rows = u_keys//(readlen-1)
+    return [rows//(readlen+1), rows%(readlen+1), u_keys%(readlen-1), u_counts]
+
+def get_entropy(c_read_counts, max_read_lens, min_o, normalize):
+    """
+    entropy of each row of c_read_counts, optionally divided by the most it
+    could be, log2 of the number of offsets a read of max_read_len can have
+    """
+    t = np.sum(c_read_counts, 1)
+    ps = c_read_counts / np.maximum(t, 1)[:,np.newaxis]
+    lps = np.log(np.where(ps==0, 1, ps))
+    e = -np.sum((ps*lps)/np.log(2), 1)
+    if normalize:
+        n_offsets = max_read_lens-2*min_o+1
+        e = np.where(n_offsets>1, e/np.log2(np.maximum(n_offsets, 2)), 0)
+    return e
 
 class JunctionCounter(object):
     """
@@ -7,6 +60,11 @@ class JunctionCounter(object):
     4567|   |
       ---    --
     
+    readlen is the longest read counted, read_counts is indexed by
+    read_len-j_position_in_read-1 of each read (its right overhang - 1) so
+    reads of any length up to readlen can be added. len_counts holds the
+    same histogram per read length, so the min overhang can be applied to
+    both ends of each read
     """
     def __init__(self, junc, readlen):
         self.junc_l = junc[1]
@@ -15,35 +73,43 @@ class JunctionCounter(object):
         self.wnd_start = self.junc_l - (readlen-2)
         self.readlen = readlen
         self.read_counts = np.zeros(readlen-1)
+        self.len_counts = {}
+        self.max_read_len = 0
     
-    def add_read(self, j_position_in_read):
-        self.read_counts[self.readlen-j_position_in_read-1]+=1
+    def add_read(self, j_position_in_read, read_len=None):
+        if read_len is None:
+            read_len = self.readlen
+        offset = read_len-j_position_in_read-1
+        if read_len > self.readlen or offset < 0 or offset >= self.readlen-1: 
+            return
+        if not read_len in self.len_counts:
+            self.len_counts[read_len] = np.zeros(self.readlen-1)
+        self.len_counts[read_len][offset]+=1
+        self.read_counts[offset]+=1
+        self.max_read_len = max(self.max_read_len, read_len)
     
-    def calc_entropy(self, min_o=1):
+    def get_c_read_counts(self, min_o):
         """
-        min_overlap MUST be at least 1
+        read_counts of the reads overhanging both sides of the junction by
+        at least min_o, min_overlap MUST be at least 1
         """
         assert min_o>=1
-        l = self.read_counts.shape[0]
-        c_read_counts = self.read_counts[min_o-1:l+1-min_o]
-        t = np.sum(c_read_counts)
-        if t==0: return 0
-        ps = c_read_counts / t
-        lps = np.log(ps)
-        lps[ps==0]=0
-        e = -np.sum((ps*lps)/np.log(2))
-        return e
+        c_read_counts = np.zeros(self.readlen-1)
+        for read_len, counts in self.len_counts.iteritems():
+            wnd = slice(min_o-1, max(read_len-min_o, min_o-1))
+            c_read_counts[wnd] += counts[wnd]
+        return c_read_counts
+
+    def calc_entropy(self, min_o=1, normalize=False):
+        c_read_counts = self.get_c_read_counts(min_o)
+        if np.sum(c_read_counts)==0: return 0
+        return get_entropy(c_read_counts[np.newaxis,:], 
+                           np.array([self.max_read_len]), 
+                           min_o, 
+                           normalize)[0]
     
     def n_supporting_reads(self, min_o=1): 
-        """
-        min_overlap MUST be at least 1
-        """
-        assert min_o>=1
-        l = self.read_counts.shape[0]
-        c_read_counts = self.read_counts[min_o-1:l+1-min_o]
-        t = np.sum(c_read_counts)
-        return t
-
+        return np.sum(self.get_c_read_counts(min_o))
 
     def min_lr_overhang(self):
         """
@@ -54,8 +120,287 @@ class JunctionCounter(object):
         0123
            -----
         """
-        w_reads = np.where(self.read_counts!=0)[0]
-        if w_reads.shape[0]==0: return 0
-        max_l = self.readlen-np.amin(w_reads)+1
-        max_r = np.amax(w_reads)+1
+        max_l, max_r = 0, 0
+        for read_len, counts in self.len_counts.iteritems():
+            w_reads = np.where(counts!=0)[0]
+            if w_reads.shape[0]==0: continue
+            max_l = max(max_l, read_len-np.amin(w_reads)+1)
+            max_r = max(max_r, np.amax(w_reads)+1)
         return min(max_l, max_r)
+
+
+class JunctionCounterMatrix(object):
+    """
+    the read_counts of many junctions as one junctions x offsets array,
+    row i is what JunctionCounter(juncs[i], readlen).read_counts would be.
+    juncs are (contig, j_left, j_right, strand). max_read_lens is the
+    longest read added to each junction and len_counts the per read length
+    histograms as (junction idxs, read lens, offsets, counts)
+    """
+    def __init__(self, juncs, readlen, read_counts=None, max_read_lens=None, len_counts=None):
+        self.contigs = np.array([j[0] for j in juncs], dtype=object)
+        self.j_lefts = np.array([j[1] for j in juncs], dtype='int64')
+        self.j_rights = np.array([j[2] for j in juncs], dtype='int64')
+        self.strands = np.array([j[3] for j in juncs], dtype=object)
+        self.n = self.j_lefts.shape[0]
+        self.readlen = readlen
+        
+        if read_counts is None:
+            read_counts = np.zeros((self.n, readlen-1))
+            max_read_lens = np.zeros(self.n, dtype='int64')
+        elif max_read_lens is None:
+            max_read_lens = np.repeat(readlen, self.n)
+        assert read_counts.shape == (self.n, readlen-1)
+        self.read_counts = read_counts
+        self.max_read_lens = max_read_lens
+
+        if len_counts is None:
+            """
+            without per length counts (eg. from an older h5) each junction's
+            reads are taken to be its longest read's length
+            """
+            idxs, offsets = np.nonzero(read_counts)
+            len_counts = [idxs, max_read_lens[idxs], offsets, read_counts[idxs, offsets]]
+        self.len_count_chunks = [merge_len_counts([len_counts], readlen)]
+    
+    def add_reads(self, idxs, j_positions_in_read, read_lens=None):
+        """
+        add_read for many reads at once, reads longer than readlen or whose
+        junction position falls outside the read are dropped
+        """
+        idxs = np.asarray(idxs, dtype='int64')
+        if read_lens is None:
+            read_lens = np.repeat(self.readlen, idxs.shape[0])
+        read_lens = np.asarray(read_lens, dtype='int64')
+        offsets = read_lens-np.asarray(j_positions_in_read)-1
+        w = (read_lens<=self.readlen) & (offsets>=0) & (offsets<self.readlen-1)
+        np.add.at(self.read_counts, (idxs[w], offsets[w]), 1)
+        np.maximum.at(self.max_read_lens, idxs[w], read_lens[w])
+        self.len_count_chunks.append(merge_len_counts([[idxs[w], read_lens[w], offsets[w], np.ones(np.sum(w))]], 
+                                                      self.readlen))
+        return np.sum(~w)
+    
+    def get_len_counts(self):
+        """
+        the per read length histograms, one entry per junction, read len
+        and offset with reads
+        """
+        if len(self.len_count_chunks) > 1:
+            self.len_count_chunks = [merge_len_counts(self.len_count_chunks, self.readlen)]
+        return self.len_count_chunks[0]
+    
+    def get_counter(self, i):
+        counter = JunctionCounter([self.contigs[i], self.j_lefts[i], self.j_rights[i]], 
+                                  self.readlen)
+        counter.read_counts = self.read_counts[i]
+        counter.max_read_len = self.max_read_lens[i]
+
+        idxs, read_lens, offsets, counts = self.get_len_counts()
+        w = idxs==i
+        for read_len in np.unique(read_lens[w]):
+            w_len = w & (read_lens==read_len)
+            counter.len_counts[read_len] = np.zeros(self.readlen-1)
+            counter.len_counts[read_len][offsets[w_len]] = counts[w_len]
+        return counter
+    
+    def get_c_read_counts(self, min_o):
+        """
+        read_counts of the reads overhanging both sides of their junction
+        by at least min_o (see JunctionCounter.get_c_read_counts)
+        """
+        assert min_o>=1
+        idxs, read_lens, offsets, counts = self.get_len_counts()
+        w = (offsets>=min_o-1) & (read_lens-offsets-1>=min_o)
+        c_read_counts = np.zeros(self.read_counts.shape)
+        np.add.at(c_read_counts, (idxs[w], offsets[w]), counts[w])
+        return c_read_counts
+
+    def calc_entropy(self, min_o=1, normalize=False):
+        return get_entropy(self.get_c_read_counts(min_o), 
+                           self.max_read_lens, 
+                           min_o, 
+                           normalize)
+    
+    def n_supporting_reads(self, min_o=1): 
+        return np.sum(self.get_c_read_counts(min_o), 1)
+    
+    def min_lr_overhang(self):
+        """
+        JunctionCounter.min_lr_overhang of every junction, the left and
+        right maxima are taken over reads of every length
+        """
+        idxs, read_lens, offsets, counts = self.get_len_counts()
+        max_l = np.zeros(self.n, dtype='int64')
+        max_r = np.zeros(self.n, dtype='int64')
+        np.maximum.at(max_l, idxs, read_lens-offsets+1)
+        np.maximum.at(max_r, idxs, offsets+1)
+        return np.minimum(max_l, max_r)
+    
+    def pileup(self):
+        """
+        read counts at each offset summed over all junctions
+        """
+        return np.sum(self.read_counts, 0)
+
+    def get_table(self, min_o=1, normalize=False):
+        """
+        contig, j_left, j_right, strand, entropy, min_overhang per junction
+        """
+        return pd.DataFrame({"contig":self.contigs,
+                             "j_left":self.j_lefts,
+                             "j_right":self.j_rights,
+                             "strand":self.strands,
+                             "entropy":self.calc_entropy(min_o, normalize),
+                             "min_overhang":self.min_lr_overhang()},
+                            columns=["contig", 
+                                     "j_left", 
+                                     "j_right", 
+                                     "strand", 
+                                     "entropy", 
+                                     "min_overhang"])
+
+    def write(self, fn):
+        h5 = tables.openFile(fn, mode='w')
+        filt = tables.Filters(complevel=5, complib='blosc')
+        h5.root._v_attrs.readlen = self.readlen
+        
+        len_idxs, len_read_lens, len_offsets, len_counts = self.get_len_counts()
+        h5.root._v_attrs.n_len_counts = len_counts.shape[0]
+        max_len = max([len(c) for c in self.contigs] + [1])
+        cols = [["contig", self.contigs.astype("S%d"%max_len), tables.StringAtom(max_len)],
+                ["j_left", self.j_lefts, tables.Int64Atom()],
+                ["j_right", self.j_rights, tables.Int64Atom()],
+                ["strand", self.strands.astype("S1"), tables.StringAtom(1)],
+                ["read_counts", self.read_counts.astype('uint32'), tables.UInt32Atom()],
+                ["max_read_lens", self.max_read_lens, tables.Int64Atom()],
+                ["len_idxs", len_idxs, tables.Int64Atom()],
+                ["len_read_lens", len_read_lens, tables.Int64Atom()],
+                ["len_offsets", len_offsets, tables.Int64Atom()],
+                ["len_counts", len_counts.astype('uint32'), tables.UInt32Atom()]]
+
+        for name, a, atom in cols:
+            c_a = h5.createCArray(h5.root, 
+                                  name, 
+                                  atom, 
+                                  shape=(max(a.shape[0], 1),)+a.shape[1:], 
+                                  filters=filt)
+            if a.shape[0]:
+                c_a[:] = a
+        h5.close()
+    
+    @classmethod
+    def init_from_h5(cls, fn):
+        h5 = tables.openFile(fn, mode='r')
+        readlen = h5.root._v_attrs.readlen
+        n = h5.root.j_left.shape[0]
+        juncs = zip(h5.root.contig[:], 
+                    h5.root.j_left[:], 
+                    h5.root.j_right[:], 
+                    h5.root.strand[:])
+        read_counts = h5.root.read_counts[:].astype(float)
+        max_read_lens = None
+        if "max_read_lens" in h5.root:
+            max_read_lens = h5.root.max_read_lens[:]
+        len_counts = None
+        if "len_counts" in h5.root:
+            n_len_counts = h5.root._v_attrs.n_len_counts
+            len_counts = [h5.root.len_idxs[:n_len_counts], 
+                          h5.root.len_read_lens[:n_len_counts], 
+                          h5.root.len_offsets[:n_len_counts], 
+                          h5.root.len_counts[:n_len_counts].astype(float)]
+        h5.close()
+        
+        """
+        an empty matrix is written as one blank row
+        """
+        if n == 1 and juncs[0][0] == "":
+            juncs, read_counts = [], read_counts[:0]
+            if max_read_lens is not None:
+                max_read_lens = max_read_lens[:0]
+        return cls(juncs, readlen, read_counts, max_read_lens, len_counts)
+
+
+def get_read_juncs(bam, contig, start=None, end=None):
+    """
+    every spliced junction (N) of every read on contig (or overlapping
+    start-end of it) in one pass. Returns j_left (last base of the left
+    block), j_right (first base of the right block), the aligned read bases
+    before the junction (the same junction and position the read.blocks
+    walk gave) and the length of the read (see get_read_len). Junctions are
+    gathered in C long arrays rather than lists of python ints
+    """
+    j_lefts, j_rights, read_positions, read_lens = array('l'), array('l'), array('l'), array('l')
+    for read in bam.fetch(reference=contig, start=start, end=end):
+        cigar = read.cigar
+        if len(cigar) < 3:
+            continue
+        ref_pos = read.pos
+        read_pos = 0
+        n_juncs = len(j_lefts)
+        for op, l in cigar:
+            if op == 3:
+                j_lefts.append(ref_pos-1)
+                j_rights.append(ref_pos+l)
+                read_positions.append(read_pos)
+            if op in REF_OPS:
+                ref_pos += l
+            if op in BLOCK_OPS:
+                read_pos += l
+        read_lens.extend(array('l', [get_read_len(cigar)])*(len(j_lefts)-n_juncs))
+
+    return tuple([np.frombuffer(a, dtype='l').astype('int64') 
+                  for a in [j_lefts, j_rights, read_positions, read_lens]])
+
+def count_juncs(junc_matrix, idxs, read_juncs):
+    """
+    add the read junctions to rows idxs of junc_matrix (unique junctions
+    of one contig and strand) in bulk, by joining the read junctions
+    against the sorted junction keys. Returns the number of reads dropped
+    for being longer than the matrix readlen
+    """
+    j_lefts, j_rights, read_positions, read_lens = read_juncs
+    if idxs.shape[0] == 0 or j_lefts.shape[0] == 0:
+        return 0
+
+    junc_ls = junc_matrix.j_lefts[idxs]
+    junc_rs = junc_matrix.j_rights[idxs]
+    stride = max(np.amax(junc_rs), np.amax(j_rights)) + 1
+    junc_keys = junc_ls*stride + junc_rs
+    read_keys = j_lefts*stride + j_rights
+
+    order = np.argsort(junc_keys)
+    sorted_keys = junc_keys[order]
+    idx = np.minimum(np.searchsorted(sorted_keys, read_keys), sorted_keys.shape[0]-1)
+    w = sorted_keys[idx] == read_keys
+    return junc_matrix.add_reads(idxs[order[idx[w]]], read_positions[w], read_lens[w])
+
+def get_event_psis(bam, events, readlen, min_overhang):
+    """
+    psi of events that choose between two junctions, 1 and 2 (the prox and
+    dist junctions of a NAGNAG, or the two junctions of an A3SS/A5SS),
+    given as a DataFrame with contig, j_left_1, j_right_1, j_left_2,
+    j_right_2. The reads of each contig are walked once for all of its
+    events, fetching only the span the events cover. Returns psi = n_1/(n_1+n_2) (0 with no reads), n_1 and n_2
+    """
+    contigs = events['contig'].values
+    n_1 = np.zeros(contigs.shape[0], dtype='int64')
+    n_2 = np.zeros(contigs.shape[0], dtype='int64')
+
+    for contig in pd.unique(contigs):
+        w = np.where(contigs==contig)[0]
+        j_lefts = np.r_[events['j_left_1'].values[w], events['j_left_2'].values[w]].astype('int64')
+        j_rights = np.r_[events['j_right_1'].values[w], events['j_right_2'].values[w]].astype('int64')
+        stride = np.amax(j_rights)+1
+        keys, junc_idxs = np.unique(j_lefts*stride+j_rights, return_inverse=True)
+        juncs = [tuple([contig, k//stride, k%stride, "."]) for k in keys]
+
+        junc_matrix = JunctionCounterMatrix(juncs, readlen)
+        read_juncs = get_read_juncs(bam, contig, int(np.amin(j_lefts)), int(np.amax(j_rights))+1)
+        count_juncs(junc_matrix, np.arange(junc_matrix.n), read_juncs)
+        n = junc_matrix.n_supporting_reads(min_overhang)[junc_idxs]
+        n_1[w] = n[:w.shape[0]]
+        n_2[w] = n[w.shape[0]:]
+    
+    t = n_1+n_2
+    psi = np.where(t==0, 0, n_1/np.maximum(t, 1).astype(float))
+    return psi, n_1, n_2
@@ -2,95 +2,69 @@ import argparse
 import pdb
 import time
 import numpy as np
+import pandas as pd
+from cStringIO import StringIO
 from fastahack import FastaHack
-from collections import defaultdict
-import BCBio.GFF as GFF
-import collections
 
-from bx.intervals.cluster import ClusterTree
-import time
 from junction_writer import JunctionWriter
 import pysam
+from sys import stderr
 
-from guppy import hpy
-from junction_counter import JunctionCounter
+from utils.intervaltools import get_clusters
+from junction_counter import JunctionCounterMatrix, get_max_readlen, get_read_juncs, count_juncs
 
 #was calculated using the following equations:
 #    pi = reads at offset i / total reads to junction window
 #    Entopy = - sumi(pi * log(pi) / log2)
 
-def get_junction_entropy(contig, start, end, juncs, bam, readlen, entropy_min_overhang, FOUT):
-    
-    ##!!! NEED TO DO SOMETHING WHEN NOTHIN IN THE FILE!
-    
-    #for pcol in bam.pileup(reference=contig, start = start, end = end):
-    read_count_vect = np.zeros(readlen-1)
-    junction_inf = {}
-    strand = juncs[0][-1]
-
-    for junc in juncs:
-        junction_inf[tuple([junc[1],junc[2]])] = JunctionCounter(junc, readlen)
-    
-    ## 
-    #for junc in juncs:
-    
-    #pdb.set_trace()
-    #print junction_inf.keys()
-    for read in bam.fetch(reference=contig, start = start, end = end):
-        read_juncs = []
-        curr_read_pos = 0
-        for i in xrange(1,len(read.blocks)):
-            read_junc = tuple([read.blocks[i-1][1]-1, read.blocks[i][0]])
-            curr_read_pos += read.blocks[i-1][1]-read.blocks[i-1][0]
-            #print read.blocks
-            if read_junc in junction_inf: 
-                junction_inf[read_junc].add_read(curr_read_pos)
-        del read
-
-    #pdb.set_trace()
-    for junc, inf in junction_inf.iteritems():
-        e = inf.calc_entropy(entropy_min_overhang)
-        read_count_vect+=inf.read_counts
-        min_overhang = inf.min_lr_overhang()
-        FOUT.write("{contig}\t{j_l}\t{j_r}\t{strand}\t"
-                    "{entropy}\t{min_overhang}\n".format(contig=contig,
-                                                         j_l = junc[0],
-                                                         j_r = junc[1],
-                                                         strand = strand,
-                                                         entropy=e,
-                                                         min_overhang = min_overhang))
-        del inf
-        
-    return read_count_vect
 #import re
 #import operator
 def get_juncs(tbx, contig):
-    if not contig in tbx.contigs:
-        return
+    """
+    j_lefts, j_rights and strands of the junctions of contig
+    """
+    lines = []
+    if contig in tbx.contigs:
+        lines = list(tbx.fetch(contig))
+    if len(lines) == 0:
+        return np.zeros(0, dtype='int64'), np.zeros(0, dtype='int64'), np.zeros(0, dtype=object)
+    T = pd.read_csv(StringIO("\n".join(lines)), sep="\t", header=None, usecols=[1, 2, 3])
+    return T[1].values.astype('int64'), T[2].values.astype('int64'), T[3].values.astype(object)
 
-    for c in tbx.fetch(contig, parser=pysam.asTuple()):
-        yield c[0], int(c[1]), int(c[2]), c[3]
+def get_clustered_juncs(j_lefts, j_rights, min_juncs=2):
+    """
+    the unique junctions, sorted, of the clusters of overlapping junctions
+    with at least min_juncs junction lines (as ClusterTree(0, min_juncs),
+    so a junction listed twice is a cluster). Sorted once by left, a
+    junction starts a new cluster when it starts after the furthest right
+    so far
+    """
+    order = np.lexsort((j_rights, j_lefts))
+    j_lefts, j_rights = j_lefts[order], j_rights[order]
+    labels, c_starts, c_ends = get_clusters(j_lefts, j_rights)
+    keep = np.bincount(labels)[labels] >= min_juncs
+    j_lefts, j_rights = j_lefts[keep], j_rights[keep]
+    uniq = np.r_[True, (j_lefts[1:]!=j_lefts[:-1]) | (j_rights[1:]!=j_rights[:-1])][:j_lefts.shape[0]]
+    return j_lefts[uniq], j_rights[uniq]
 
-def get_cluster_trees(tbx_juncs, contigs):
-    
-    junc_clusts_by_strand_contigs = {"+":collections.defaultdict(lambda:
-                                        ClusterTree(0,2)), 
-                                     "-" :collections.defaultdict(lambda:
-                                        ClusterTree(0,2))}
-    id=0
-    juncs_by_id = {}
+def get_junction_matrix(tbx_juncs, contigs, readlen):
+    """
+    a JunctionCounterMatrix over the unique clustered junctions and the
+    rows of each (contig, strand)
+    """
+    juncs = []
+    idxs_by_contig_strand = {}
     for contig in contigs:
-        for junc in get_juncs(tbx_juncs, contig):
-            contig, s, e, strand = junc
-            junc_clusts_by_strand_contigs[strand][contig].insert(s,e,id)
-            juncs_by_id[id] = junc
-            id+=1
-
-    return dict(junc_clusts_by_strand_contigs), juncs_by_id
+        j_lefts, j_rights, strands = get_juncs(tbx_juncs, contig)
+        for strand in ["+", "-"]:
+            w = strands == strand
+            c_lefts, c_rights = get_clustered_juncs(j_lefts[w], j_rights[w])
+            if c_lefts.shape[0] == 0:
+                continue
+            idxs_by_contig_strand[tuple([contig, strand])] = np.arange(len(juncs), len(juncs)+c_lefts.shape[0])
+            juncs += [tuple([contig, l, r, strand]) for l, r in zip(c_lefts.tolist(), c_rights.tolist())]
 
-def get_readlen(bam):
-    for read in bam.fetch():
-        return read.rlen
+    return JunctionCounterMatrix(juncs, readlen), idxs_by_contig_strand
 
 if __name__=="__main__":
 
@@ -99,8 +73,15 @@ if __name__=="__main__":
     parser.add_argument("--fn_juncs")
     parser.add_argument("--fn_bam")
     parser.add_argument("--fn_output")
+    parser.add_argument("--fn_counts", default=None, 
+                        help="also write the junction x offset read counts here (h5)")
     parser.add_argument("--contigs", default=None)
     parser.add_argument("--entropy_min_overhang", type=int, default=8)
+    parser.add_argument("--max_readlen", type=int, default=None, 
+                        help="longest read (clipped bases included) to count, default the longest "
+                             "of the first 100000 reads, longer reads are skipped")
+    parser.add_argument("--normalize_entropy", action="store_true", default=False, 
+                        help="divide entropies by the most a junction's reads allow")
     o = parser.parse_args()
     
     FOUT = open(o.fn_output, 'w')
@@ -115,31 +96,39 @@ if __name__=="__main__":
         inc_contigs = o.contigs.split(":")
         contigs = inc_contigs
 
-    junc_cluster_trees, juncs_by_id = get_cluster_trees(tbx_juncs, contigs)
     """
     Vectors are readlen -1 because you need at least one base overlapping the
     junction
     """
     
-    readlen = get_readlen(bam)
-    total_read_count_vect = np.zeros(readlen-1)
-    junction_clusts_assessed = 0 
-    for strand, junc_clusters_by_contig in junc_cluster_trees.iteritems():
-        print strand
-        for contig, junc_clusters in junc_clusters_by_contig.iteritems():
-            print contig
-            t=time.time()
-            for start, end, junction_ids in junc_clusters.getregions():
-                junction_clusts_assessed += 1 
-                juncs = [juncs_by_id[i] for i in junction_ids]
-                total_read_count_vect += get_junction_entropy(contig, 
-                                                              start, 
-                                                              end, 
-                                                              juncs, 
-                                                              bam, 
-                                                              readlen, 
-                                                              o.entropy_min_overhang, 
-                                                              FOUT)
+    readlen = o.max_readlen or get_max_readlen(bam)
+    n_dropped = 0
+    junc_matrix, idxs_by_contig_strand = get_junction_matrix(tbx_juncs, 
+                                                             contigs, 
+                                                             readlen)
+    for contig in contigs:
+        print contig
+        t=time.time()
+        read_juncs = None
+        for strand in ["+", "-"]:
+            if not tuple([contig, strand]) in idxs_by_contig_strand:
+                continue
+            if read_juncs is None:
+                read_juncs = get_read_juncs(bam, contig)
+            n_dropped += count_juncs(junc_matrix, 
+                                     idxs_by_contig_strand[tuple([contig, strand])], 
+                                     read_juncs)
+    
+    if n_dropped:
+        stderr.write("skipped %d junction reads longer than %d\n"%(n_dropped, readlen))
+    
+    if o.fn_counts:
+        junc_matrix.write(o.fn_counts)
+
+    T = junc_matrix.get_table(o.entropy_min_overhang, o.normalize_entropy)
+    T.to_csv(FOUT, sep="\t", index=False, header=False)
+
+    total_read_count_vect = junc_matrix.pileup()
     FOUT_pileup.write("position\tread_count\n")
     for i in xrange(len(total_read_count_vect)):
         FOUT_pileup.write("{pos}\t{count}\n".format(pos=i,count=total_read_count_vect[i]))
@@ -2,17 +2,83 @@ import argparse
 import pdb
 import time
 import numpy as np
-from fastahack import FastaHack
-from collections import defaultdict
-import BCBio.GFF as GFF
 import collections
 
-from bx.intervals.cluster import ClusterTree
-import time
-from junction_writer import JunctionWriter
-import pysam
 import pandas as pd
 from sys import stderr
+from junction_counter import JunctionCounterMatrix
+
+KEY_COLS = ["contig", "j_left", "j_right", "strand"]
+
+def get_junction_ids(tables):
+    """
+    an id for each row of each table, the same for the same contig,
+    j_left, j_right, strand in any table, numbered in the order junctions
+    are first seen. Returns the ids per table and the key columns of the
+    junctions
+    """
+    T = pd.concat([t[KEY_COLS] for t in tables], ignore_index=True)
+    contig_codes, contigs = pd.factorize(T['contig'])
+    strand_codes, strands = pd.factorize(T['strand'])
+    lefts, rights = T['j_left'].values, T['j_right'].values
+
+    order = np.lexsort((rights, lefts, strand_codes, contig_codes))
+    keys = np.c_[contig_codes, strand_codes, lefts, rights][order]
+    new = np.r_[True, np.any(keys[1:]!=keys[:-1], axis=1)][:keys.shape[0]]
+    sorted_ids = np.cumsum(new)-1
+
+    """
+    renumber by first row, the order the junctions are first seen in
+    """
+    firsts = order[new]
+    renumber = np.empty(firsts.shape[0], dtype='int64')
+    renumber[np.argsort(firsts)] = np.arange(firsts.shape[0])
+    ids = np.empty(T.shape[0], dtype='int64')
+    ids[order] = renumber[sorted_ids]
+
+    juncs = T.iloc[np.sort(firsts)].reset_index(drop=True)
+    offsets = np.r_[0, np.cumsum([t.shape[0] for t in tables])]
+    return [ids[offsets[i]:offsets[i+1]] for i in xrange(len(tables))], juncs
+
+def get_junction_matrices(tables_by_tissue):
+    """
+    the junctions seen in every tissue (as an inner join of the tables)
+    and junctions x tissues entropy and min_overhang matrices
+    """
+    tables = tables_by_tissue.values()
+    ids, juncs = get_junction_ids(tables)
+    n_juncs, n_tissues = juncs.shape[0], len(tables)
+
+    entropies = np.empty((n_juncs, n_tissues))
+    entropies.fill(np.nan)
+    overhangs = np.empty((n_juncs, n_tissues))
+    overhangs.fill(np.nan)
+    seen = np.zeros((n_juncs, n_tissues), dtype=bool)
+    for j, t in enumerate(tables):
+        entropies[ids[j], j] = t['entropy'].values
+        overhangs[ids[j], j] = t['min_overhang'].values
+        seen[ids[j], j] = True
+
+    """
+    every junction kept has a value in every tissue, so the matrices
+    go back to the dtypes of the tables
+    """
+    in_all = np.all(seen, axis=1)
+    entropies = entropies[in_all].astype(np.result_type(*[t['entropy'].dtype for t in tables]))
+    overhangs = overhangs[in_all].astype(np.result_type(*[t['min_overhang'].dtype for t in tables]))
+    return juncs[in_all].reset_index(drop=True), entropies, overhangs
+
+def get_pileup_matrix(pileups_by_tissue):
+    """
+    positions x tissues read counts, 0 where a tissue has no count
+    """
+    pileups = pileups_by_tissue.values()
+    positions = np.unique(np.concatenate([p[0] for p in pileups]))
+    dtype = np.result_type(*[p[1].dtype for p in pileups])
+    counts = np.zeros((positions.shape[0], len(pileups)), dtype=dtype)
+    for j, (p_positions, p_counts) in enumerate(pileups):
+        counts[np.searchsorted(positions, p_positions), j] = p_counts
+    return positions, counts
 
 if __name__=="__main__":
 
@@ -20,65 +86,61 @@ if __name__=="__main__":
     parser.add_argument("--fn_out")
     parser.add_argument("--fn_filtered_juncs")
     parser.add_argument("--min_entropy", default=1.5, type=float)
-    parser.add_argument("--fn_inputs", nargs="*")
+    parser.add_argument("--fn_inputs", nargs="*", default=[])
+    parser.add_argument("--fn_count_matrices", nargs="*", default=[], 
+                        help="junction_entropy --fn_counts outputs, used in place of "
+                             "the entropy tables and pileups")
+    parser.add_argument("--entropy_min_overhang", type=int, default=8)
+    parser.add_argument("--normalize_entropy", action="store_true", default=False)
     o = parser.parse_args()
    
-    tables_by_tissue = {}
-    pileup_tables_by_tissue = {}
-    entropy_cols = []
-    overhang_cols = []
-    pileup_cols = []
+    tables_by_tissue = collections.OrderedDict()
+    pileups_by_tissue = collections.OrderedDict()
     for f in o.fn_inputs:
         tissue = f.split("/")[-1].split(".")[0]
         t = pd.read_csv(f, 
                         header=None, 
                         delimiter="\t",
-                        names=["contig",
-                               "j_left",
-                               "j_right",
-                               "strand",
-                               "%s_entropy"%tissue,
-                               "%s_min_overhang"%tissue])
+                        names=KEY_COLS+["entropy", "min_overhang"])
         t_pileup = pd.read_csv("%s.pileup"%f, 
                                 header=None, 
                                 skiprows=1, 
                                 delimiter="\t",
-                                names=["position", "read_count_%s"%tissue])
-        pileup_tables_by_tissue[tissue] = t_pileup
-        pileup_cols.append("read_count_%s"%tissue)
-        entropy_cols.append("%s_entropy"%tissue)
-        overhang_cols.append("%s_min_overhang"%tissue)
+                                names=["position", "read_count"])
+        pileups_by_tissue[tissue] = [t_pileup['position'].values, t_pileup['read_count'].values]
         tables_by_tissue[tissue] = t
         print >> stderr, tissue   
     
-    tables = tables_by_tissue.values() 
-    T = tables[0]
-    for i in xrange(1,len(tables)):
-        t = tables[i]
-        T = pd.merge(T, t, on=["contig", "j_left","j_right","strand"])
+    for f in o.fn_count_matrices:
+        tissue = f.split("/")[-1].split(".")[0]
+        junc_matrix = JunctionCounterMatrix.init_from_h5(f)
+        pileup = junc_matrix.pileup()
+        pileups_by_tissue[tissue] = [np.arange(pileup.shape[0]), pileup]
+        tables_by_tissue[tissue] = junc_matrix.get_table(o.entropy_min_overhang, o.normalize_entropy)
+        print >> stderr, tissue   
     
-    pileup_tables = pileup_tables_by_tissue.values() 
-    pileup_T = pileup_tables[0]
-    for i in xrange(1,len(pileup_tables)):
-        t = pileup_tables[i]
-        pileup_T = pd.merge(pileup_T, t, on=["position"],how='outer')
-    pielup_T = pileup_T.fillna(0)
-    pileup_T.to_csv("%s.pileups"%o.fn_out, sep="\t", index=False)
+    tissues = tables_by_tissue.keys()
 
-    cols = T.columns
-    e_cols = sorted([np.where(cols==e)[0][0] for e in entropy_cols])
-    overhang_cols = sorted([np.where(cols==e)[0][0] for e in overhang_cols])
-    
-    all_ents = T.values[:,e_cols]
-    all_overhangs = T.values[:,overhang_cols]
+    positions, counts = get_pileup_matrix(pileups_by_tissue)
+    cols = collections.OrderedDict([["position", positions]])
+    for j, tissue in enumerate(tissues):
+        cols["read_count_%s"%tissue] = counts[:,j]
+    pileup_T = pd.DataFrame(cols)
+    pileup_T.to_csv("%s.pileups"%o.fn_out, sep="\t", index=False)
 
+    juncs, all_ents, all_overhangs = get_junction_matrices(tables_by_tissue)
+    cols = collections.OrderedDict([[col, juncs[col].values] for col in KEY_COLS])
+    for j, tissue in enumerate(tissues):
+        cols["%s_entropy"%tissue] = all_ents[:,j]
+        cols["%s_min_overhang"%tissue] = all_overhangs[:,j]
+    T = pd.DataFrame(cols)
     T.to_csv(o.fn_out, sep="\t", index=False)
     
-    T_filtered = T[(np.sum(all_ents>=o.min_entropy,1)>=1)]
+    T_filtered = juncs[np.any(all_ents>=o.min_entropy, axis=1)]
     T_filtered.to_csv(o.fn_filtered_juncs, 
                       sep="\t", 
                       index=False, 
-                      columns = ["contig", "j_left", "j_right", "strand"], 
+                      columns = KEY_COLS, 
                       header=False) 
 
 
@@ -1,6 +1,12 @@
+import os
+import shutil
+import tempfile
+import heapq
+from itertools import islice
+import numpy as np
+import pysam
 
-
-
+STRANDS = ["+", "-", "."]
 
 class JunctionWriter(object):
     """
@@ -40,35 +46,123 @@ class JunctionWriter(object):
     tophat chrXX\t0\t8\t+
     STAR chrXX\t2\t8\t+
     
+    junctions are filled into a preallocated (max_buffer, 4) int64 buffer
+    of (contig, left, right, strand) rows, spilled to disk as sorted unique
+    runs of max_buffer junctions and merged with duplicates dropped at
+    close, so the files come out sorted by contig and coordinate with each
+    junction once. With bgzip the files are bgzipped and tabix indexed.
     """
-    def __init__(self, fn_prefix):
+    def __init__(self, fn_prefix, max_buffer=5000000, bgzip=False, fill_chunk=100000):
         
-        fn_tophat="%s.tophat.juncs"%fn_prefix
-        fn_STAR="%s.STAR.juncs"%fn_prefix
-        self.F_tophat = open(fn_tophat,'w')
-        self.F_STAR = open(fn_STAR,'w')
+        self.fn_tophat="%s.tophat.juncs"%fn_prefix
+        self.fn_STAR="%s.STAR.juncs"%fn_prefix
+        self.max_buffer = max_buffer
+        self.bgzip = bgzip
         
-        self.junc_tups_output = {}
+        self.tmp_dir = os.path.dirname(os.path.abspath(fn_prefix))
+        self.fn_runs = []
+        self.contig_ids = {}
+        self.buffer = np.empty((max_buffer, 4), dtype='int64')
+        self.n_buffered = 0
+        self.fill_chunk = fill_chunk
+    
+    def get_contig_id(self, contig):
+        if not contig in self.contig_ids:
+            self.contig_ids[contig] = len(self.contig_ids)
+        return self.contig_ids[contig]
 
     def write(self, junc_tups):
+        """
+        fill the buffer a slice of at most fill_chunk junctions at a time,
+        spilling whenever it is full
+        """
+        junc_tups = iter(junc_tups)
+        while True:
+            n_fill = min(self.max_buffer-self.n_buffered, self.fill_chunk)
+            rows = [(self.get_contig_id(contig), left, right, STRANDS.index(strand))
+                    for contig, left, right, strand in islice(junc_tups, n_fill)]
+            if len(rows)==0:
+                break
+            self.buffer[self.n_buffered:self.n_buffered+len(rows)] = rows
+            self.n_buffered += len(rows)
+            if self.n_buffered==self.max_buffer:
+                self.spill()
+    
+    def spill(self):
+        """
+        write the buffer as a unique run of (contig id, left, right,
+        strand) sorted by contig name then left, right and strand
+        """
+        if self.n_buffered==0:
+            return
+        
+        names_by_id = sorted(self.contig_ids, key=self.contig_ids.get)
+        contig_ranks = np.argsort(np.argsort(np.array(names_by_id)))
+        juncs = self.buffer[:self.n_buffered]
+        juncs = juncs[np.lexsort([juncs[:,3], juncs[:,2], juncs[:,1], contig_ranks[juncs[:,0]]])]
+        keep = np.r_[True, np.any(juncs[1:]!=juncs[:-1], 1)]
+        
+        if len(self.fn_runs)==0:
+            self.tmp_dir = tempfile.mkdtemp(prefix=".juncs.", dir=self.tmp_dir)
+        fn_run = "%s/%d.npy"%(self.tmp_dir, len(self.fn_runs))
+        np.save(fn_run, juncs[keep])
+        self.fn_runs.append(fn_run)
+        self.n_buffered = 0
+    
+    def get_run(self, fn_run, names_by_id, chunk=100000):
+        juncs = np.load(fn_run, mmap_mode='r')
+        for i in xrange(0, juncs.shape[0], chunk):
+            for c, l, r, s in juncs[i:i+chunk].tolist():
+                yield names_by_id[c], l, r, s
+
+    def close(self):
+        """
+        runs are merged on contig names, the contig ids are only
+        the order contigs were first seen in
+        """
+        self.spill()
+        self.buffer = None
+        names_by_id = sorted(self.contig_ids, key=self.contig_ids.get)
+        self.write_sorted(heapq.merge(*[self.get_run(fn_run, names_by_id) for fn_run in self.fn_runs]))
+        if len(self.fn_runs)>0:
+            shutil.rmtree(self.tmp_dir)
 
-        o_tophat_junc_lines = []
-        o_STAR_junc_lines = []
-        pattern = "{contig}\t{left}\t{right}\t{strand}"
+    def write_sorted(self, juncs):
+        """
+        write (contig, left, right, strand idx) junctions that are already
+        sorted as the runs are, each junction once, then bgzip and index
+        """
+        F_tophat = open(self.fn_tophat,'w')
+        F_STAR = open(self.fn_STAR,'w')
         
-        for tup in junc_tups:
-            if not tup in self.junc_tups_output:
-                o_tophat_junc_lines.append(pattern.format(contig=tup[0],
-                                                          left = tup[1],
-                                                          right= tup[2],
-                                                          strand = tup[3]))
-                o_STAR_junc_lines.append(pattern.format(contig=tup[0],
-                                                        left = tup[1]+2,
-                                                        right= tup[2],
-                                                        strand = tup[3]))
-                self.junc_tups_output[tup] = True
+        pattern = "{contig}\t{left}\t{right}\t{strand}\n"
+        prev = None
+        for junc in juncs:
+            if junc == prev:
+                continue
+            contig, left, right, strand = junc
+            F_tophat.write(pattern.format(contig=contig,
+                                          left = left,
+                                          right= right,
+                                          strand = STRANDS[strand]))
+            F_STAR.write(pattern.format(contig=contig,
+                                        left = left+2,
+                                        right= right,
+                                        strand = STRANDS[strand]))
+            prev = junc
         
-        if len(o_tophat_junc_lines)>0:
-            self.F_tophat.write("%s\n"%("\n".join(o_tophat_junc_lines)))
-            self.F_STAR.write("%s\n"%("\n".join(o_STAR_junc_lines)))
+        F_tophat.close()
+        F_STAR.close()
 
+        if self.bgzip:
+            self.fn_tophat = pysam.tabix_index(self.fn_tophat, 
+                                               force=True, 
+                                               seq_col=0, 
+                                               start_col=1, 
+                                               end_col=2, 
+                                               zerobased=True)
+            self.fn_STAR = pysam.tabix_index(self.fn_STAR, 
+                                             force=True, 
+                                             seq_col=0, 
+                                             start_col=1, 
+                                             end_col=2)
@@ -9,9 +9,50 @@ import splicelib.splicegraph as sg
 import splicelib.misoutils as mu
 
 from junction_writer import JunctionWriter
+from transcript_writer import index_sorted
+import contig_shards as cs
 #import re
 #import operator
 
+EVENT_TYPES = ["SE", "A3SS", "A5SS", "MXE", "AFE", "ALE", "RI"]
+
+def define_events(o, contigs, contig_sizes, out_dir, bgzip=False, cache_key=None):
+    
+    if o.force_feature:
+        splice_graphs_by_contig = sg.init_splice_graphs_from_gff3(o.fn_input_gff, 
+                                                                  contigs=contigs,
+                                                                  features=[o.force_feature], 
+                                                                  cache_key=cache_key)
+    else:
+        splice_graphs_by_contig = sg.init_splice_graphs_from_gff3(o.fn_input_gff, 
+                                                                  contigs=contigs, 
+                                                                  cache_key=cache_key)
+
+
+    m_util = mu.MisoUtils(sg_by_contig = splice_graphs_by_contig,
+                          contig_sizes = contig_sizes,
+                          fn_info = "{outdir}/info/info.df".format(outdir=out_dir),
+                          bgzip = bgzip)
+    
+    for event_type in EVENT_TYPES:
+        define = getattr(m_util, "define_%s_events"%event_type)
+        define("{outdir}/gff/{event_type}.gff".format(outdir=out_dir, event_type=event_type),
+               "{outdir}/bed/{event_type}.bed".format(outdir=out_dir, event_type=event_type))
+    
+    m_util.output_info()
+
+def make_out_dirs(out_dir):
+    for d in ["gff", "bed", "info"]:
+        if not os.path.exists("{outdir}/{d}".format(outdir=out_dir, d=d)):
+            os.mkdir("{outdir}/{d}".format(outdir=out_dir, d=d))
+
+def define_contig_shard(args):
+    o, contig, contig_size, shard_dir, cache_key = args
+    shard_dir = cs.get_shard_prefix(shard_dir, contig)
+    make_out_dirs(shard_dir)
+    define_events(o, [contig], {contig:contig_size}, shard_dir, cache_key=cache_key)
+    return shard_dir
+
 if __name__=="__main__":
 
     parser = argparse.ArgumentParser()
@@ -21,6 +62,10 @@ if __name__=="__main__":
     parser.add_argument("--fn_out_dir", default="miso_index")
     parser.add_argument("--force_contig", default=None)
     parser.add_argument("--force_feature", default=None)
+    parser.add_argument("--n_procs", default=1, type=int, 
+                        help="define events on contigs in parallel, each into its own shard")
+    parser.add_argument("--bgzip", action="store_true", default=False, 
+                        help="sort, bgzip and tabix index the gff and bed")
     o = parser.parse_args()
     
     fa = FastaHack(o.fn_fasta)
@@ -34,45 +79,23 @@ if __name__=="__main__":
     for contig in contigs:
         contig_sizes[contig] = fa.get_sequence_length(contig)
     
-    if not os.path.exists("{outdir}/gff".format(outdir=o.fn_out_dir)):
-        os.mkdir("{outdir}/gff".format(outdir=o.fn_out_dir))
-    if not os.path.exists("{outdir}/bed".format(outdir=o.fn_out_dir)):
-        os.mkdir("{outdir}/bed".format(outdir=o.fn_out_dir))
-    if not os.path.exists("{outdir}/info".format(outdir=o.fn_out_dir)):
-        os.mkdir("{outdir}/info".format(outdir=o.fn_out_dir))
+    make_out_dirs(o.fn_out_dir)
     
-    if o.force_feature:
-        splice_graphs_by_contig = sg.init_splice_graphs_from_gff3(o.fn_input_gff, 
-                                                                  contigs=contigs,
-                                                                  features=[o.force_feature])
+    if o.n_procs>1:
+        cache_key = sg.cache_transcript_tables(o.fn_input_gff, contigs)
+        shard_dir = cs.make_shard_dir(o.fn_out_dir)
+        shard_dirs = cs.run_shards(define_contig_shard, 
+                                   [tuple([o, contig, contig_sizes[contig], shard_dir, cache_key]) for contig in contigs], 
+                                   o.n_procs)
+        for event_type in EVENT_TYPES:
+            for ext in ["gff", "bed"]:
+                fn = "{ext}/{event_type}.{ext}".format(ext=ext, event_type=event_type)
+                cs.cat_shards(["%s/%s"%(d, fn) for d in shard_dirs], "%s/%s"%(o.fn_out_dir, fn))
+                if o.bgzip:
+                    index_sorted("%s/%s"%(o.fn_out_dir, fn), ext)
+        cs.cat_shards(["%s/info/info.df"%d for d in shard_dirs], 
+                      "%s/info/info.df"%o.fn_out_dir, 
+                      skip_header=True)
+        cs.remove_shard_dir(shard_dir)
     else:
-        splice_graphs_by_contig = sg.init_splice_graphs_from_gff3(o.fn_input_gff, 
-                                                                  contigs=contigs)
-
-
-    m_util = mu.MisoUtils(sg_by_contig = splice_graphs_by_contig,
-                          contig_sizes = contig_sizes,
-                          fn_info = "{outdir}/info/info.df".format(outdir=o.fn_out_dir))
-
-    m_util.define_SE_events("{outdir}/gff/SE.gff".format(outdir=o.fn_out_dir),
-                            "{outdir}/bed/SE.bed".format(outdir=o.fn_out_dir))
-    
-    m_util.define_A3SS_events("{outdir}/gff/A3SS.gff".format(outdir=o.fn_out_dir),
-                              "{outdir}/bed/A3SS.bed".format(outdir=o.fn_out_dir))
-    
-    m_util.define_A5SS_events("{outdir}/gff/A5SS.gff".format(outdir=o.fn_out_dir),
-                              "{outdir}/bed/A5SS.bed".format(outdir=o.fn_out_dir))
-    
-    m_util.define_MXE_events("{outdir}/gff/MXE.gff".format(outdir=o.fn_out_dir),
-                              "{outdir}/bed/MXE.bed".format(outdir=o.fn_out_dir))
-    
-    m_util.define_AFE_events("{outdir}/gff/AFE.gff".format(outdir=o.fn_out_dir),
-                              "{outdir}/bed/AFE.bed".format(outdir=o.fn_out_dir))
-    
-    m_util.define_ALE_events("{outdir}/gff/ALE.gff".format(outdir=o.fn_out_dir),
-                             "{outdir}/bed/ALE.bed".format(outdir=o.fn_out_dir))
-    
-    m_util.define_RI_events("{outdir}/gff/RI.gff".format(outdir=o.fn_out_dir),
-                            "{outdir}/bed/RI.bed".format(outdir=o.fn_out_dir))
-    
-    m_util.output_info()
+        define_events(o, contigs, contig_sizes, o.fn_out_dir, bgzip=o.bgzip)
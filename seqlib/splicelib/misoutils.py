@@ -1,9 +1,10 @@
 import pdb
 import itertools
-import networkx as nx
+import numpy as np
 import pandas as pd
 
 from transcript import Transcript
+from transcript_writer import TranscriptWriter
 
 
 """
@@ -72,10 +73,13 @@ def alpha_code(i):
         prefix=chr(int(i/25)+ord('A'))
     return "%s%s"%(prefix, chr((i%25)+ord('A')))
 
+INFO_COLUMNS = ["ID", "contig", "start", "end", "strand", "exonSize", "geneName", "geneID", "type"]
+
 class MISO_transcript_info(object):
     def __init__(self, fn):
         self.fn = fn
         self.inf_rows = []
+        self.inf_tables = []
         
     def add_info(self, transcript, **kwargs):
         
@@ -95,10 +99,197 @@ class MISO_transcript_info(object):
                               "end":transcript.g_end,
                               "strand":transcript.strand,
                               "exonSize":exonSize})
+    def add_info_table(self, t):
+        """
+        rows of INFO_COLUMNS for many events at once
+        """
+        self.flush_rows()
+        self.inf_tables.append(t)
+
+    def flush_rows(self):
+        if len(self.inf_rows):
+            self.inf_tables.append(pd.DataFrame(self.inf_rows, columns=INFO_COLUMNS))
+            self.inf_rows = []
+
     def output(self):
-        df = pd.DataFrame(self.inf_rows)
-        columns =  ["ID", "contig", "start", "end", "strand", "exonSize", "geneName", "geneID", "type"]
-        df.to_csv(self.fn, sep="\t", index=False, columns = columns)
+        self.flush_rows()
+        if len(self.inf_tables):
+            df = pd.concat(self.inf_tables, ignore_index=True)
+        else:
+            df = pd.DataFrame([], columns=INFO_COLUMNS)
+        df.to_csv(self.fn, sep="\t", index=False, columns = INFO_COLUMNS)
+
+"""
+event enumeration as joins over the splice graph intron and exon tables
+
+whatever the strand, introns are (d, a) donor -> acceptor and exons are
+(a, d) acceptor -> donor, and "upstream" is o*x < o*y with o=-1 on REV.
+Each get_X_events returns the event exons as an (n_events, n_exons, 2)
+array of s<e exons and the exonSize of each event (-1 if none)
+"""
+
+def get_ss_tables(sg, strand):
+    if strand=="REV":
+        introns = pd.DataFrame({"d":sg.R_introns[:,1], "a":sg.R_introns[:,0]})
+        exons = pd.DataFrame({"a":sg.R_exons[:,1], "d":sg.R_exons[:,0]})
+    else:
+        introns = pd.DataFrame({"d":sg.F_introns[:,0], "a":sg.F_introns[:,1]})
+        exons = pd.DataFrame({"a":sg.F_exons[:,0], "d":sg.F_exons[:,1]})
+    o = strand=="REV" and -1 or 1
+    return introns, exons, o
+
+def get_acceptor_pairs(introns, o):
+    """
+    d, a1, a2 for pairs of acceptors of a donor, a1 upstream of a2
+    """
+    t = introns.merge(introns, on="d", suffixes=("1", "2"))
+    return t[o*t['a1'] < o*t['a2']]
+
+def sort_exons(x, y):
+    return np.sort(np.c_[x, y], axis=1)
+
+def get_SE_events(sg, strand):
+    """
+    SE = intron(d->a1) x exon(a1->d2) x intron(d2->a2) x intron(d->a2)
+    """
+    introns, exons, o = get_ss_tables(sg, strand)
+    t = get_acceptor_pairs(introns, o)
+    t = t.merge(exons.rename(columns={"a":"a1", "d":"d2"}), on="a1")
+    t = t.merge(introns.rename(columns={"d":"d2", "a":"a2"}), on=["d2", "a2"])
+    
+    alt_exons = sort_exons(t['a1'], t['d2'])
+    exons = np.stack([sg.get_csxs(t['d'], strand, ss_type_5p=True), 
+                      alt_exons,
+                      sg.get_csxs(t['a2'], strand, ss_type_3p=True)], axis=1)
+    return exons, alt_exons[:,1]-alt_exons[:,0]
+
+def get_A3SS_events(sg, strand):
+    """
+    intron(d->a1) x intron(d->a2) where a1 and a2 start exons ending at
+    the same donor, the alt exon runs from a1 to the donor of the
+    shortest exon at a2
+    """
+    introns, exons, o = get_ss_tables(sg, strand)
+    shared = exons.merge(exons, on="d", suffixes=("1", "2"))[["a1", "a2"]].drop_duplicates()
+    t = get_acceptor_pairs(introns, o).merge(shared, on=["a1", "a2"])
+    
+    ds_exons = sg.get_csxs(t['a2'], strand, ss_type_3p=True)
+    if strand=="FWD":
+        ds_exon_5ps = ds_exons[:,1]
+    else:
+        ds_exon_5ps = ds_exons[:,0]
+    exons = np.stack([sg.get_csxs(t['d'], strand, ss_type_5p=True),
+                      sort_exons(t['a1'], ds_exon_5ps),
+                      ds_exons], axis=1)
+    if strand=="FWD":
+        e_sizes = exons[:,2,0]-exons[:,1,0]
+    else:
+        e_sizes = exons[:,1,1]-exons[:,2,1]
+    return exons, e_sizes
+
+def get_A5SS_events(sg, strand):
+    """
+    intron(d1->a) x intron(d2->a) where d1 and d2 end exons starting at
+    the same acceptor, the alt exon runs from the acceptor of the 
+    shortest exon at d1 to d2
+    """
+    introns, exons, o = get_ss_tables(sg, strand)
+    shared = exons.merge(exons, on="a", suffixes=("1", "2"))[["d1", "d2"]].drop_duplicates()
+    t = introns.merge(introns, on="a", suffixes=("1", "2"))
+    t = t[o*t['d1'] < o*t['d2']].merge(shared, on=["d1", "d2"])
+    
+    us_exons = sg.get_csxs(t['d1'], strand, ss_type_5p=True)
+    if strand=="FWD":
+        us_exon_3ps = us_exons[:,0]
+    else:
+        us_exon_3ps = us_exons[:,1]
+    exons = np.stack([us_exons,
+                      sort_exons(us_exon_3ps, t['d2']),
+                      sg.get_csxs(t['a'], strand, ss_type_3p=True)], axis=1)
+    if strand=="FWD":
+        e_sizes = exons[:,1,1]-exons[:,0,1]
+    else:
+        e_sizes = exons[:,0,0]-exons[:,1,0]
+    return exons, e_sizes
+
+def get_MXE_events(sg, strand):
+    """
+    intron(d->a1) x intron(d->a2) x exon(a1->x1) x exon(a2->x2) x 
+    intron(x1->a3) x intron(x2->a3), dropping a1, a2 pairs whose exons 
+    end at the same donor (an alt 3') or that splice to each other, and 
+    x1, x2 that are last exon boundaries
+    """
+    introns, exons, o = get_ss_tables(sg, strand)
+    if strand=="REV":
+        le_ss = np.unique(sg.R_last_exons)
+    else:
+        le_ss = np.unique(sg.F_last_exons)
+    
+    exclude = pd.concat([exons.merge(exons, on="d", suffixes=("1", "2"))[["a1", "a2"]],
+                         exons.rename(columns={"a":"a1"}).merge(introns.rename(columns={"a":"a2"}), on="d")[["a1", "a2"]]])
+    exclude['excluded'] = True
+    t = get_acceptor_pairs(introns, o).merge(exclude.drop_duplicates(), on=["a1", "a2"], how="left")
+    t = t[t['excluded'].isnull()].drop("excluded", axis=1)
+    
+    t = t.merge(exons.rename(columns={"a":"a1", "d":"x1"}), on="a1")
+    t = t.merge(exons.rename(columns={"a":"a2", "d":"x2"}), on="a2")
+    t = t[~np.in1d(t['x1'], le_ss) & ~np.in1d(t['x2'], le_ss)]
+    t = t.merge(introns.rename(columns={"d":"x1", "a":"a3"}), on="x1")
+    t = t.merge(introns.rename(columns={"d":"x2", "a":"a3"}), on=["x2", "a3"])
+
+    exons = np.stack([sg.get_csxs(t['d'], strand, ss_type_5p=True),
+                      sort_exons(t['a1'], t['x1']),
+                      sort_exons(t['a2'], t['x2']),
+                      sg.get_csxs(t['a3'], strand, ss_type_3p=True)], axis=1)
+    return exons, -np.ones(exons.shape[0], dtype='int64')
+
+def get_RI_events(sg, strand):
+    """
+    intron(d->a) x exon(a0->d) x exon(a0->x) x exon(a->x), the exons 
+    either side of the intron and the exon retaining it
+    """
+    introns, exons, o = get_ss_tables(sg, strand)
+    t = introns.merge(exons.rename(columns={"a":"a0"}), on="d")
+    t = t.merge(exons.rename(columns={"a":"a0", "d":"x"}), on="a0")
+    t = t.merge(exons.rename(columns={"d":"x"}), on=["a", "x"])
+    
+    exons = np.stack([sort_exons(t['a0'], t['d']),
+                      sort_exons(t['a'], t['x']),
+                      sort_exons(t['a0'], t['x'])], axis=1)
+    if strand=="FWD":
+        e_sizes = exons[:,1,0]-exons[:,0,1]
+    else:
+        e_sizes = exons[:,0,0]-exons[:,1,1]
+    return exons, e_sizes
+
+def get_event_table(sg, contig, strand_d, exons, stype, e_sizes):
+    """
+    the info table of events, gene name and ID keyed off of the first
+    exon's 5' or, if that has no gene name, its 3' (as make_transcript)
+    """
+    first = exons[:,0]
+    if strand_d=="FWD":
+        infs_5p = sg.F_5p_to_gene_info.get_first_labels(first[:,1])
+        infs_3p = sg.F_3p_to_gene_info.get_first_labels(first[:,0])
+    else:
+        infs_5p = sg.R_5p_to_gene_info.get_first_labels(first[:,0])
+        infs_3p = sg.R_3p_to_gene_info.get_first_labels(first[:,1])
+    infs = [inf_5p and inf_5p['gene_name'] and inf_5p or inf_3p for inf_5p, inf_3p in zip(infs_5p, infs_3p)]
+
+    IDs = pd.Series(contig, index=np.arange(exons.shape[0]))
+    for i in xrange(exons.shape[1]):
+        IDs = IDs+":"+exons[:,i,0].astype(str)+"-"+exons[:,i,1].astype(str)
+
+    return pd.DataFrame({"ID":IDs.values,
+                         "contig":contig,
+                         "start":exons[:,:,0].min(axis=1),
+                         "end":exons[:,:,1].max(axis=1),
+                         "strand":strand_d=="FWD" and 1 or -1,
+                         "exonSize":e_sizes,
+                         "geneName":[inf['gene_name'] for inf in infs],
+                         "geneID":[inf['gene_ID'] for inf in infs],
+                         "type":stype},
+                        columns=INFO_COLUMNS)
 
 class MisoUtils(object):
     
@@ -107,6 +298,7 @@ class MisoUtils(object):
         self.contig_sizes = kwargs.get("contig_sizes")
         self.fn_info = kwargs.get("fn_info")
         self.MISO_tr_inf = MISO_transcript_info(self.fn_info)
+        self.bgzip = kwargs.get("bgzip", False)
 
     def output_info(self):
         self.MISO_tr_inf.output()
@@ -147,246 +339,73 @@ class MisoUtils(object):
                        strand = STRAND)
         return t 
 
-    def get_SE(self, sg, d_5p, a_3ps, strand):
-        if strand=="REV":
-            a_3ps = sorted(a_3ps, reverse=strand=="REV")
-        else:
-            a_3ps = sorted(a_3ps)
-        
-        i_5p_3p, i_3p_5p, e_5p_3p, e_3p_5p = sg.get_intron_exon_juncs(strand)
-
-        us_exon = sg.get_csx(d_5p, strand, ss_type_5p=True)
-                                             
-        SEs = []
-        n_3ps = len(a_3ps)
-        for i in xrange(n_3ps): 
-            for j in xrange(i, n_3ps): 
-                if i==j: continue
-                us_3p = a_3ps[i]
-                ds_3p = a_3ps[j]
-                us_5ps = set(e_3p_5p[us_3p])
-                ds_5ps = set(i_3p_5p[ds_3p])
-                shared = us_5ps.intersection(ds_5ps)
-                if len(shared)>0:
-                    ds_exon = sg.get_csx(ds_3p, strand, ss_type_3p=True)
-                    for shared_5p in shared: 
-                        SEs.append([us_exon, sorted([us_3p,shared_5p]), ds_exon])
-        return SEs
-    
-    def define_SE_events(self, fn_out_gff, fn_out_bed, source="annot"):
-        F_gff = open(fn_out_gff,'w')
-        F_bed = open(fn_out_bed,'w')
-
-        for contig, sg in self.sgs_by_contig.items():
-            F_R_ss_juncs = { "FWD" : sg.F_5p_3p_ss, 
-                             "REV" : sg.R_5p_3p_ss }
-
-            for strand_d, ss_juncs in F_R_ss_juncs.items():
-
-                for d_5p, a_3ps in ss_juncs.iteritems(): 
-                    SEs = self.get_SE(sg, d_5p, a_3ps, strand_d)
-                    for SE in SEs:
-                        us_exon, alt_exon, ds_exon = SE
-                        exon_paths = {"A":[0,1,2], "B":[0,2]}
-                        EXONS  = [us_exon, alt_exon, ds_exon]
-                        trans =  self.make_transcript(sg, contig, strand_d, EXONS) 
-                        
-                        gff_s = trans.gff_string(exon_paths, source)
-                        bed_s = trans.bed_string(exon_paths, source)
-                        F_gff.write(gff_s)
-                        F_bed.write(bed_s)
-                        
-                        self.MISO_tr_inf.add_info(trans, 
-                                                  stype="SE", 
-                                                  exonSize=alt_exon[1]-alt_exon[0])
-                                                  
-
-    def get_A3SS(self, sg, d_5p, a_3ps, strand):
+    def define_events(self, stype, get_events, exon_paths, fn_out_gff, fn_out_bed, source="annot"):
         """
-        test if any of the a_3ps share exon ends 
+        enumerate the events of every contig and strand with get_events and
+        write their gff, bed and info in one go per contig and strand
         """
-        if strand=="REV":
-            a_3ps = sorted(a_3ps, reverse=strand=="REV")
-        else:
-            a_3ps = sorted(a_3ps)
-        
-        i_5p_3p, i_3p_5p, e_5p_3p, e_3p_5p = sg.get_intron_exon_juncs(strand)
-        us_exon = sg.get_csx(d_5p, strand, ss_type_5p=True)
-
-        A3SSs = []
-        n_3ps = len(a_3ps)
-        for i in xrange(n_3ps): 
-            for j in xrange(i, n_3ps): 
-                if i==j: continue
-                us_3p = a_3ps[i]
-                ds_3p = a_3ps[j]
-                us_5ps = set(e_3p_5p[us_3p])
-                ds_5ps = set(e_3p_5p[ds_3p])
-                shared = us_5ps.intersection(ds_5ps)
-                if len(shared)>0:
-                    #don't need to iterate through all shared because 
-                    #taking common shortest anyway
-                    ds_exon = sg.get_csx(ds_3p, strand, ss_type_3p=True)
-                    ds_exon_5p = strand=="FWD" and ds_exon[1] or ds_exon[0]
-                    A3SSs.append([us_exon, sorted([us_3p,ds_exon_5p]), ds_exon])
-        return A3SSs
-    
-    def define_A3SS_events(self, fn_out_gff, fn_out_bed, source="annot"):
-        F_gff = open(fn_out_gff,'w')
-        F_bed = open(fn_out_bed,'w')
+        gff_writer = TranscriptWriter(fn_out_gff, "gff", bgzip=self.bgzip)
+        bed_writer = TranscriptWriter(fn_out_bed, "bed", bgzip=self.bgzip)
 
         for contig, sg in self.sgs_by_contig.items():
-            F_R_ss_juncs = { "FWD" : sg.F_5p_3p_ss, 
-                             "REV" : sg.R_5p_3p_ss }
-            for strand_d, ss_juncs in F_R_ss_juncs.items():
-                for d_5p, a_3ps in ss_juncs.iteritems(): 
-                    A3SSs = self.get_A3SS(sg, d_5p, a_3ps, strand_d)
-                    for A3SS in A3SSs:
-                        us_exon, alt_us_exon, alt_ds_exon = A3SS
-                        exon_paths = {"A":[0,1], "B":[0,2]}
-                        EXONS  = [us_exon, alt_us_exon, alt_ds_exon]
-                        trans =  self.make_transcript(sg, contig, strand_d, EXONS)
-                        
-                        gff_s = trans.gff_string(exon_paths, source)
-                        bed_s = trans.bed_string(exon_paths, source)
-                        F_gff.write(gff_s)
-                        F_bed.write(bed_s)
-
-                        e_size = strand_d=="FWD" and alt_ds_exon[0]-alt_us_exon[0] or alt_us_exon[1]-alt_ds_exon[1]
-                        self.MISO_tr_inf.add_info(trans, 
-                                                  stype="A3SS", 
-                                                  exonSize=e_size)
-
-    def get_A5SS(self, sg, a_3p, d_5ps, strand):
-        """
-        test if any of the a_3ps share exon ends 
-        """
-        if strand=="REV":
-            d_5ps = sorted(d_5ps, reverse=strand=="REV")
-        else:
-            d_5ps = sorted(d_5ps)
-        
-        i_5p_3p, i_3p_5p, e_5p_3p, e_3p_5p = sg.get_intron_exon_juncs(strand)
-        ds_exon = sg.get_csx(a_3p, strand, ss_type_3p=True)
-
-        A5SSs = []
-        n_5ps = len(d_5ps)
-        for i in xrange(n_5ps): 
-            for j in xrange(i, n_5ps): 
-                if i==j: continue
-                us_5p = d_5ps[i]
-                ds_5p = d_5ps[j]
-                us_3ps = set(e_5p_3p[us_5p])
-                ds_3ps = set(e_5p_3p[ds_5p])
-                shared = us_3ps.intersection(ds_3ps)
-                if len(shared)>0:
-                    #don't need to iterate through all shared because 
-                    #taking common shortest anyway
-                    us_exon = sg.get_csx(us_5p, strand, ss_type_5p=True)
-                    us_exon_3p = strand=="FWD" and us_exon[0] or us_exon[1]
-                    A5SSs.append([us_exon, sorted([us_exon_3p,ds_5p]), ds_exon])
-        return A5SSs
+            for strand_d in ["FWD", "REV"]:
+                exons, e_sizes = get_events(sg, strand_d)
+                if exons.shape[0] == 0:
+                    continue
+                t = get_event_table(sg, contig, strand_d, exons, stype, e_sizes)
+                strand = strand_d=="FWD" and 1 or -1
+                gff_writer.write_events(contig, 
+                                        strand, 
+                                        exons, 
+                                        exon_paths, 
+                                        t['ID'].values, 
+                                        t['geneName'].values, 
+                                        t['geneID'].values, 
+                                        source)
+                bed_writer.write_events(contig, 
+                                        strand, 
+                                        exons, 
+                                        exon_paths, 
+                                        t['ID'].values, 
+                                        t['geneName'].values, 
+                                        t['geneID'].values, 
+                                        source)
+                self.MISO_tr_inf.add_info_table(t)
         
-    def define_A5SS_events(self, fn_out_gff, fn_out_bed, source="annot"):
-        F_gff = open(fn_out_gff,'w')
-        F_bed = open(fn_out_bed,'w')
+        gff_writer.close()
+        bed_writer.close()
 
-        for contig, sg in self.sgs_by_contig.items():
-            F_R_ss_juncs = { "FWD" : sg.F_3p_5p_ss, 
-                             "REV" : sg.R_3p_5p_ss }
-            for strand_d, ss_juncs in F_R_ss_juncs.items():
-                for a_3p, d_5ps in ss_juncs.iteritems(): 
-                    
-                    A5SSs = self.get_A5SS(sg, a_3p, d_5ps, strand_d)
-                    for A5SS in A5SSs:
-                        alt_us_exon, alt_ds_exon, ds_exon = A5SS
-                        exon_paths = {"A":[1,2], "B":[0,2]}
-                        EXONS  = [alt_us_exon, alt_ds_exon, ds_exon]
-                        trans =  self.make_transcript(sg, contig, strand_d, EXONS)
-                        
-                        gff_s = trans.gff_string(exon_paths, source)
-                        bed_s = trans.bed_string(exon_paths, source)
-                        F_gff.write(gff_s)
-                        F_bed.write(bed_s)
+    def define_SE_events(self, fn_out_gff, fn_out_bed, source="annot"):
+        self.define_events("SE", 
+                           get_SE_events,
+                           {"A":[0,1,2], "B":[0,2]},
+                           fn_out_gff, 
+                           fn_out_bed, 
+                           source=source)
 
-                        e_size = strand_d=="FWD" and alt_ds_exon[1]-alt_us_exon[1] or alt_us_exon[0]-alt_ds_exon[0]
-                        self.MISO_tr_inf.add_info(trans, 
-                                                  stype="A5SS", 
-                                                  exonSize=e_size)
-    
-    def get_MXE(self, sg, d_5p, a_3ps, strand):
-        if strand=="REV":
-            a_3ps = sorted(a_3ps, reverse=strand=="REV")
-        else:
-            a_3ps = sorted(a_3ps)
-        
-        i_5p_3p, i_3p_5p, e_5p_3p, e_3p_5p = sg.get_intron_exon_juncs(strand)
-        le_s_e, le_e_s, fe_s_e, fe_e_s = sg.get_first_last_exons(strand)
+    def define_A3SS_events(self, fn_out_gff, fn_out_bed, source="annot"):
+        self.define_events("A3SS", 
+                           get_A3SS_events,
+                           {"A":[0,1], "B":[0,2]},
+                           fn_out_gff, 
+                           fn_out_bed, 
+                           source=source)
 
-        us_exon = sg.get_csx(d_5p, strand, ss_type_5p=True)
-                                             
-        MXEs = []
-        n_3ps = len(a_3ps)
-        for i,j in itertools.combinations(range(n_3ps),2):
-            assert i!=j
-            us_alt_3p = a_3ps[i]
-            ds_alt_3p = a_3ps[j]
-
-            us_alt_5ps = set(e_3p_5p[us_alt_3p])
-            ds_alt_5ps = set(e_3p_5p[ds_alt_3p])
-            shared_alt_5ps = us_alt_5ps.intersection(ds_alt_5ps)
-            """
-            make sure no exons ending in the same place, 
-            otherwise, simply an alt 3' ss
-            AND
-            make sure the two alts don't splice to each other
-            """
-            ds_alt_3p_5pdonors = set(i_3p_5p[ds_alt_3p])
-            ds_alt_3p_5pdonors_shared = ds_alt_3p_5pdonors.intersection(us_alt_5ps)
-
-            if len(shared_alt_5ps)==0 and len(ds_alt_3p_5pdonors_shared)==0:
-                for us_alt_5p in list(us_alt_5ps):
-                    for ds_alt_5p in list(ds_alt_5ps):
-                        """
-                        if last exon, don't try o go further
-                        """
-                        if us_alt_5p in le_s_e or us_alt_5p in le_e_s: continue
-                        if ds_alt_5p in le_s_e or ds_alt_5p in le_e_s: continue
-
-                        us_le_3ps = set(i_5p_3p[us_alt_5p])
-                        ds_le_3ps = set(i_5p_3p[ds_alt_5p])
-                        
-                        shared_le_3ps = us_le_3ps.intersection(ds_le_3ps)
-                        for shared_le_3p in shared_le_3ps:
-                            ds_exon = sg.get_csx(shared_le_3p, strand, ss_type_3p=True)
-                            alt_us_exon = sorted([us_alt_3p,us_alt_5p])
-                            alt_ds_exon = sorted([ds_alt_3p,ds_alt_5p])
-                            MXEs.append([us_exon, alt_us_exon, alt_ds_exon, ds_exon])
-        return MXEs
-    
-    def define_MXE_events(self, fn_out_gff, fn_out_bed, source="annot"):
-        F_gff = open(fn_out_gff,'w')
-        F_bed = open(fn_out_bed,'w')
+    def define_A5SS_events(self, fn_out_gff, fn_out_bed, source="annot"):
+        self.define_events("A5SS", 
+                           get_A5SS_events,
+                           {"A":[1,2], "B":[0,2]},
+                           fn_out_gff, 
+                           fn_out_bed, 
+                           source=source)
 
-        for contig, sg in self.sgs_by_contig.items():
-            F_R_ss_juncs = { "FWD" : sg.F_5p_3p_ss, 
-                             "REV" : sg.R_5p_3p_ss }
-            for strand_d, ss_juncs in F_R_ss_juncs.items():
-                for d_5p, a_3ps in ss_juncs.iteritems(): 
-                    MXEs = self.get_MXE(sg, d_5p, a_3ps, strand_d)
-                    for MXE in MXEs:
-                        us_exon, alt_us_exon, alt_ds_exon, ds_exon = MXE
-                        exon_paths = {"A":[0,1,3], "B":[0,2,3]}
-                        EXONS  = [us_exon, alt_us_exon, alt_ds_exon, ds_exon]
-                        trans =  self.make_transcript(sg, contig, strand_d, EXONS)
-                        
-                        gff_s = trans.gff_string(exon_paths, source)
-                        bed_s = trans.bed_string(exon_paths, source)
-                        F_gff.write(gff_s)
-                        F_bed.write(bed_s)
-                        
-                        self.MISO_tr_inf.add_info(trans, 
-                                                  stype="MXE")
+    def define_MXE_events(self, fn_out_gff, fn_out_bed, source="annot"):
+        self.define_events("MXE", 
+                           get_MXE_events,
+                           {"A":[0,1,3], "B":[0,2,3]},
+                           fn_out_gff, 
+                           fn_out_bed, 
+                           source=source)
 
     def overlap(self, ex1, ex2):
         #exons in s,e format 
@@ -420,14 +439,12 @@ class MisoUtils(object):
         return AFEs
 
     def __define_AFE_events(self, fn_out_gff, fn_out_bed, source="annot"):
-        F_gff = open(fn_out_gff,'w')
-        F_bed = open(fn_out_bed,'w')
+        gff_writer = TranscriptWriter(fn_out_gff, "gff", bgzip=self.bgzip)
+        bed_writer = TranscriptWriter(fn_out_bed, "bed", bgzip=self.bgzip)
 
         for contig, sg in self.sgs_by_contig.items():
-            F_R_ex_graphs = { "FWD" : sg.F_exon_G, 
-                              "REV" : sg.R_exon_G }
-            for strand_d, ex_G in F_R_ex_graphs.items():
-                for connected_exs in nx.connected_components(ex_G): 
+            for strand_d in ["FWD", "REV"]:
+                for connected_exs in sg.get_exon_components(strand_d): 
                     AFEs = self.get_AFE(sg, connected_exs, strand_d)
                     for AFE in AFEs:
                         EXONS = AFE
@@ -435,8 +452,11 @@ class MisoUtils(object):
                         trans =  self.make_transcript(sg, contig, strand_d, EXONS)
                         gff_s = trans.gff_string(exon_paths, source)
                         bed_s = trans.bed_string(exon_paths, source)
-                        F_gff.write(gff_s)
-                        F_bed.write(bed_s)
+                        gff_writer.write(gff_s)
+                        bed_writer.write(bed_s)
+
+        gff_writer.close()
+        bed_writer.close()
 
     def get_ALE(self, sg, connected_exs, strand):
         """
@@ -472,14 +492,12 @@ class MisoUtils(object):
     
         
     def __define_ALE_events(self, fn_out_gff, fn_out_bed, source="annot"):
-        F_gff = open(fn_out_gff,'w')
-        F_bed = open(fn_out_bed,'w')
+        gff_writer = TranscriptWriter(fn_out_gff, "gff", bgzip=self.bgzip)
+        bed_writer = TranscriptWriter(fn_out_bed, "bed", bgzip=self.bgzip)
 
         for contig, sg in self.sgs_by_contig.items():
-            F_R_ex_graphs = { "FWD" : sg.F_exon_G, 
-                              "REV" : sg.R_exon_G }
-            for strand_d, ex_G in F_R_ex_graphs.items():
-                for connected_exs in nx.connected_components(ex_G): 
+            for strand_d in ["FWD", "REV"]:
+                for connected_exs in sg.get_exon_components(strand_d): 
                     ALEs = self.get_ALE(sg, connected_exs, strand_d)
                     for ALE in ALEs:
                         EXONS = ALE
@@ -487,8 +505,11 @@ class MisoUtils(object):
                         trans =  self.make_transcript(sg, contig, strand_d, EXONS)
                         gff_s = trans.gff_string(exon_paths, source)
                         bed_s = trans.bed_string(exon_paths, source)
-                        F_gff.write(gff_s)
-                        F_bed.write(bed_s)
+                        gff_writer.write(gff_s)
+                        bed_writer.write(bed_s)
+
+        gff_writer.close()
+        bed_writer.close()
 
 
     def define_AFE_events(self, fn_out_gff, fn_out_bed, source="annot"):
@@ -553,14 +574,12 @@ class MisoUtils(object):
     as done by jason... 
     """
     def define_simple_ALE_events(self, fn_out_gff, fn_out_bed, source="annot"):
-        F_gff = open(fn_out_gff,'w')
-        F_bed = open(fn_out_bed,'w')
+        gff_writer = TranscriptWriter(fn_out_gff, "gff", bgzip=self.bgzip)
+        bed_writer = TranscriptWriter(fn_out_bed, "bed", bgzip=self.bgzip)
 
         for contig, sg in self.sgs_by_contig.items():
-            F_R_ex_graphs = { "FWD" : sg.F_exon_G, 
-                              "REV" : sg.R_exon_G }
-            for strand_d, ex_G in F_R_ex_graphs.items():
-                for connected_exs in nx.connected_components(ex_G): 
+            for strand_d in ["FWD", "REV"]:
+                for connected_exs in sg.get_exon_components(strand_d): 
                     ALEs = self.get_simple_ALE(sg, connected_exs, strand_d)
                     EXONS = ALEs
                     if len(ALEs)>1:
@@ -568,12 +587,15 @@ class MisoUtils(object):
                         trans =  self.make_transcript(sg, contig, strand_d, EXONS)
                         gff_s = trans.gff_string(exon_paths, source)
                         bed_s = trans.bed_string(exon_paths, source)
-                        F_gff.write(gff_s)
-                        F_bed.write(bed_s)
+                        gff_writer.write(gff_s)
+                        bed_writer.write(bed_s)
 
                         self.MISO_tr_inf.add_info(trans, 
                                                   stype="ALE" )
 
+        gff_writer.close()
+        bed_writer.close()
+
     def get_simple_AFE(self, sg, connected_exs, strand):
         le_s_e, le_e_s, fe_s_e, fe_e_s = sg.get_first_last_exons(strand)
         i_5p_3p, i_3p_5p, e_5p_3p, e_3p_5p = sg.get_intron_exon_juncs(strand)
@@ -612,14 +634,12 @@ class MisoUtils(object):
         return AFEs
         
     def define_simple_AFE_events(self, fn_out_gff, fn_out_bed, source="annot"):
-        F_gff = open(fn_out_gff,'w')
-        F_bed = open(fn_out_bed,'w')
+        gff_writer = TranscriptWriter(fn_out_gff, "gff", bgzip=self.bgzip)
+        bed_writer = TranscriptWriter(fn_out_bed, "bed", bgzip=self.bgzip)
 
         for contig, sg in self.sgs_by_contig.items():
-            F_R_ex_graphs = { "FWD" : sg.F_exon_G, 
-                              "REV" : sg.R_exon_G }
-            for strand_d, ex_G in F_R_ex_graphs.items():
-                for connected_exs in nx.connected_components(ex_G): 
+            for strand_d in ["FWD", "REV"]:
+                for connected_exs in sg.get_exon_components(strand_d): 
                     AFEs = self.get_simple_AFE(sg, connected_exs, strand_d)
                     EXONS = AFEs
                     if len(EXONS)>1:
@@ -627,59 +647,19 @@ class MisoUtils(object):
                         trans =  self.make_transcript(sg, contig, strand_d, EXONS)
                         gff_s = trans.gff_string(exon_paths, source)
                         bed_s = trans.bed_string(exon_paths, source)
-                        F_gff.write(gff_s)
-                        F_bed.write(bed_s)
+                        gff_writer.write(gff_s)
+                        bed_writer.write(bed_s)
 
                         self.MISO_tr_inf.add_info(trans, 
                                                   stype="AFE")
 
-    def get_RIs(self, sg, a_3p, d_5ps, strand):
-        if strand=="REV":
-            d_5ps = sorted(d_5ps, reverse=strand=="REV")
-        else:
-            d_5ps = sorted(d_5ps)
-        
-        i_5p_3p, i_3p_5p, e_5p_3p, e_3p_5p = sg.get_intron_exon_juncs(strand)
-        
-        ds_ex_5ps = set(e_3p_5p[a_3p])
-
-        RIs = []
-        for us_5p in d_5ps:
-            for us_ex_3p in e_5p_3p[us_5p]:
-                us_ex_5ps = set(e_3p_5p[us_ex_3p])
-                intersection = us_ex_5ps.intersection(ds_ex_5ps)
-                for shared_5p in intersection:
-                    RI_exon = tuple(sorted([us_ex_3p, shared_5p]))
-                    us_ex = tuple(sorted([us_ex_3p,us_5p]))
-                    ds_ex = tuple(sorted([a_3p,shared_5p]))
-                    RIs.append([us_ex, ds_ex, RI_exon])
-        return RIs
-
+        gff_writer.close()
+        bed_writer.close()
 
     def define_RI_events(self, fn_out_gff, fn_out_bed, source="annot"):
-        F_gff = open(fn_out_gff,'w')
-        F_bed = open(fn_out_bed,'w')
-
-        for contig, sg in self.sgs_by_contig.items():
-            F_R_ss_juncs = { "FWD" : sg.F_3p_5p_ss, 
-                             "REV" : sg.R_3p_5p_ss }
-            for strand_d, ss_juncs in F_R_ss_juncs.items():
-                for a_3p, d_5ps in ss_juncs.iteritems(): 
-                    RIs = self.get_RIs(sg, a_3p, d_5ps, strand_d)
-                    for RI in RIs:
-                        EXONS = RI #us_exon, ds_ex, RI_exon
-                        exon_paths = {"A":[2], "B":[0,1]}
-                        trans =  self.make_transcript(sg, contig, strand_d, EXONS)
-                        gff_s = trans.gff_string(exon_paths, source)
-                        bed_s = trans.bed_string(exon_paths, source)
-                        F_gff.write(gff_s)
-                        F_bed.write(bed_s)
-
-                        e_size = strand_d=="FWD" and EXONS[1][0]-EXONS[0][1] or EXONS[0][0]-EXONS[1][1]
-
-                        self.MISO_tr_inf.add_info(trans, 
-                                                  stype="RI", 
-                                                  exonSize=e_size)
-
-
-
+        self.define_events("RI", 
+                           get_RI_events,
+                           {"A":[2], "B":[0,1]},
+                           fn_out_gff, 
+                           fn_out_bed, 
+                           source=source)
@@ -0,0 +1,160 @@
+"""
+multi-sample PSI quantification
+
+prox/dist counts and psi of every NAGNAG for every BAM in a sample sheet,
+computed in parallel over contig x sample shards and stored as one
+events x samples h5 file (h5PSIMatrix) that combine_psi_bio_replicates
+reads directly.
+
+the sample sheet is tab delimited with a header and the columns
+sample, tissue, fn_bam
+"""
+
+import argparse
+import numpy as np
+import pandas as pd
+import tables
+import pysam
+from sys import stderr
+
+from junction_counter import get_event_psis, get_max_readlen
+from calculate_PSI import get_nagnags, get_nagnag_events
+from contig_shards import run_shards
+
+EVENT_COLS = ["contig", "ss_5p", "ss_3p_prox", "ss_3p_dist", "strand", "size"]
+
+def get_shard_counts(args):
+    """
+    prox and dist counts of the events of one contig in one BAM
+    """
+    fn_bam, events, readlen, min_overhang = args
+    bam = pysam.Samfile(fn_bam, 'rb')
+    psi, n_1, n_2 = get_event_psis(bam, events, readlen, min_overhang)
+    bam.close()
+    return n_1, n_2
+
+def get_psi_matrices(fn_bams, events, readlen, min_overhang, n_procs=1):
+    """
+    events x samples prox counts, dist counts and psi, one job per
+    contig x BAM
+    """
+    idxs_by_contig = events.groupby('contig').indices
+    shards, jobs = [], []
+    for j, fn_bam in enumerate(fn_bams):
+        for contig in sorted(idxs_by_contig.keys()):
+            idxs = idxs_by_contig[contig]
+            shards.append(tuple([idxs, j]))
+            jobs.append(tuple([fn_bam, events.iloc[idxs], readlen, min_overhang]))
+
+    counts = run_shards(get_shard_counts, jobs, n_procs)
+
+    prox = np.zeros((events.shape[0], len(fn_bams)))
+    dist = np.zeros((events.shape[0], len(fn_bams)))
+    for (idxs, j), (n_1, n_2) in zip(shards, counts):
+        prox[idxs, j] = n_1
+        dist[idxs, j] = n_2
+
+    t = prox+dist
+    psi = np.where(t==0, 0, prox/np.maximum(t, 1))
+    return prox, dist, psi
+
+def write_psi_matrix(fn, events, samples, tissues, prox, dist, psi):
+
+    assert events.shape[0]>0, "no events to write to %s"%fn
+    h5 = tables.openFile(fn, mode='w')
+    filt = tables.Filters(complevel=5, complib='blosc')
+
+    contig_len = max([len(c) for c in events['contig']])
+    sample_len = max([len(s) for s in list(samples)+list(tissues)])
+    cols = [["contig", events['contig'].values.astype("S%d"%contig_len), tables.StringAtom(contig_len)],
+            ["strand", events['strand'].values.astype("S1"), tables.StringAtom(1)],
+            ["samples", np.array(samples, dtype="S%d"%sample_len), tables.StringAtom(sample_len)],
+            ["tissues", np.array(tissues, dtype="S%d"%sample_len), tables.StringAtom(sample_len)],
+            ["prox_count", prox.astype('uint32'), tables.UInt32Atom()],
+            ["dist_count", dist.astype('uint32'), tables.UInt32Atom()],
+            ["psi", psi, tables.Float64Atom()]]
+    for col in ["ss_5p", "ss_3p_prox", "ss_3p_dist", "size"]:
+        cols.append([col, events[col].values.astype('int64'), tables.Int64Atom()])
+
+    for name, a, atom in cols:
+        c_a = h5.createCArray(h5.root, name, atom, shape=a.shape, filters=filt)
+        c_a[:] = a
+    h5.close()
+
+class h5PSIMatrix(object):
+    """
+    events x samples prox counts, dist counts and psi
+    """
+    def __init__(self, fn):
+
+        stderr.write("loading {fn}...".format(fn=fn))
+        h5 = tables.openFile(fn, mode='r')
+        self.events = pd.DataFrame({"contig":h5.root.contig[:],
+                                    "ss_5p":h5.root.ss_5p[:],
+                                    "ss_3p_prox":h5.root.ss_3p_prox[:],
+                                    "ss_3p_dist":h5.root.ss_3p_dist[:],
+                                    "strand":h5.root.strand[:],
+                                    "size":h5.root.size[:]},
+                                   columns=EVENT_COLS)
+        self.samples = list(h5.root.samples[:])
+        self.tissues = list(h5.root.tissues[:])
+        self.prox = h5.root.prox_count[:].astype(float)
+        self.dist = h5.root.dist_count[:].astype(float)
+        self.psi = h5.root.psi[:]
+        h5.close()
+        stderr.write("done\n")
+
+    def get_long_table(self):
+        """
+        one row per event x sample, the concatenated calculate_PSI tables
+        with tissue and sample columns
+        """
+        n_events, n_samples = self.psi.shape
+        T = self.events.iloc[np.tile(np.arange(n_events), n_samples)].reset_index(drop=True)
+        T['psi'] = self.psi.T.ravel()
+        T['prox_count'] = self.prox.T.ravel()
+        T['dist_count'] = self.dist.T.ravel()
+        T['tissue'] = np.repeat(self.tissues, n_events)
+        T['sample'] = np.repeat(self.samples, n_events)
+        return T
+
+if __name__=="__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fn_sample_sheet", required=True)
+    parser.add_argument("--fn_juncs", required=True)
+    parser.add_argument("--fn_out", required=True)
+    parser.add_argument("--contigs", default=None)
+    parser.add_argument("--min_overhang", type=int, default=8)
+    parser.add_argument("--max_size", type=int, default=None, 
+                        help="largest distance between the two acceptors of a NAGNAG")
+    parser.add_argument("--max_readlen", type=int, default=None)
+    parser.add_argument("--n_procs", type=int, default=1)
+    o = parser.parse_args()
+
+    sample_sheet = pd.read_csv(o.fn_sample_sheet, header=0, delimiter="\t")
+    junc_table = pd.read_csv(o.fn_juncs,
+                             header=None,
+                             delimiter="\t",
+                             names=["contig",
+                                    "j_left",
+                                    "j_right",
+                                    "strand"])
+    if o.contigs:
+        junc_table = junc_table[junc_table['contig'].isin(o.contigs.split(":"))]
+    events = get_nagnag_events(get_nagnags(junc_table, o.max_size))
+    stderr.write("%d events x %d samples\n"%(events.shape[0], sample_sheet.shape[0]))
+
+    fn_bams = list(sample_sheet['fn_bam'])
+    readlen = o.max_readlen
+    if readlen is None:
+        readlen = max([get_max_readlen(pysam.Samfile(fn_bam, 'rb')) for fn_bam in fn_bams])
+
+    prox, dist, psi = get_psi_matrices(fn_bams, events, readlen, o.min_overhang, o.n_procs)
+    write_psi_matrix(o.fn_out,
+                     events,
+                     list(sample_sheet['sample'].astype(str)),
+                     list(sample_sheet['tissue'].astype(str)),
+                     prox,
+                     dist,
+                     psi)
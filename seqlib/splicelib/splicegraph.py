@@ -1,17 +1,18 @@
 import numpy as np
 import pdb
 import argparse
-import BCBio.GFF as GFF
+import os
 import re
 import string 
-import networkx as nx
 
 from transcript import Transcript
+import gff_reader as gr
+import transcript_writer as tw
 from collections import defaultdict
 from sys import stderr
 from fastahack import FastaHack
 
-from bx.intervals.intersection import Interval, IntervalTree
+from utils.intervaltools import IntervalSet
 import sys
 
 trans = string.maketrans('ATCGatcg', 'TAGCtacg')
@@ -19,6 +20,193 @@ trans = string.maketrans('ATCGatcg', 'TAGCtacg')
 def revcomp(s):
     return s.translate(trans)[::-1]
 
+class MotifIndex(object):
+    """
+    sorted start positions of 2bp splice motifs (GT/AG, AC/CT) in a
+    contig sequence, found once on the uint8 encoded sequence and
+    looked up per interval with searchsorted
+    """
+    def __init__(self, seq):
+        self.seq = np.frombuffer(seq.upper(), dtype=np.uint8)
+        self.positions = {}
+    
+    def get_positions(self, motif):
+        if not motif in self.positions:
+            m0, m1 = [ord(c) for c in motif]
+            self.positions[motif] = np.where((self.seq[:-1]==m0) & 
+                                             (self.seq[1:]==m1))[0]
+        return self.positions[motif]
+
+    def get(self, motif, s, e):
+        """
+        starts of the motif lying wholly in seq[s:e]
+        """
+        positions = self.get_positions(motif)
+        i, j = np.searchsorted(positions, [max(s, 0), e-1])
+        return positions[i:max(i, j)]
+
+def band_join(xs, ys, lo, hi):
+    """
+    all index pairs (i, j) with xs[i]+lo < ys[j] < xs[i]+hi, ys sorted,
+    in order of i then j
+    """
+    starts = np.searchsorted(ys, xs+lo, side='right')
+    ends = np.maximum(np.searchsorted(ys, xs+hi, side='left'), starts)
+    counts = ends-starts
+    x_idxs = np.repeat(np.arange(xs.shape[0]), counts)
+    y_idxs = np.arange(np.sum(counts)) - np.repeat(np.cumsum(counts)-counts-starts, counts)
+    return x_idxs, y_idxs
+
+def get_uniq_rows(a):
+    """
+    the unique rows of an (n, 2) int array in sorted order and the index
+    of each row of a in them
+    """
+    a = np.asarray(a, dtype='int64').reshape(-1, 2)
+    order = np.lexsort((a[:,1], a[:,0]))
+    sorted_a = a[order]
+    first = np.r_[True, np.any(sorted_a[1:]!=sorted_a[:-1], axis=1)][:a.shape[0]]
+    inverse = np.empty(a.shape[0], dtype='int64')
+    inverse[order] = np.cumsum(first)-1
+    return sorted_a[first], inverse
+
+def union_find(n, a, b):
+    """
+    component of each of n nodes joined by the edges a[i]-b[i], labelled
+    by its smallest node. Roots are hooked onto the smaller label across
+    every edge and the labels pointer jumped until nothing changes
+    """
+    labels = np.arange(n)
+    while True:
+        l = np.minimum(labels[a], labels[b])
+        hooked = labels.copy()
+        np.minimum.at(hooked, labels[a], l)
+        np.minimum.at(hooked, labels[b], l)
+        hooked = hooked[hooked]
+        if np.array_equal(hooked, labels):
+            break
+        labels = hooked
+    return labels
+
+class CSRMap(object):
+    """
+    read only dict of lists over sorted (key, value) int pairs, the values
+    of key_array[i] are value_array[indptr[i]:indptr[i+1]]. With labels,
+    values are indices into labels and lookups return the labels
+    """
+    def __init__(self, keys, values, labels=None):
+        """
+        keys sorted, (key, value) pairs unique
+        """
+        keys = np.asarray(keys, dtype='int64')
+        self.key_array, starts = np.unique(keys, return_index=True)
+        self.indptr = np.r_[starts, keys.shape[0]].astype('int64')
+        self.value_array = np.asarray(values, dtype='int64')
+        self.labels = labels
+
+    @classmethod
+    def from_pairs(cls, keys, values):
+        """
+        from unsorted pairs, duplicates dropped, values of a key sorted
+        """
+        pairs, inverse = get_uniq_rows(np.c_[keys, values])
+        return cls(pairs[:,0], pairs[:,1])
+
+    def _find(self, key):
+        i = np.searchsorted(self.key_array, key)
+        if i < self.key_array.shape[0] and self.key_array[i] == key:
+            return i
+        return -1
+
+    def __contains__(self, key):
+        return self._find(key) != -1
+
+    def __getitem__(self, key):
+        i = self._find(key)
+        if i == -1:
+            raise KeyError(key)
+        values = self.value_array[self.indptr[i]:self.indptr[i+1]].tolist()
+        if self.labels is not None:
+            return [self.labels[v] for v in values]
+        return values
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def get_min(self, key):
+        i = self._find(key)
+        if i == -1:
+            raise KeyError(key)
+        return int(self.value_array[self.indptr[i]])
+
+    def get_max(self, key):
+        i = self._find(key)
+        if i == -1:
+            raise KeyError(key)
+        return int(self.value_array[self.indptr[i+1]-1])
+
+    def find_all(self, keys):
+        """
+        index of each key in key_array, -1 if it's not there
+        """
+        keys = np.asarray(keys, dtype='int64')
+        if self.key_array.shape[0] == 0:
+            return -np.ones(keys.shape[0], dtype='int64')
+        i = np.minimum(np.searchsorted(self.key_array, keys), self.key_array.shape[0]-1)
+        return np.where(self.key_array[i]==keys, i, -1)
+
+    def get_mins(self, keys):
+        i = self.find_all(keys)
+        if np.any(i == -1):
+            raise KeyError(np.asarray(keys)[i == -1][0])
+        return self.value_array[self.indptr[i]]
+
+    def get_maxs(self, keys):
+        i = self.find_all(keys)
+        if np.any(i == -1):
+            raise KeyError(np.asarray(keys)[i == -1][0])
+        return self.value_array[self.indptr[i+1]-1]
+
+    def get_first_labels(self, keys):
+        """
+        the label of the first value of each key, None if it's not there
+        """
+        return [i != -1 and self.labels[self.value_array[self.indptr[i]]] or None for i in self.find_all(keys).tolist()]
+
+    def __len__(self):
+        return self.key_array.shape[0]
+
+    def __iter__(self):
+        return iter(self.key_array.tolist())
+
+    def keys(self):
+        return self.key_array.tolist()
+
+    def iteritems(self):
+        for key in self.key_array.tolist():
+            yield key, self[key]
+
+    def items(self):
+        return list(self.iteritems())
+
+    def values(self):
+        return [v for k, v in self.iteritems()]
+
+
+def get_gene_info_map(keys, t_idxs, ginfo_ids, gene_infos):
+    """
+    CSRMap from splice sites to the gene infos of the transcripts using
+    them, each gene info once, in the order of the first transcript with it
+    """
+    g = ginfo_ids[t_idxs]
+    order = np.lexsort((t_idxs, g, keys))
+    keys, g, t_idxs = keys[order], g[order], t_idxs[order]
+    first = np.r_[True, (keys[1:]!=keys[:-1]) | (g[1:]!=g[:-1])][:keys.shape[0]]
+    keys, g, t_idxs = keys[first], g[first], t_idxs[first]
+    order = np.lexsort((t_idxs, keys))
+    return CSRMap(keys[order], g[order], labels=gene_infos)
 
 class SpliceGraph(object):
 
@@ -31,44 +219,53 @@ class SpliceGraph(object):
           3'      5'
         - CT------AC
 
-        a collection of hashes of lists representing all splice site 
-        and all exon boundary relationships
-
+        per strand (F, R) sorted unique int64 tables of
+            introns       [left, right], ie. [exon end, next exon start]
+            exons         [start, end]
+            first/last exons
+            exon_links    [i, j] exons[i] followed by exons[j] in a transcript
+        
+        the splice site and exon boundary relationships are CSRMaps over
+        these tables, read only dicts of sorted lists keyed by position
         """
         
         self.contig = contig
         
+        for S in ["F", "R"]:
+            for table in ["introns", "exons", "first_exons", "last_exons", "exon_links"]:
+                setattr(self, "%s_%s"%(S, table), np.asarray(kwargs["%s_%s"%(S, table)], dtype='int64').reshape(-1, 2))
+        
         """
         exon-intron-exon junctions
         """
-        self.F_3p_5p_ss = kwargs["F_3p_5p_ss"]
-        self.F_5p_3p_ss = kwargs["F_5p_3p_ss"]
-        self.R_3p_5p_ss = kwargs["R_3p_5p_ss"]
-        self.R_5p_3p_ss = kwargs["R_5p_3p_ss"]
+        self.F_5p_3p_ss = CSRMap(self.F_introns[:,0], self.F_introns[:,1])
+        self.F_3p_5p_ss = CSRMap.from_pairs(self.F_introns[:,1], self.F_introns[:,0])
+        self.R_5p_3p_ss = CSRMap.from_pairs(self.R_introns[:,1], self.R_introns[:,0])
+        self.R_3p_5p_ss = CSRMap(self.R_introns[:,0], self.R_introns[:,1])
         
         """
         intron-exon-intron junctions
         """
-        self.F_exon_s_e = kwargs["F_exon_s_e"]
-        self.F_exon_e_s = kwargs["F_exon_e_s"]
-        self.R_exon_s_e = kwargs["R_exon_s_e"]
-        self.R_exon_e_s = kwargs["R_exon_e_s"]
+        self.F_exon_s_e = CSRMap(self.F_exons[:,0], self.F_exons[:,1])
+        self.F_exon_e_s = CSRMap.from_pairs(self.F_exons[:,1], self.F_exons[:,0])
+        self.R_exon_s_e = CSRMap(self.R_exons[:,0], self.R_exons[:,1])
+        self.R_exon_e_s = CSRMap.from_pairs(self.R_exons[:,1], self.R_exons[:,0])
        
         """
         last exon s-e/e-s junctions
         """
-        self.F_le_s_e = kwargs["F_le_s_e"]
-        self.F_le_e_s = kwargs["F_le_e_s"]
-        self.R_le_s_e = kwargs["R_le_s_e"]
-        self.R_le_e_s = kwargs["R_le_e_s"]
+        self.F_le_s_e = CSRMap(self.F_last_exons[:,0], self.F_last_exons[:,1])
+        self.F_le_e_s = CSRMap.from_pairs(self.F_last_exons[:,1], self.F_last_exons[:,0])
+        self.R_le_s_e = CSRMap(self.R_last_exons[:,0], self.R_last_exons[:,1])
+        self.R_le_e_s = CSRMap.from_pairs(self.R_last_exons[:,1], self.R_last_exons[:,0])
         
         """
         first exon s-e/e-s junctions
         """
-        self.F_fe_s_e = kwargs["F_fe_s_e"]
-        self.F_fe_e_s = kwargs["F_fe_e_s"]
-        self.R_fe_s_e = kwargs["R_fe_s_e"]
-        self.R_fe_e_s = kwargs["R_fe_e_s"]
+        self.F_fe_s_e = CSRMap(self.F_first_exons[:,0], self.F_first_exons[:,1])
+        self.F_fe_e_s = CSRMap.from_pairs(self.F_first_exons[:,1], self.F_first_exons[:,0])
+        self.R_fe_s_e = CSRMap(self.R_first_exons[:,0], self.R_first_exons[:,1])
+        self.R_fe_e_s = CSRMap.from_pairs(self.R_first_exons[:,1], self.R_first_exons[:,0])
 
         """
         5'/3' ss to gene_info
@@ -79,26 +276,142 @@ class SpliceGraph(object):
         self.R_3p_to_gene_info = kwargs["R_3p_to_gene_info"]
         
         """
-        interval tree of introns with introns represented from "left" to "right"
-        regardless of strand, ie, s<e
+        the TranscriptTable the graph was built from, what write stores
         """
-        self.F_LR_intron_interval_tree = kwargs["F_LR_intron_interval_tree"]
-        self.R_LR_intron_interval_tree = kwargs["R_LR_intron_interval_tree"]
-        
+        self.transcripts = kwargs.get("transcripts")
+
+        self.intron_interval_trees = {}
+        self.uniq_exons = None
+        self.motif_index = None
+    
+    @classmethod
+    def init_from_transcripts(cls, t_table):
         """
-        exon graphs for easy connected compenent finding
-        all exons stored in s<e format irrespective of strand
+        t_table is a gff_reader.TranscriptTable of one contig, exons s<e
+        and left to right. Transcripts not on + go to the R tables
         """
-        self.F_exon_G = kwargs["F_exon_G"]
-        self.R_exon_G = kwargs["R_exon_G"]
+        exons = t_table.exons
+        s, e = exons[:,0], exons[:,1]
+        n_exons = np.diff(t_table.exon_offsets)
+        t_idxs = np.repeat(np.arange(len(t_table)), n_exons)
+        k = np.arange(exons.shape[0]) - np.repeat(t_table.exon_offsets[:-1], n_exons)
+        is_first = k == 0
+        is_last = k == np.repeat(n_exons, n_exons)-1
         
         """
-        nx based ss graph with 
+        assertions here - all exons processed from left to right
+        ie e1 < e2 and ei < ei+1
         """
-        self.ss_G = kwargs["ss_G"]
+        assert np.all(s < e)
+        linked = np.where(~is_last)[0]
+        assert np.all(e[linked] < s[linked+1]) #previously whack due to CDS
+        
+        ginfo_by_gene = {}
+        ginfo_ids = np.zeros(len(t_table), dtype='int64')
+        for i, gene in enumerate(zip(t_table.gene_names, t_table.gene_IDs)):
+            ginfo_ids[i] = ginfo_by_gene.setdefault(gene, len(ginfo_by_gene))
+        gene_infos = [None for i in xrange(len(ginfo_by_gene))]
+        for (gene_name, gene_ID), i in ginfo_by_gene.iteritems():
+            gene_infos[i] = {"gene_name":gene_name, "gene_ID":gene_ID}
+
+        kwargs = {"transcripts":t_table}
+        fwd = t_table.strands[t_idxs] == 1
+        for S, on_strand in [["F", fwd], ["R", ~fwd]]:
+            rows = np.where(on_strand)[0]
+            linked = rows[~is_last[rows]]
+            
+            kwargs["%s_introns"%S] = get_uniq_rows(np.c_[e[linked], s[linked+1]])[0]
+            kwargs["%s_exons"%S], exon_ids = get_uniq_rows(exons[rows])
+            row_exon_ids = np.zeros(exons.shape[0], dtype='int64')
+            row_exon_ids[rows] = exon_ids
+            kwargs["%s_exon_links"%S] = get_uniq_rows(np.c_[row_exon_ids[linked], row_exon_ids[linked+1]])[0]
+
+            left_exons = get_uniq_rows(exons[rows[is_first[rows]]])[0]
+            right_exons = get_uniq_rows(exons[rows[is_last[rows]]])[0]
+            
+            """
+            gene info is also added to the END of the last exon, even 
+            though not techinically a 5'
+            """
+            if S == "F":
+                kwargs["F_first_exons"], kwargs["F_last_exons"] = left_exons, right_exons
+                rows_5p, keys_5p = rows, e[rows]
+                rows_3p = rows[~is_first[rows]]
+                keys_3p = s[rows_3p]
+            else:
+                kwargs["R_first_exons"], kwargs["R_last_exons"] = right_exons, left_exons
+                rows_5p = rows[~is_first[rows] | is_last[rows]]
+                keys_5p = s[rows_5p]
+                rows_3p = rows[~is_last[rows]]
+                keys_3p = e[rows_3p]
+            kwargs["%s_5p_to_gene_info"%S] = get_gene_info_map(keys_5p, t_idxs[rows_5p], ginfo_ids, gene_infos)
+            kwargs["%s_3p_to_gene_info"%S] = get_gene_info_map(keys_3p, t_idxs[rows_3p], ginfo_ids, gene_infos)
         
-        self.all_uniq_exons = kwargs["all_uniq_exons"]
+        return cls(t_table.contig, **kwargs)
+    
+    def write(self, fn):
+        self.transcripts.write(fn)
+
+    @classmethod
+    def init_from_h5(cls, fn):
+        return cls.init_from_transcripts(gr.TranscriptTable.init_from_h5(fn))
+
+    def get_motif_index(self, seq):
+        if self.motif_index is None:
+            self.motif_index = MotifIndex(seq)
+        return self.motif_index
+    
+    def get_exon_components(self, strand):
+        """
+        sets of (s, e) exons connected through the transcripts they are in,
+        exons of single exon transcripts are not in any. In order of the 
+        first exon of each component
+        """
+        if strand=="REV":
+            exons, links = self.R_exons, self.R_exon_links
+        else:
+            exons, links = self.F_exons, self.F_exon_links
         
+        labels = union_find(exons.shape[0], links[:,0], links[:,1])
+        nodes = np.unique(links)
+        nodes = nodes[np.argsort(labels[nodes], kind='mergesort')]
+        breaks = np.where(np.diff(labels[nodes])!=0)[0]+1
+        exon_tups = [tuple(ex) for ex in exons[nodes].tolist()]
+        bounds = np.r_[0, breaks, nodes.shape[0]]
+        return [set(exon_tups[bounds[i]:bounds[i+1]]) for i in xrange(bounds.shape[0]-1) if bounds[i+1]>bounds[i]]
+
+    def get_intron_interval_tree(self, strand):
+        """
+        IntervalSet of introns with introns represented from "left" to 
+        "right" regardless of strand, ie, s<e, the value of an interval
+        is its row in F/R_introns
+        """
+        if not strand in self.intron_interval_trees:
+            if strand=="REV":
+                introns = self.R_introns
+            else:
+                introns = self.F_introns
+            self.intron_interval_trees[strand] = IntervalSet(introns[:,0], introns[:,1])
+        return self.intron_interval_trees[strand]
+
+    @property
+    def F_LR_intron_interval_tree(self):
+        return self.get_intron_interval_tree("FWD")
+
+    @property
+    def R_LR_intron_interval_tree(self):
+        return self.get_intron_interval_tree("REV")
+
+    @property
+    def all_uniq_exons(self):
+        """
+        {(s, e):1} of the exons on either strand, built on first use
+        """
+        if self.uniq_exons is None:
+            exons = get_uniq_rows(np.r_[self.F_exons, self.R_exons])[0]
+            self.uniq_exons = dict([[tuple(ex), 1] for ex in exons.tolist()])
+        return self.uniq_exons
+
     def get_csx(self, ss, strand, ss_type_3p=False, ss_type_5p=False):
         return self.get_common_shortest_exon(ss, 
                                              strand, 
@@ -130,14 +443,32 @@ class SpliceGraph(object):
 
         if strand=="FWD":
             if ss_type_5p:
-                return tuple([max(self.F_exon_e_s[ss]), ss])
+                return tuple([self.F_exon_e_s.get_max(ss), ss])
+            else:
+                return tuple([ss, self.F_exon_s_e.get_min(ss)])
+        else:
+            if ss_type_5p:
+                return tuple([ss, self.R_exon_s_e.get_min(ss)])
+            else:
+                return tuple([self.R_exon_e_s.get_max(ss), ss])
+    
+    def get_csxs(self, ss, strand, ss_type_3p=False, ss_type_5p=False):
+        """
+        get_csx of an array of splice sites, an (n, 2) array of exons
+        """
+        assert ss_type_3p!=ss_type_5p, "must pick 3' or 5' (_3p, _5p)"
+        ss = np.asarray(ss, dtype='int64')
+
+        if strand=="FWD":
+            if ss_type_5p:
+                return np.c_[self.F_exon_e_s.get_maxs(ss), ss]
             else:
-                return tuple([ss, min(self.F_exon_s_e[ss])])
+                return np.c_[ss, self.F_exon_s_e.get_mins(ss)]
         else:
             if ss_type_5p:
-                return tuple([ss, min(self.R_exon_s_e[ss])])
+                return np.c_[ss, self.R_exon_s_e.get_mins(ss)]
             else:
-                return tuple([max(self.R_exon_e_s[ss]), ss])
+                return np.c_[self.R_exon_e_s.get_maxs(ss), ss]
     
     def get_first_last_exons(self, strand):
         if strand=="REV":
@@ -214,10 +545,11 @@ class SpliceGraph(object):
                 gene_inf.append(inf)
         return gene_inf
 
-    def get_skipped_alt_exon(self, seq, F_gff, F_novel_gff, F_bed, junc_writer, n=60):
+    def get_skipped_alt_exon(self, seq, gff_writer, novel_gff_writer, bed_writer, junc_writer, n=60):
         """
         get all 5' 3' ss pairs and search in-between for lil' guys
         """
+        motif_index = self.get_motif_index(seq)
 
         for strand_d, ss_juncs in { "FWD" : self.F_5p_3p_ss, "REV" : self.R_5p_3p_ss }.iteritems():
             t_complete=0 
@@ -253,62 +585,38 @@ class SpliceGraph(object):
                         seq_s, seq_e = annot_ss_3p+2, annot_ss_5p-2 
                     
 
-                    donors = np.array([m.start()+seq_s+delta_donor for m in re.finditer(ss_donor_seq, seq[seq_s:seq_e].upper())])
-                    acceptors = np.array([m.start()+seq_s+delta_acceptor for m in re.finditer(ss_acceptor_seq, seq[seq_s:seq_e].upper())])
+                    donors = motif_index.get(ss_donor_seq, seq_s, seq_e)+delta_donor
+                    acceptors = motif_index.get(ss_acceptor_seq, seq_s, seq_e)+delta_acceptor
                     
                     """
-                    mult lets us just get the exons in the right direction
+                    acceptors within n upstream (FWD) or downstream (REV) of 
+                    each donor, so the exons come out in the right direction
                     """
-                    
                     if strand_d=="FWD": 
-                        mult=1
+                        d_idxs, a_idxs = band_join(donors, acceptors, -n, 0)
                     else:
-                        mult=-1
+                        d_idxs, a_idxs = band_join(donors, acceptors, 0, n)
 
-                    for donor in donors:
-                        ds = mult*(donor-acceptors)
-                        for acceptor in acceptors[(ds<n)&(ds>0)]:
-                            source = ""
-                            alt_exon=sorted([acceptor, donor])
-                        
-                            if (alt_exon[1]==alt_exon[0]):
-                                continue
-                            exon_paths = {"A":[0,2], "B":[0,1,2]}
-
-                            EXONS  = [us_exon, alt_exon, ds_exon]
-                            """
-                            FEATURE_ID = "%s_%s"%(source, "_".join(["%s:%d-%d"%(self.contig, e[0], e[1]) for e in EXONS]))
-                            GENE_NAME = "%s_%s"%(source, ",".join(["%s"%gi['gene_name'] for gi in gene_inf]))
-                            GENE_ID = "%s_%s"%(source,"_".join(["%s"%gi['gene_ID'] for gi in gene_inf]))
-                            """
-                            FEATURE_ID, GENE_NAME, GENE_ID="","",""
-                            G_START = min(us_exon[0], ds_exon[0])
-                            G_END = max(us_exon[1], ds_exon[1])
-                            STRAND = strand_d == "FWD" and 1 or -1
-                        
-                            alt_T = Transcript(contig = self.contig, 
-                                               feature_ID = FEATURE_ID,
-                                               exons = EXONS, 
-                                               gene_name = GENE_NAME,
-                                               gene_ID = GENE_ID,
-                                               g_start = G_START,
-                                               g_end = G_END,
-                                               strand = STRAND)
-
-                            #T_hash = alt_T.get_tuple_hash()
-                            #discovered_alt_transcript_hashes[T_hash] = 1
-
-                            junc_tups = alt_T.junc_tuples(exon_paths, source, True)
-                            junc_writer.write(junc_tups)
-                            """ 
-                            gff_s = alt_T.gff_string(exon_paths, source)
-                            gff_novel_s = alt_T.gff_string({"A":[0,1]}, source)
-                            bed_s = alt_T.bed_string(exon_paths, source, True)
-                            
-                            F_gff.write(gff_s)
-                            F_novel_gff.write(gff_novel_s)
-                            F_bed.write(bed_s)
-                            """ 
+                    alt_lefts = np.minimum(donors[d_idxs], acceptors[a_idxs])
+                    alt_rights = np.maximum(donors[d_idxs], acceptors[a_idxs])
+                    keep = alt_lefts != alt_rights
+                    if not np.any(keep):
+                        continue
+                    
+                    """
+                    only the junctions are output, the gff and bed of
+                    the us, alt, ds exons are not written
+                    """
+                    exons = np.zeros((np.sum(keep), 3, 2), dtype='int64')
+                    exons[:,0] = us_exon
+                    exons[:,1,0] = alt_lefts[keep]
+                    exons[:,1,1] = alt_rights[keep]
+                    exons[:,2] = ds_exon
+                    junc_writer.write(tw.get_junc_tuples(self.contig, 
+                                                         strand_d == "FWD" and 1 or -1, 
+                                                         exons, 
+                                                         {"A":[0,2], "B":[0,1,2]}, 
+                                                         UCSC=True))
 
 
     def get_5p_micro_exon(self, seq, F_gff, F_novel_gff, F_bed, junc_writer, micro_exon_dir, n=60):
@@ -317,11 +625,14 @@ class SpliceGraph(object):
     def get_3p_micro_exon(self, seq, F_gff, F_novel_gff, F_bed, junc_writer, micro_exon_dir, n=60):
         get_5p_3p_alt_exon(self, seq, F_gff, F_novel_gff, F_bed, junc_writer, get_3p=True, n=n)
 
-    def get_5p_3p_alt_exon(self, seq, F_gff, F_novel_gff, F_bed, junc_writer, get_5p=False, get_3p=False, n=60):
+    def get_5p_3p_alt_exon(self, seq, gff_writer, novel_gff_writer, bed_writer, junc_writer, get_5p=False, get_3p=False, n=60):
         """
-        get all putative alternative 5'/3' alternative exons 
+        get all putative alternative 5'/3' alternative exons, the events of
+        each strand are collected and written in one batch through the
+        TranscriptWriters
         """
         assert get_5p != get_3p, "EITHER get_5p or get_3p (5' or 3') must be passed"
+        motif_index = self.get_motif_index(seq)
 
         if get_3p:
             fwd_ss_juncs = self.F_5p_3p_ss
@@ -330,12 +641,18 @@ class SpliceGraph(object):
             fwd_ss_juncs = self.F_3p_5p_ss
             rev_ss_juncs = self.R_3p_5p_ss
 
+        if get_3p:
+            exon_paths = {"A":[0,1], "B":[0,2]}
+        else:
+            exon_paths = {"A":[0,2], "B":[1,2]}
+
         for strand_d, ss_juncs in { "FWD" : fwd_ss_juncs, "REV" : rev_ss_juncs }.iteritems():
             """
             whether we are looking for alt 5' or 3' ss, one will be held constant while 
             we scan around the other, call the one which we hold constant to be "fixed"
             and the other to be called alt
             """
+            events, sources, gene_names, gene_IDs = [], [], [], []
             for fixed_ss_3_or_5, alt_annot_ss_5_or_3_list in ss_juncs.iteritems():
                 
                 discovered_alt_transcript_hashes = {}
@@ -353,6 +670,8 @@ class SpliceGraph(object):
                     us_exon = self.get_common_shortest_exon(curr_5p, strand_d, ss_type_5p=True)
                 
                     gene_inf = self.get_gene_info(strand_d, curr_3p,curr_5p)
+                    gene_name = ",".join(["%s"%gi['gene_name'] for gi in gene_inf])
+                    gene_ID = "_".join(["%s"%gi['gene_ID'] for gi in gene_inf])
 
                     if get_3p:
                         ss_seq = strand_d == "FWD" and "AG" or "CT"
@@ -378,10 +697,7 @@ class SpliceGraph(object):
                         else:
                             seq_s, seq_e = max(min_alt, ds_exon[0]), min(max_alt, us_exon[0]-2)
                             delta=0
-                    """
-                    THIS IS RUNNING MULTIPLE TIMES MORE THANT IT SHOULD REALLY... 
-                    """
-                    alt_ss_list = np.array([m.start()+seq_s+delta for m in re.finditer(ss_seq, seq[seq_s:seq_e].upper())])
+                    alt_ss_list = motif_index.get(ss_seq, seq_s, seq_e)+delta
 
                     for alt_ss in alt_ss_list:
                         if alt_ss == alt_annot_5_or_3: 
@@ -392,11 +708,6 @@ class SpliceGraph(object):
                         else:
                             source = "novel"
                         
-                        if get_3p:
-                            exon_paths = {"A":[0,1], "B":[0,2]}
-                        else:
-                            exon_paths = {"A":[0,2], "B":[1,2]}
-
                         if strand_d=="FWD" and get_3p:
                             alt_exon=[alt_ss, ds_exon[1]]
                         elif strand_d=="REV" and get_3p:
@@ -410,35 +721,29 @@ class SpliceGraph(object):
                         if alt_exon[1]==alt_exon[0]: continue
 
                         EXONS  = [us_exon, alt_exon, ds_exon]
-                        FEATURE_ID = "%s_%s"%(source, "_".join(["%s:%d-%d"%(self.contig, e[0], e[1]) for e in EXONS]))
-                        GENE_NAME = "%s_%s"%(source, ",".join(["%s"%gi['gene_name'] for gi in gene_inf]))
-                        GENE_ID = "%s_%s"%(source,"_".join(["%s"%gi['gene_ID'] for gi in gene_inf]))
-                        G_START = min(us_exon[0], ds_exon[0])
-                        G_END = max(us_exon[1], ds_exon[1])
-                        STRAND = strand_d == "FWD" and 1 or -1
-                        
-                        alt_T = Transcript(contig = self.contig, 
-                                           feature_ID = FEATURE_ID,
-                                           exons = EXONS, 
-                                           gene_name = GENE_NAME,
-                                           gene_ID = GENE_ID,
-                                           g_start = G_START,
-                                           g_end = G_END,
-                                           strand = STRAND)
-
-                        T_hash = alt_T.get_tuple_hash()
+                        T_hash = tuple(sorted([p for e in EXONS for p in e]))
                         if not T_hash in discovered_alt_transcript_hashes:
                             discovered_alt_transcript_hashes[T_hash] = 1
-
-                            gff_s = alt_T.gff_string(exon_paths, source)
-                            gff_novel_s = alt_T.gff_string({"A":[0,1]}, source)
-                            bed_s = alt_T.bed_string(exon_paths, source, True)
-                            junc_tups = alt_T.junc_tuples(exon_paths, source, True)
-                            
-                            F_gff.write(gff_s)
-                            F_novel_gff.write(gff_novel_s)
-                            F_bed.write(bed_s)
-                            junc_writer.write(junc_tups)
+                            events.append(EXONS)
+                            sources.append(source)
+                            gene_names.append(gene_name)
+                            gene_IDs.append(gene_ID)
+            
+            if len(events) == 0:
+                continue
+            exons = np.array(events, dtype='int64')
+            sources = tw.get_column(sources, len(events))
+            FEATURE_IDS = sources+"_"
+            for i in xrange(exons.shape[1]):
+                FEATURE_IDS = FEATURE_IDS+("%s%s:"%(i and "_" or "", self.contig))+tw.str_column(exons[:,i,0])+"-"+tw.str_column(exons[:,i,1])
+            GENE_NAMES = sources+"_"+tw.get_column(gene_names, len(events))
+            GENE_IDS = sources+"_"+tw.get_column(gene_IDs, len(events))
+            STRAND = strand_d == "FWD" and 1 or -1
+            
+            gff_writer.write_events(self.contig, STRAND, exons, exon_paths, FEATURE_IDS.values, GENE_NAMES.values, GENE_IDS.values, sources.values)
+            novel_gff_writer.write_events(self.contig, STRAND, exons, {"A":[0,1]}, FEATURE_IDS.values, GENE_NAMES.values, GENE_IDS.values, sources.values)
+            bed_writer.write_events(self.contig, STRAND, exons, exon_paths, FEATURE_IDS.values, GENE_NAMES.values, GENE_IDS.values, sources.values, UCSC=True)
+            junc_writer.write(tw.get_junc_tuples(self.contig, STRAND, exons, exon_paths, UCSC=True))
 
     def enumerate_splice_junctions(self, seq):
         fwd_5p = defaultdict(int)
@@ -467,131 +772,128 @@ class SpliceGraph(object):
         print rev_3p, np.sum(rev_3p.values())
 
 
+def get_cache_dir(fn_gff):
+    return "%s.sg_cache"%fn_gff
+
+def get_cache_key(fn_gff):
+    """
+    the name of fn_gff's directory in the cache, its md5 and the
+    gff_reader version, so neither a changed annotation nor a changed
+    parser is read from a stale cache
+    """
+    return "%s.v%d"%(gr.get_checksum(fn_gff), gr.PARSER_VERSION)
+
+def update_transcript_table_cache(fn_gff, contigs=None, cache_dir=None, cache_key=None):
+    """
+    parse whatever of fn_gff is not cached yet into one table per contig
+    under cache_dir/<cache_key>/ (see get_cache_key). contigs.txt lists the
+    contigs once the whole annotation has been read. Returns the key
+    directory and the contigs, or None when the cache can't be created
+    """
+    cache_dir = cache_dir or get_cache_dir(fn_gff)
+    key_dir = "%s/%s"%(cache_dir, cache_key or get_cache_key(fn_gff))
+    try:
+        if not os.path.exists(key_dir):
+            os.makedirs(key_dir)
+    except OSError:
+        if not os.path.exists(key_dir):
+            stderr.write("can't create splice graph cache %s, not caching\n"%key_dir)
+            return None
+
+    fn_contigs = "%s/contigs.txt"%key_dir
+    get_fn_cache = lambda contig: "%s/%s.h5"%(key_dir, contig)
+
+    if contigs:
+        missing = [contig for contig in contigs if not os.path.exists(get_fn_cache(contig))]
+    elif os.path.exists(fn_contigs):
+        contigs = [l.rstrip() for l in open(fn_contigs)]
+        missing = [contig for contig in contigs if not os.path.exists(get_fn_cache(contig))]
+    else:
+        missing = None
+    full_parse = missing is None
+
+    if full_parse or len(missing)>0:
+        stderr.write("parsing %s into the splice graph cache %s...\n"%(fn_gff, key_dir))
+        t_tables = get_transcript_tables(fn_gff, missing)
+        if full_parse:
+            contigs = sorted(t_tables.keys())
+            missing = contigs
+        for contig in missing:
+            """
+            contigs with no transcripts are cached as empty tables so they
+            are not looked for again, written to a tmp file and renamed so
+            a concurrent reader never sees half a table
+            """
+            t_table = t_tables.get(contig, gr.TranscriptTable.init_from_rows(contig, []))
+            fn_tmp = "%s.%d.tmp"%(get_fn_cache(contig), os.getpid())
+            t_table.write(fn_tmp)
+            os.rename(fn_tmp, get_fn_cache(contig))
+        if full_parse:
+            fn_tmp = "%s.%d.tmp"%(fn_contigs, os.getpid())
+            F = open(fn_tmp, 'w')
+            F.write("".join(["%s\n"%contig for contig in contigs]))
+            F.close()
+            os.rename(fn_tmp, fn_contigs)
+    return key_dir, contigs
+
+def cache_transcript_tables(fn_gff, contigs=None, cache_dir=None):
+    """
+    fill the cache for contigs once, before starting contig sharded
+    workers, so the workers only read it rather than each hashing and
+    parsing the whole annotation at once. Returns the cache_key to hand
+    the workers, None if there is no cache
+    """
+    cache_key = get_cache_key(fn_gff)
+    if update_transcript_table_cache(fn_gff, contigs, cache_dir, cache_key) is None:
+        return None
+    return cache_key
+
+def get_transcript_tables(fn_gff, contigs=None, cache_dir=None, cache_key=None):
+    """
+    TranscriptTables by contig, read from the cache when the annotation
+    has been seen before (see update_transcript_table_cache). cache_key
+    skips hashing fn_gff when it is already known
+    """
+    if cache_dir is None:
+        t_tables = {}
+        for t_table in gr.iter_transcript_tables(fn_gff, contigs):
+            t_tables.setdefault(t_table.contig, []).append(t_table)
+        return dict([[contig, gr.TranscriptTable.concat(ts)] for contig, ts in t_tables.iteritems()])
+
+    cached = update_transcript_table_cache(fn_gff, contigs, cache_dir, cache_key)
+    if cached is None:
+        return get_transcript_tables(fn_gff, contigs)
+    key_dir, contigs = cached
+    
+    t_tables = {}
+    for contig in contigs:
+        t_table = gr.TranscriptTable.init_from_h5("%s/%s.h5"%(key_dir, contig))
+        if len(t_table):
+            t_tables[contig] = t_table
+    return t_tables
+
 def init_splice_graphs_from_gff3(fn_gff, **kwargs):
     """
-    limit_info={"gff_id": ["13"]}
+    SpliceGraphs by contig from a GFF3 or GTF, the transcripts are cached
+    in fn_gff.sg_cache (or cache_dir), pass cache_dir=None to skip the
+    cache. cache_key is what cache_transcript_tables returned, if it was
+    run first
     """
     contigs = kwargs.get('contigs', [])
     features = kwargs.get('features', ["transcript", "mRNA", "protein_coding"])
     min_exons = kwargs.get('min_exons', 1) 
+    cache_dir = kwargs.get('cache_dir', get_cache_dir(fn_gff))
+    cache_key = kwargs.get('cache_key', None)
 
-    limit_info = {"gff_id": contigs}
-    GFF_parser = GFF.GFFParser()
+    t_tables = get_transcript_tables(fn_gff, contigs, cache_dir, cache_key)
     
     SGs_by_contig = {}
-    for rec in GFF_parser.parse_in_parts(open(fn_gff), limit_info=limit_info):
-        #iterate over chromosomes
-        contig = rec.id
-        print >>stderr, "parsing records for record id:%s..."%rec.id
-        #contig_seq = fa.get_sequence(rec.id)
-                   
-        F_3p_5p_ss = {} 
-        F_5p_3p_ss = {}  
-        R_3p_5p_ss = {} 
-        R_5p_3p_ss = {} 
-
-        F_exon_s_e = {} 
-        F_exon_e_s = {} 
-        R_exon_s_e = {} 
-        R_exon_e_s = {} 
-        
-        F_le_s_e = {}
-        F_le_e_s = {}
-        R_le_s_e = {}
-        R_le_e_s = {}
-        
-        F_fe_s_e = {}
-        F_fe_e_s = {}
-        R_fe_s_e = {}
-        R_fe_e_s = {}
-
-        F_LR_intron_interval_tree = IntervalTree()
-        R_LR_intron_interval_tree = IntervalTree()
-        F_added_LR_intron_intervals = {}
-        R_added_LR_intron_intervals = {}
-
-        F_5p_to_gene_info = {}
-        F_3p_to_gene_info = {}
-        R_5p_to_gene_info = {}
-        R_3p_to_gene_info = {}
-
-        F_exon_G = nx.Graph()
-        R_exon_G = nx.Graph()
-        ss_G = nx.DiGraph() 
-
-        all_uniq_exons = {}
-        print("n-features:", len(rec.features))
-        n_kept = 0
-        for feature in rec.features:
-            if feature.type in features:
-                if len(feature.sub_features)<min_exons:
-                    continue
-                n_kept +=1
-                sys.stdout.flush()
-                t = Transcript.init_from_feature(contig, feature)
-                #alt_ss = t.get_all_3pSS(contig_seq)
-
-                if t.strand == 1:
-                    t.get_splice_junctions(F_3p_5p_ss, 
-                                           F_5p_3p_ss, 
-                                           F_exon_s_e, 
-                                           F_exon_e_s, 
-                                           F_5p_to_gene_info, 
-                                           F_3p_to_gene_info,
-                                           F_le_s_e,
-                                           F_le_e_s,
-                                           F_fe_s_e,
-                                           F_fe_e_s,
-                                           all_uniq_exons,
-                                           F_LR_intron_interval_tree,
-                                           F_added_LR_intron_intervals,
-                                           F_exon_G,
-                                           ss_G)
-                else:
-                    t.get_splice_junctions(R_3p_5p_ss, 
-                                           R_5p_3p_ss, 
-                                           R_exon_s_e, 
-                                           R_exon_e_s, 
-                                           R_5p_to_gene_info, 
-                                           R_3p_to_gene_info,
-                                           R_le_s_e,
-                                           R_le_e_s,
-                                           R_fe_s_e,
-                                           R_fe_e_s,
-                                           all_uniq_exons,
-                                           R_LR_intron_interval_tree,
-                                           R_added_LR_intron_intervals,
-                                           R_exon_G,
-                                           ss_G)
-        
-        print("n-features kept:", n_kept)
-        
-        SGs_by_contig[contig] = SpliceGraph(contig, F_3p_5p_ss = F_3p_5p_ss, 
-                                                    F_5p_3p_ss = F_5p_3p_ss, 
-                                                    R_3p_5p_ss = R_3p_5p_ss, 
-                                                    R_5p_3p_ss = R_5p_3p_ss, 
-                                                    F_exon_s_e = F_exon_s_e,
-                                                    F_exon_e_s = F_exon_e_s,
-                                                    R_exon_s_e = R_exon_s_e,
-                                                    R_exon_e_s = R_exon_e_s,
-                                                    F_5p_to_gene_info = F_5p_to_gene_info,
-                                                    F_3p_to_gene_info = F_3p_to_gene_info,
-                                                    R_5p_to_gene_info = R_5p_to_gene_info,
-                                                    R_3p_to_gene_info = R_3p_to_gene_info,
-                                                    F_le_s_e = F_le_s_e,
-                                                    F_le_e_s = F_le_e_s,
-                                                    R_le_s_e = R_le_s_e,
-                                                    R_le_e_s = R_le_e_s,
-                                                    F_fe_s_e = F_fe_s_e,
-                                                    F_fe_e_s = F_fe_e_s,
-                                                    R_fe_s_e = R_fe_s_e,
-                                                    R_fe_e_s = R_fe_e_s,
-                                                    all_uniq_exons = all_uniq_exons,
-                                                    F_LR_intron_interval_tree=F_LR_intron_interval_tree,
-                                                    R_LR_intron_interval_tree=R_LR_intron_interval_tree,
-                                                    F_exon_G = F_exon_G,
-                                                    R_exon_G = R_exon_G,
-                                                    ss_G = ss_G)
+    for contig, t_table in t_tables.iteritems():
+        print >>stderr, "parsing records for record id:%s..."%contig
+        print("n-features:", len(t_table))
+        t_table = t_table.filter(features, min_exons)
+        print("n-features kept:", len(t_table))
+        SGs_by_contig[contig] = SpliceGraph.init_from_transcripts(t_table)
     return SGs_by_contig
     
 #for rec in GFF_parser.parse_in_parts(open(o.fn_gff), limit_info=limit_info):
@@ -1,5 +1,4 @@
 import pdb
-from bx.intervals.intersection import Interval, IntervalTree
 
 class Transcript:
 
@@ -172,155 +171,6 @@ class Transcript:
                 alts = np.array([m.start() for m in re.finditer("CT",seq[e1_e:e2_s])])
             return alts 
     
-    def get_splice_junctions(self, _3p_to_5p, 
-                                   _5p_to_3p, 
-                                   _exon_s_to_e, 
-                                   _exon_e_to_s, 
-                                   _5p_to_gene_info, 
-                                   _3p_to_gene_info, 
-                                   _le_s_e,
-                                   _le_e_s,
-                                   _fe_s_e,
-                                   _fe_e_s,
-                                   all_uniq_exons,
-                                   LR_intron_interval_tree,
-                                   added_LR_intron_intervals,
-                                   exon_G, 
-                                   ss_G):
-
-        """
-        side effect - modifies passed in dicts
-        5p_to_3p and 3p_to_5p are strand specific defaultdicts
-        all exons "starts" are strictly < exon "ends"
-        not even for exons all the 5'/3' desigations are intron ss based
-                          ___
-         ---->         5'/   \ 3' 
-         |         -----/     \-----
-                   ___
-                3'/   \ 5'      <----
-            -----/     \-----        |
-        """
-       
-
-        """
-        exon order is dependent on strand
-        """
-        if self.strand == 1:
-            fe_s, fe_e = self.exons[0] 
-            le_s, le_e = self.exons[-1] 
-        else:
-            fe_s, fe_e = self.exons[-1] 
-            le_s, le_e = self.exons[0] 
-
-        _fe_s_e[fe_s] = fe_e
-        _fe_e_s[fe_e] = fe_s
-        _le_s_e[le_s] = le_e
-        _le_e_s[le_e] = le_s
-        
-        gene_inf = self.get_gene_info()
-        
-        for i in xrange(len(self.exons)-1):
-
-            e1_s, e1_e = self.exons[i]
-            e2_s, e2_e = self.exons[i+1]
-            """
-            assertions here - all exons processed from left to right
-            ie e1 < e2 and ei < ei+1
-            """
-            assert e1_s < e1_e and e2_s < e2_e
-            assert e1_e < e2_s #previously whack due to CDS
-            
-            #add the exons
-            e1_tup, e2_tup = tuple([e1_s, e1_e]), tuple([e2_s, e2_e])
-            if not e1_s in _exon_s_to_e: _exon_s_to_e[e1_s] = []
-            if not e1_e in _exon_e_to_s: _exon_e_to_s[e1_e] = []
-            if not e1_tup in all_uniq_exons: all_uniq_exons[e1_tup] = 1
-            if not e2_tup in all_uniq_exons: all_uniq_exons[e2_tup] = 1
-            
-            if not e1_e in _exon_s_to_e[e1_s]:
-                _exon_s_to_e[e1_s].append(e1_e)
-            if not e1_s in _exon_e_to_s[e1_e]:
-                _exon_e_to_s[e1_e].append(e1_s)
-            
-            if not tuple([e1_e, e2_s]) in added_LR_intron_intervals:
-                added_LR_intron_intervals[tuple([e1_e, e2_s])] = 1
-                LR_intron_interval_tree.insert_interval(Interval(e1_e, e2_s))
-            
-            #add exons to exon graph
-            exon_G.add_edge(e1_tup, e2_tup)
-
-            #add the introns
-            if self.strand == 1:
-                #FWD
-                if not e1_e in _5p_to_3p: _5p_to_3p[e1_e] = []
-                if not e2_s in _3p_to_5p: _3p_to_5p[e2_s] = []
-                if not e1_e in _5p_to_gene_info: _5p_to_gene_info[e1_e] = []
-                if not e2_s in _3p_to_gene_info: _3p_to_gene_info[e2_s] = []
-                    
-                if not e2_s in _5p_to_3p[e1_e]:
-                    _5p_to_3p[e1_e].append(e2_s)
-                    _3p_to_5p[e2_s].append(e1_e)
-                
-                if not gene_inf in _5p_to_gene_info[e1_e]: _5p_to_gene_info[e1_e].append(gene_inf)
-                if not gene_inf in _3p_to_gene_info[e2_s]: _3p_to_gene_info[e2_s].append(gene_inf)
-                
-                ss_G.add_node(e1_s, type=3)
-                ss_G.add_node(e1_e, type=5)
-                ss_G.add_node(e2_s, type=3)
-                ss_G.add_node(e2_e, type=5)
-                ss_G.add_edge(e1_e , e2_s, type='intron')
-                ss_G.add_edge(e2_s , e2_e, type='exon')
-                ss_G.add_edge(e1_s , e1_e, type='exon')
-
-            else:
-                #REV
-                if not e2_s in _5p_to_3p: _5p_to_3p[e2_s] = []
-                if not e1_e in _3p_to_5p: _3p_to_5p[e1_e] = []
-                if not e2_s in _5p_to_gene_info: _5p_to_gene_info[e2_s] = []
-                if not e1_e in _3p_to_gene_info: _3p_to_gene_info[e1_e] = []
-
-                if not e1_e in _5p_to_3p[e2_s]:
-                    _5p_to_3p[e2_s].append(e1_e)
-                    _3p_to_5p[e1_e].append(e2_s)
-                
-                if not gene_inf in _5p_to_gene_info[e2_s]: _5p_to_gene_info[e2_s].append(gene_inf)
-                if not gene_inf in _3p_to_gene_info[e1_e]: _3p_to_gene_info[e1_e].append(gene_inf)
-                
-                ss_G.add_node(e2_e, type=3)
-                ss_G.add_node(e2_s, type=5)
-                ss_G.add_node(e1_e, type=3)
-                ss_G.add_node(e1_s, type=5) #note, last one will be not actually a 5'...
-                ss_G.add_edge(e2_s , e1_e, type='intron')
-                ss_G.add_edge(e1_e , e1_s, type='exon')
-                ss_G.add_edge(e2_e , e2_s, type='exon')
-                
-        """
-        add the last exon
-        """
-        e1_s, e1_e = self.exons[-1]
-        #add the exons
-        if not e1_s in _exon_s_to_e: _exon_s_to_e[e1_s] = []
-        if not e1_e in _exon_e_to_s: _exon_e_to_s[e1_e] = []
-        
-        e1_tup = tuple([e1_s, e1_e])
-        if not e1_tup in all_uniq_exons: all_uniq_exons[e1_tup] = 1
-        
-        if not e1_e in _exon_s_to_e[e1_s]:
-            _exon_s_to_e[e1_s].append(e1_e)
-        if not e1_s in _exon_e_to_s[e1_e]:
-            _exon_e_to_s[e1_e].append(e1_s)
-        
-        """
-        add gene info to the END of the last exon, 
-        even though not techinically a 5'
-        """
-        if self.strand == 1:
-            if not e1_e in _5p_to_gene_info: _5p_to_gene_info[e1_e] = []
-            if not gene_inf in _5p_to_gene_info[e1_e]: _5p_to_gene_info[e1_e].append(gene_inf)
-        else: 
-            if not e1_s in _5p_to_gene_info: _5p_to_gene_info[e1_s] = []
-            if not gene_inf in _5p_to_gene_info[e1_s]: _5p_to_gene_info[e1_s].append(gene_inf)
-        
     @classmethod
     def init_from_feature(cls, contig, feature):
         """
@@ -0,0 +1,221 @@
+"""
+batch GFF3/BED12 output of events
+
+events are passed as arrays, exons is n_events x n_exons x 2 (s<e, in the
+order exon_paths indexes them) and exon_paths is the {isoform: exon idxs}
+dict Transcript.gff_string/bed_string take. Lines are built one column at
+a time over all events rather than one event at a time and come out
+exactly as Transcript formats them, event by event with the isoforms in
+exon_paths order.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+import pysam
+
+ANNOT_RGB = "000,204,102"
+NOVEL_RGB = "64,64,64"
+
+HEADER_PREFIXES = ("#", "track", "browser")
+
+def get_column(x, n):
+    """
+    a scalar or a per event sequence as a length n object Series
+    """
+    if np.isscalar(x):
+        return pd.Series([x]*n, dtype=object)
+    return pd.Series(np.asarray(x, dtype=object))
+
+def str_column(a):
+    return pd.Series(np.asarray(a).astype(str), dtype=object)
+
+def join_lines(slots):
+    """
+    slots are lists of n line Series, the lines are output event by event
+    and, within an event, in slot order
+    """
+    lines = np.column_stack([s.values for s in slots])
+    return "".join(["%s\n"%l for l in lines.ravel()])
+
+def get_strand(strand):
+    return strand == 1 and "+" or "-"
+
+def format_contig(contig, UCSC):
+    if UCSC and "chr" not in contig:
+        return "chr%s"%contig
+    return contig
+
+def get_path_bounds(exons, e_path):
+    t_starts = np.minimum(exons[:,e_path[0],0], exons[:,e_path[-1],0])
+    t_ends = np.maximum(exons[:,e_path[0],1], exons[:,e_path[-1],1])
+    return t_starts, t_ends
+
+def get_gff_lines(contig, strand, exons, exon_paths, feature_IDs, gene_names, gene_IDs, sources, g_starts=None, g_ends=None):
+    """
+    gene / mRNA / exon ... lines of every event, 1 based closed. g_starts
+    and g_ends default to the span of the event's exons
+    """
+    exons = np.asarray(exons)
+    n = exons.shape[0]
+    if n == 0:
+        return ""
+    if g_starts is None:
+        g_starts = exons[:,:,0].min(axis=1)
+    if g_ends is None:
+        g_ends = exons[:,:,1].max(axis=1)
+
+    feature_IDs = get_column(feature_IDs, n).astype(str)
+    prefix = ("%s\t"%contig)+get_column(sources, n).astype(str)+"\t"
+    suffix = "\t.\t%s\t.\tID="%get_strand(strand)
+
+    gene_line = (prefix+"gene\t"+str_column(np.asarray(g_starts)+1)+"\t"+str_column(g_ends)+suffix+
+                 feature_IDs+";Name="+get_column(gene_names, n).astype(str)+
+                 ";gene_ID="+get_column(gene_IDs, n).astype(str))
+    slots = [gene_line]
+    for curr_ID, e_path in exon_paths.iteritems():
+        mRNA_IDs = feature_IDs+"_%s"%curr_ID
+        t_starts, t_ends = get_path_bounds(exons, e_path)
+        slots.append(prefix+"mRNA\t"+str_column(t_starts+1)+"\t"+str_column(t_ends)+suffix+
+                     mRNA_IDs+";Parent="+feature_IDs)
+        for exon_i in e_path:
+            slots.append(prefix+"exon\t"+str_column(exons[:,exon_i,0]+1)+"\t"+str_column(exons[:,exon_i,1])+suffix+
+                         mRNA_IDs+"_%d;Parent="%exon_i+mRNA_IDs)
+    return join_lines(slots)
+
+def get_bed_lines(contig, strand, exons, exon_paths, feature_IDs, sources, UCSC=False, annot_RGB=ANNOT_RGB, novel_RGB=NOVEL_RGB):
+    """
+    one BED12 line per event and isoform
+    """
+    exons = np.asarray(exons)
+    n = exons.shape[0]
+    if n == 0:
+        return ""
+
+    feature_IDs = get_column(feature_IDs, n).astype(str)
+    RGBs = get_column(sources, n).apply(lambda s: s == "annotated" and annot_RGB or novel_RGB)
+    s_strand = get_strand(strand)
+    contig = format_contig(contig, UCSC)
+
+    slots = []
+    for curr_ID, e_path in exon_paths.iteritems():
+        t_starts, t_ends = get_path_bounds(exons, e_path)
+        curr_exons = exons[:,e_path]
+        if s_strand == "-":
+            curr_exons = curr_exons[:,::-1]
+        min_ps = curr_exons.min(axis=2).min(axis=1)
+        sizes = str_column(curr_exons[:,0,1]-curr_exons[:,0,0])
+        starts = str_column(curr_exons[:,0,0]-min_ps)
+        for i in xrange(1, curr_exons.shape[1]):
+            sizes = sizes+","+str_column(curr_exons[:,i,1]-curr_exons[:,i,0])
+            starts = starts+","+str_column(curr_exons[:,i,0]-min_ps)
+        s_starts, s_ends = str_column(t_starts), str_column(t_ends)
+        slots.append(("%s\t"%contig)+s_starts+"\t"+s_ends+"\t"+feature_IDs+(",%s\t0\t%s\t"%(curr_ID, s_strand))+
+                     s_starts+"\t"+s_ends+"\t"+RGBs+("\t%d\t"%len(e_path))+sizes+"\t"+starts)
+    return join_lines(slots)
+
+def get_junc_tuples(contig, strand, exons, exon_paths, UCSC=False):
+    """
+    (contig, left, right, strand) of every junction of every isoform, as
+    Transcript.junc_tuples
+    """
+    exons = np.asarray(exons)
+    s_strand = get_strand(strand)
+    contig = format_contig(contig, UCSC)
+
+    lefts, rights = [], []
+    for curr_ID, e_path in exon_paths.iteritems():
+        curr_exons = exons[:,e_path]
+        if s_strand == "-":
+            curr_exons = curr_exons[:,::-1]
+        lefts.append(curr_exons[:,:-1,1].ravel()-1)
+        rights.append(curr_exons[:,1:,0].ravel())
+    if len(lefts) == 0:
+        return []
+    return [tuple([contig, l, r, s_strand]) for l, r in zip(np.concatenate(lefts).tolist(),
+                                                           np.concatenate(rights).tolist())]
+
+def index_sorted(fn, fmt):
+    """
+    sort fn by start within each contig, then bgzip and tabix index it,
+    returns the name of the .gz. Header lines are kept at the top and
+    contigs in the order they appear, so each contig's lines must be
+    contiguous, as they are when events are written contig by contig
+    """
+    fn_tmp = "%s.%d.tmp"%(fn, os.getpid())
+    F_out = open(fn_tmp, 'w')
+    start_col = fmt == "gff" and 3 or 1
+
+    n_header = 0
+    curr_contig, block, seen = None, [], set()
+    def flush(block):
+        block.sort(key=lambda l: int(l.split("\t", start_col+1)[start_col]))
+        F_out.write("".join(block))
+
+    for l in open(fn):
+        if l.startswith(HEADER_PREFIXES):
+            assert curr_contig is None, "header line %s after the first record in %s"%(l.rstrip(), fn)
+            n_header += 1
+            F_out.write(l)
+            continue
+        contig = l.split("\t", 1)[0]
+        if contig != curr_contig:
+            assert not contig in seen, "%s is not contiguous in %s"%(contig, fn)
+            flush(block)
+            seen.add(contig)
+            curr_contig, block = contig, []
+        block.append(l)
+    flush(block)
+    F_out.close()
+    os.rename(fn_tmp, fn)
+
+    if fmt == "gff":
+        return pysam.tabix_index(fn, force=True, seq_col=0, start_col=3, end_col=4, line_skip=n_header)
+    return pysam.tabix_index(fn, force=True, seq_col=0, start_col=1, end_col=2, line_skip=n_header, zerobased=True)
+
+class TranscriptWriter(object):
+    """
+    GFF3 (fmt="gff") or BED12 (fmt="bed") output of batches of events.
+    Lines are buffered and written in blocks of max_buffer bytes, with
+    bgzip the file is sorted, bgzipped and tabix indexed at close
+    """
+    def __init__(self, fn, fmt="gff", header=None, bgzip=False, max_buffer=1<<24):
+
+        assert fmt in ["gff", "bed"], "fmt must be gff or bed"
+        self.fn = fn
+        self.fmt = fmt
+        self.bgzip = bgzip
+        self.max_buffer = max_buffer
+
+        self.F = open(fn, 'w')
+        self.buffer = []
+        self.buffer_size = 0
+        if header:
+            self.write(header)
+
+    def write(self, s):
+        self.buffer.append(s)
+        self.buffer_size += len(s)
+        if self.buffer_size>=self.max_buffer:
+            self.flush()
+
+    def flush(self):
+        self.F.write("".join(self.buffer))
+        self.buffer = []
+        self.buffer_size = 0
+
+    def write_events(self, contig, strand, exons, exon_paths, feature_IDs, gene_names, gene_IDs, sources, UCSC=False):
+        """
+        strand is 1 or -1 for the whole batch, feature_IDs, gene_names,
+        gene_IDs and sources are per event or one value for all
+        """
+        if self.fmt == "gff":
+            self.write(get_gff_lines(contig, strand, exons, exon_paths, feature_IDs, gene_names, gene_IDs, sources))
+        else:
+            self.write(get_bed_lines(contig, strand, exons, exon_paths, feature_IDs, sources, UCSC))
+
+    def close(self):
+        self.flush()
+        self.F.close()
+        if self.bgzip:
+            self.fn = index_sorted(self.fn, self.fmt)
@@ -0,0 +1,99 @@
+"""
+times intervaltools against the bx-python trees it replaces on random
+intervals of one contig: building, overlap queries, containment queries
+(as get_putative_juncs_from_exons) and clustering (as junction_entropy),
+and checks they agree. Without bx-python only intervaltools is timed
+"""
+
+import argparse
+import time
+import numpy as np
+import pandas as pd
+
+from intervaltools import IntervalTool, ClusterTool
+
+try:
+    from bx.intervals.intersection import Interval, IntervalTree
+    from bx.intervals.cluster import ClusterTree
+except ImportError:
+    IntervalTree = None
+
+def timed(name, f, *args):
+    t = time.time()
+    ret = f(*args)
+    print "{name}\t{t:.3f}s".format(name=name, t=time.time()-t)
+    return ret
+
+def get_random_intervals(n, contig_len, min_len, max_len):
+    starts = np.random.randint(0, contig_len, n)
+    return pd.DataFrame({"contig":"chr1",
+                         "start":starts,
+                         "end":starts+np.random.randint(min_len, max_len, n)})
+
+def bx_build(T):
+    tree = IntervalTree()
+    for i, s, e in zip(T.index.values.tolist(), T['start'].values.tolist(), T['end'].values.tolist()):
+        tree.insert_interval(Interval(s, e, i))
+    return tree
+
+def bx_find(tree, Q):
+    return sum([len(tree.find(s, e)) for s, e in zip(Q['start'].values.tolist(), Q['end'].values.tolist())])
+
+def bx_find_containing(tree, Q):
+    n = 0
+    for s, e in zip(Q['start'].values.tolist(), Q['end'].values.tolist()):
+        n += len([iv for iv in tree.find(s, e) if iv.start < s and iv.end > e])
+    return n
+
+def bx_cluster(T, max_dist, min_intervals):
+    tree = ClusterTree(max_dist, min_intervals)
+    for i, s, e in zip(T.index.values.tolist(), T['start'].values.tolist(), T['end'].values.tolist()):
+        tree.insert(s, e, i)
+    return len(tree.getregions())
+
+def np_build(T):
+    tool = IntervalTool()
+    tool.insert_table(T)
+    tool.get_interval_set("chr1")
+    return tool
+
+def np_find(tool, Q):
+    return tool.find_all("chr1", Q['start'].values, Q['end'].values)[0].shape[0]
+
+def np_find_containing(tool, Q):
+    return tool.find_containing("chr1", Q['start'].values, Q['end'].values)[0].shape[0]
+
+def np_cluster(T, max_dist, min_intervals):
+    tool = ClusterTool(max_dist, min_intervals)
+    tool.insert_table(T)
+    return tool.get_clusters("chr1")[0].shape[0]
+
+if __name__=="__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n_intervals", default=1000000, type=int)
+    parser.add_argument("--n_queries", default=1000000, type=int)
+    parser.add_argument("--contig_len", default=250000000, type=int)
+    parser.add_argument("--min_len", default=60, type=int, help="interval (eg. intron) lengths")
+    parser.add_argument("--max_len", default=20000, type=int)
+    parser.add_argument("--max_query_len", default=300, type=int, help="query (eg. exon) lengths")
+    parser.add_argument("--seed", default=0, type=int)
+    o = parser.parse_args()
+
+    np.random.seed(o.seed)
+    T = get_random_intervals(o.n_intervals, o.contig_len, o.min_len, o.max_len)
+    Q = get_random_intervals(o.n_queries, o.contig_len, 1, o.max_query_len)
+
+    tool = timed("intervaltools build", np_build, T)
+    n_overlaps = timed("intervaltools overlaps", np_find, tool, Q)
+    n_contained = timed("intervaltools containing", np_find_containing, tool, Q)
+    n_clusters = timed("intervaltools clusters", np_cluster, T, 0, 2)
+    print "{o} overlaps, {c} containing, {n} clusters".format(o=n_overlaps, c=n_contained, n=n_clusters)
+
+    if IntervalTree is None:
+        print "no bx-python, not timing the bx trees"
+    else:
+        tree = timed("bx build", bx_build, T)
+        assert timed("bx overlaps", bx_find, tree, Q) == n_overlaps
+        assert timed("bx containing", bx_find_containing, tree, Q) == n_contained
+        assert timed("bx clusters", bx_cluster, T, 0, 2) == n_clusters
@@ -1,51 +1,304 @@
-from bx.intervals.intersection import Interval, IntervalTree
-from bx.intervals.cluster import ClusterTree
+"""
+interval sets as per contig sorted NumPy arrays
 
-class ClusterTool(object):
+intervals are half open [s, e) as in bx-python. They are inserted one at
+a time or in bulk from a DataFrame and sorted into an IntervalSet per
+contig on the first query after an insert. Queries take arrays of query
+intervals and return (query, interval) index pairs rather than walking a
+tree node by node from Python.
+"""
+
+import collections
+import numpy as np
+
+Interval = collections.namedtuple("Interval", ["start", "end", "value"])
+
+def prefix_join(c_starts, c_ends, bounds, mins):
+    """
+    all index pairs (i, j) with c_starts[j] < bounds[i] and c_ends[j] >
+    mins[i], c_starts sorted, in order of i then j
+
+    the c intervals are the leaves of an implicit binary tree holding the
+    max end under each node. Every (i, node) pair is kept while the node
+    starts left of bounds[i] and holds an end past mins[i], and split
+    into its children until the leaves, so the cost is
+    ~(pairs + len(bounds)) * log(len(c_starts))
+    """
+    bounds = np.asarray(bounds, dtype='int64')
+    mins = np.asarray(mins, dtype='int64')
+    n = c_starts.shape[0]
+    if n == 0 or bounds.shape[0] == 0:
+        return np.zeros(0, dtype='int64'), np.zeros(0, dtype='int64')
+
+    n_levels = int(np.ceil(np.log2(n)))
+    max_ends = [np.r_[c_ends, np.repeat(np.iinfo('int64').min, (1<<n_levels)-n)]]
+    for lvl in xrange(n_levels):
+        max_ends.append(np.maximum(max_ends[-1][0::2], max_ends[-1][1::2]))
+
+    n_before = np.searchsorted(c_starts, bounds, side='left')
+    idxs = np.arange(bounds.shape[0])
+    nodes = np.zeros(bounds.shape[0], dtype='int64')
+    for lvl in xrange(n_levels, -1, -1):
+        keep = ((nodes<<lvl) < n_before[idxs]) & (max_ends[lvl][nodes] > mins[idxs])
+        idxs, nodes = idxs[keep], nodes[keep]
+        if lvl:
+            idxs = np.repeat(idxs, 2)
+            nodes = np.repeat(nodes*2, 2) + np.tile([0, 1], nodes.shape[0])
+    return idxs, nodes
+
+def overlap_join(starts, ends, c_starts, c_ends):
+    """
+    (i, j) with interval j overlapping interval i, c_starts sorted
+    """
+    return prefix_join(c_starts, c_ends, ends, starts)
+
+def containment_join(starts, ends, c_starts, c_ends):
+    """
+    (i, j) with interval j strictly containing interval i, c_starts sorted
+    """
+    return prefix_join(c_starts, c_ends, starts, ends)
+
+def get_clusters(starts, ends, max_dist=0):
+    """
+    cluster label of each interval and the start and end of each cluster,
+    starts sorted. An interval starting within max_dist of the furthest
+    end so far joins the cluster, as bx ClusterTree(max_dist, ...)
+    """
+    n = starts.shape[0]
+    if n == 0:
+        return np.zeros(0, dtype='int64'), np.zeros(0, dtype='int64'), np.zeros(0, dtype='int64')
+    max_ends = np.maximum.accumulate(ends)
+    new = np.r_[True, starts[1:]-max_dist > max_ends[:-1]]
+    labels = np.cumsum(new)-1
+    firsts = np.where(new)[0]
+    return labels, starts[firsts], np.maximum.reduceat(ends, firsts)
+
+class IntervalSet(object):
+    """
+    the intervals of one contig sorted by start then end, idxs[k] is the
+    index the k-th sorted interval was inserted with
+    """
+    def __init__(self, starts, ends, idxs=None):
+        starts = np.asarray(starts, dtype='int64')
+        ends = np.asarray(ends, dtype='int64')
+        if idxs is None:
+            idxs = np.arange(starts.shape[0])
+        order = np.lexsort((ends, starts))
+        self.starts = starts[order]
+        self.ends = ends[order]
+        self.idxs = np.asarray(idxs, dtype='int64')[order]
+        self.max_ends = self.ends
+        if len(self):
+            self.max_ends = np.maximum.accumulate(self.ends)
+
+    def __len__(self):
+        return self.starts.shape[0]
+
+    def find(self, s, e):
+        """
+        the Intervals overlapping s, e sorted by start, their value is the
+        insert index (as bx IntervalTree.find)
+        """
+        ks = overlap_join([s], [e], self.starts, self.ends)[1]
+        return [Interval(*iv) for iv in zip(self.starts[ks].tolist(),
+                                            self.ends[ks].tolist(),
+                                            self.idxs[ks].tolist())]
+
+    def find_all(self, starts, ends):
+        """
+        (query, insert index) of every overlap
+        """
+        q_idxs, ks = overlap_join(starts, ends, self.starts, self.ends)
+        return q_idxs, self.idxs[ks]
+
+    def find_containing(self, starts, ends):
+        """
+        (query, insert index) of every interval strictly containing a query
+        """
+        q_idxs, ks = containment_join(starts, ends, self.starts, self.ends)
+        return q_idxs, self.idxs[ks]
+
+    def overlaps(self, starts, ends):
+        """
+        whether anything overlaps each query
+        """
+        n_before = np.searchsorted(self.starts, np.asarray(ends, dtype='int64'), side='left')
+        overlaps = np.zeros(n_before.shape[0], dtype=bool)
+        has = n_before > 0
+        overlaps[has] = self.max_ends[n_before[has]-1] > np.asarray(starts, dtype='int64')[has]
+        return overlaps
+
+    def nearest(self, positions):
+        """
+        insert index of the interval nearest each position and the
+        distance to it, 0 when a position is inside one, -1 and -1 when
+        the set is empty. Ties go to the interval on the left
+        """
+        positions = np.asarray(positions, dtype='int64')
+        n = len(self)
+        if n == 0:
+            return -np.ones(positions.shape[0], dtype='int64'), -np.ones(positions.shape[0], dtype='int64')
+
+        """
+        the interval furthest right of those starting at or before a
+        position and the first starting after it
+        """
+        arg_max_ends = np.maximum.accumulate(np.where(self.ends == self.max_ends, np.arange(n), 0))
+        n_before = np.searchsorted(self.starts, positions, side='right')
+        l_ks = arg_max_ends[np.maximum(n_before-1, 0)]
+        l_dists = np.where(n_before>0, np.maximum(positions-self.ends[l_ks]+1, 0), np.iinfo('int64').max)
+        r_ks = np.minimum(n_before, n-1)
+        r_dists = np.where(n_before<n, self.starts[r_ks]-positions, np.iinfo('int64').max)
+
+        is_left = l_dists <= r_dists
+        return np.where(is_left, self.idxs[l_ks], self.idxs[r_ks]), np.where(is_left, l_dists, r_dists)
+
+    def get_clusters(self, max_dist=0):
+        """
+        cluster label of each sorted interval, cluster starts and ends
+        """
+        return get_clusters(self.starts, self.ends, max_dist)
+
+class IntervalStore(object):
     """
-    get overlapping / non-overlapping clusters
+    intervals and their items by contig, scalar inserts are buffered in
+    lists and bulk inserts kept as arrays until the contig is queried
     """
     def __init__(self):
-        self.idx = 0
-        self.objects_by_idx = {}
-        self.cluster_trees_by_contig = {}
-
-    def get_next_idx(self):
-        self.idx+=1
-        return self.idx
-    
+        self.n = 0
+        self.item_chunks = []
+        self.pending_items = []
+        self.items = None
+        self.pending_by_contig = {}
+        self.chunks_by_contig = {}
+        self.sets_by_contig = {}
+
     def insert(self, contig, s, e, item=None):
-        idx = self.get_next_idx()
-        self.objects_by_idx[idx] = item
-        if not contig in self.cluster_trees_by_contig:
-            self.cluster_trees_by_contig[contig] = ClusterTree(0,0) 
-        
-        self.cluster_trees_by_contig[contig].insert(s,e,idx)
-                    
+        if not contig in self.pending_by_contig:
+            self.pending_by_contig[contig] = [[], [], []]
+        pending = self.pending_by_contig[contig]
+        pending[0].append(s)
+        pending[1].append(e)
+        pending[2].append(self.n)
+        self.pending_items.append(item)
+        self.n += 1
+        self.sets_by_contig.pop(contig, None)
+        self.items = None
+
+    def insert_table(self, T, contig_col="contig", start_col="start", end_col="end", item_col=None):
+        """
+        insert every row of T, a row's item is its item_col value or, by
+        default, its index
+        """
+        self.flush_items()
+        idxs = np.arange(self.n, self.n+T.shape[0])
+        if item_col is None:
+            self.item_chunks.append(np.asarray(T.index.values, dtype=object))
+        else:
+            self.item_chunks.append(np.asarray(T[item_col].values, dtype=object))
+        self.n += T.shape[0]
+        self.items = None
+
+        starts, ends = T[start_col].values, T[end_col].values
+        for contig, rows in T.groupby(contig_col).indices.iteritems():
+            self.chunks_by_contig.setdefault(contig, []).append([starts[rows], ends[rows], idxs[rows]])
+            self.sets_by_contig.pop(contig, None)
+
+    def flush_items(self):
+        if self.pending_items:
+            items = np.empty(len(self.pending_items), dtype=object)
+            items[:] = self.pending_items
+            self.item_chunks.append(items)
+            self.pending_items = []
+
+    def get_items(self, idxs):
+        if self.items is None:
+            self.flush_items()
+            if self.item_chunks:
+                self.items = np.concatenate(self.item_chunks)
+                self.item_chunks = [self.items]
+            else:
+                self.items = np.zeros(0, dtype=object)
+        return self.items[idxs]
+
+    @property
+    def contigs(self):
+        return sorted(set(self.pending_by_contig.keys()+self.chunks_by_contig.keys()))
+
+    def get_interval_set(self, contig):
+        if not contig in self.sets_by_contig:
+            if contig in self.pending_by_contig:
+                starts, ends, idxs = self.pending_by_contig.pop(contig)
+                self.chunks_by_contig.setdefault(contig, []).append([np.array(starts, dtype='int64'),
+                                                                     np.array(ends, dtype='int64'),
+                                                                     np.array(idxs, dtype='int64')])
+            chunks = self.chunks_by_contig.get(contig, [])
+            if len(chunks) == 0:
+                i_set = IntervalSet([], [])
+            else:
+                i_set = IntervalSet(*[np.concatenate([c[i] for c in chunks]) for i in xrange(3)])
+                self.chunks_by_contig[contig] = [[i_set.starts, i_set.ends, i_set.idxs]]
+            self.sets_by_contig[contig] = i_set
+        return self.sets_by_contig[contig]
+
+class ClusterTool(IntervalStore):
+    """
+    get overlapping / non-overlapping clusters, intervals within max_dist
+    of each other are clustered and clusters of fewer than min_intervals
+    dropped (bx ClusterTree(max_dist, min_intervals))
+    """
+    def __init__(self, max_dist=0, min_intervals=1):
+        super(ClusterTool, self).__init__()
+        self.max_dist = max_dist
+        self.min_intervals = min_intervals
+
+    def get_clusters(self, contig):
+        """
+        starts and ends of the clusters of contig, and the insert indices
+        of their intervals with the cluster of each, ordered by cluster
+        then insert index
+        """
+        i_set = self.get_interval_set(contig)
+        labels, c_starts, c_ends = i_set.get_clusters(self.max_dist)
+        counts = np.bincount(labels, minlength=c_starts.shape[0])
+        keep = counts >= self.min_intervals
+        new_labels = np.cumsum(keep)-1
+
+        in_kept = keep[labels]
+        labels, idxs = new_labels[labels[in_kept]], i_set.idxs[in_kept]
+        order = np.lexsort((idxs, labels))
+        return c_starts[keep], c_ends[keep], idxs[order], labels[order]
+
     def get_regions(self):
         ret = {}
-        for contig, tree in self.cluster_trees_by_contig.items():
-            ret_list = []
-            for cluster_tup in tree.getregions():
-                s,e, idxs = cluster_tup
-                ret_list.append((s,e,[self.objects_by_idx[idx] for idx in idxs]))
-
-            ret[contig] = ret_list
-        
+        for contig in self.contigs:
+            c_starts, c_ends, idxs, labels = self.get_clusters(contig)
+            items = self.get_items(idxs)
+            splits = np.searchsorted(labels, np.arange(1, c_starts.shape[0]))
+            ret[contig] = [(s, e, list(c_items)) for s, e, c_items in zip(c_starts.tolist(),
+                                                                           c_ends.tolist(),
+                                                                           np.split(items, splits))]
         return ret
 
-class IntervalTool(object):
+class IntervalTool(IntervalStore):
     """
     check if something overlaps a region quickly
     """
+    def find(self, contig, s, e):
+        """
+        the items of the intervals overlapping s, e, sorted by start
+        """
+        idxs = [iv.value for iv in self.get_interval_set(contig).find(s, e)]
+        return list(self.get_items(np.array(idxs, dtype='int64')))
 
-    def __init__(self):
-        self.intervals_by_contig = {}
+    def find_all(self, contig, starts, ends):
+        return self.get_interval_set(contig).find_all(starts, ends)
 
-    def insert(self, contig, s, e, item=None):
+    def find_containing(self, contig, starts, ends):
+        return self.get_interval_set(contig).find_containing(starts, ends)
+
+    def overlaps(self, contig, starts, ends):
+        return self.get_interval_set(contig).overlaps(starts, ends)
 
-        if not contig in self.intervals_by_contig:
-            self.intervals_by_contig[contig] = IntervalTree()
-        
-        self.intervals_by_contig[contig].insert_interval(Interval(s,e, item))
-    
+    def nearest(self, contig, positions):
+        return self.get_interval_set(contig).nearest(positions)